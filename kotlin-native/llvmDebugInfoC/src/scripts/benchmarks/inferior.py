@@ -0,0 +1,505 @@
+##
+# Copyright 2010-2021 JetBrains s.r.o.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Simulated Kotlin/Native process: objects, arrays, strings and TypeInfo/ExtendedTypeInfo structures are laid out in
+byte arrays the same way the runtime does it (see runtime/src/main/cpp/TypeInfo.h and Memory.h), and Konan_Debug*
+entry points are implemented on top of that memory, so konan_lldb.py can't tell it from a real process.
+"""
+
+import collections
+import itertools
+import re
+import struct
+
+import lldb
+
+RT_INVALID = 0
+RT_OBJECT = 1
+RT_INT8 = 2
+RT_INT16 = 3
+RT_INT32 = 4
+RT_INT64 = 5
+RT_FLOAT32 = 6
+RT_FLOAT64 = 7
+RT_NATIVE_PTR = 8
+RT_BOOLEAN = 9
+
+_RUNTIME_TYPE_FORMAT = {
+    RT_OBJECT: 'P', RT_INT8: 'b', RT_INT16: 'h', RT_INT32: 'i', RT_INT64: 'q',
+    RT_FLOAT32: 'f', RT_FLOAT64: 'd', RT_NATIVE_PTR: 'P', RT_BOOLEAN: '?'
+}
+
+_C_FORMAT = {
+    'char': 'b', 'signed char': 'b', 'short': 'h', 'unsigned short': 'H', 'int': 'i', 'unsigned int': 'I',
+    'long': 'q', 'unsigned long': 'Q', 'long long': 'q', 'unsigned long long': 'Q', 'bool': '?',
+    'float': 'f', 'double': 'd'
+}
+
+_ARRAY_CLASSES = {
+    'kotlin.Array': RT_OBJECT,
+    'kotlin.ByteArray': RT_INT8,
+    'kotlin.CharArray': RT_INT16,
+    'kotlin.ShortArray': RT_INT16,
+    'kotlin.IntArray': RT_INT32,
+    'kotlin.LongArray': RT_INT64,
+    'kotlin.FloatArray': RT_FLOAT32,
+    'kotlin.DoubleArray': RT_FLOAT64,
+    'kotlin.BooleanArray': RT_BOOLEAN,
+    'kotlin.String': RT_INT16,
+}
+
+DEBUG_BUFFER_SIZE = 4096
+_HEX = r'(0x[0-9a-fA-F]+|\d+)'
+# Every inferior is a new process for the caches of konan_lldb.py.
+_PROCESS_IDS = itertools.count(1)
+
+
+def _align_up(value, alignment):
+    return (value + alignment - 1) & ~(alignment - 1)
+
+
+class Image:
+    def __init__(self, path, uuid, slide):
+        self.path = path
+        self.uuid = uuid
+        self.slide = slide
+        self.symbols = []
+
+
+class KClass:
+    def __init__(self, name, address, fields, offsets, instance_size, element_type=None):
+        self.name = name
+        self.address = address
+        self.fields = fields
+        self.offsets = offsets
+        self.instance_size = instance_size
+        self.element_type = element_type
+
+
+class Inferior:
+    """Process memory is a set of regions: the image data (TypeInfos, names, globals) and the heap."""
+
+    def __init__(self, pointer_size=8, byte_order=lldb.eByteOrderLittle, slide=0x100000, uuid='0BADF00D-SIM'):
+        self.pointer_size = pointer_size
+        self.byte_order = byte_order
+        self.prefix = '>' if byte_order == lldb.eByteOrderBig else '<'
+        self.image = Image('/tmp/simulated.kexe', uuid, slide)
+        self.libraries = []
+        self.process = lldb.SBProcess()
+        self.target = lldb.SBTarget()
+        self.process_id = next(_PROCESS_IDS)
+        self.stop_id = 1
+        self.alive = True
+        self.core = False
+        self.max_children_count = 256
+        self.threads = []
+        self.breakpoints = {}
+        self.functions = {}
+        self.classes = {}
+        self.classes_by_address = {}
+        self._type_names = {}
+        self._data_start = slide + 0x10000
+        self._data = bytearray()
+        self._heap_start = 0x7f0000000000 if pointer_size == 8 else 0x40000000
+        self._heap = bytearray()
+        self._text = slide + 0x1000
+        self.stats = None
+        self.reset_stats()
+        self._patterns = None
+        self.debug_buffer = self.static_alloc(DEBUG_BUFFER_SIZE)
+        for name, element_type in _ARRAY_CLASSES.items():
+            self.define_array_class(name, element_type)
+        self.define_class('kotlin.Any', [])
+        for kclass in list(self.classes.values()):
+            self._name_strings(kclass.address, kclass.name)
+
+    # Memory.
+
+    def reset_stats(self):
+        self.stats = collections.Counter()
+        self.stats['expressions'] = collections.Counter()
+
+    def regions(self):
+        return [(self._data_start, self._data, self.image.path), (self._heap_start, self._heap, '[heap]')]
+
+    def _locate(self, address, size):
+        for (start, data, _) in self.regions():
+            if start <= address and address + size <= start + len(data):
+                return data, address - start
+        return None, None
+
+    def read(self, address, size):
+        (data, offset) = self._locate(address, size)
+        if data is None:
+            return None
+        return bytes(data[offset:offset + size])
+
+    def write(self, address, raw):
+        (data, offset) = self._locate(address, len(raw))
+        if data is None:
+            raise ValueError('bad write at {:#x}'.format(address))
+        data[offset:offset + len(raw)] = raw
+
+    def _fmt(self, fmt):
+        return self.prefix + fmt.replace('P', 'Q' if self.pointer_size == 8 else 'I')
+
+    def write_fmt(self, address, fmt, *values):
+        self.write(address, struct.pack(self._fmt(fmt), *values))
+
+    def read_fmt(self, address, fmt):
+        raw = self.read(address, struct.calcsize(self._fmt(fmt)))
+        return struct.unpack(self._fmt(fmt), raw)
+
+    def read_pointer(self, address):
+        return self.read_fmt(address, 'P')[0]
+
+    def static_alloc(self, size, alignment=8):
+        offset = _align_up(len(self._data), alignment)
+        self._data.extend(b'\0' * (offset + size - len(self._data)))
+        return self._data_start + offset
+
+    def heap_alloc(self, size, alignment=8):
+        offset = _align_up(len(self._heap), alignment)
+        self._heap.extend(b'\0' * (offset + size - len(self._heap)))
+        return self._heap_start + offset
+
+    def static_cstring(self, text):
+        raw = text.encode('utf-8') + b'\0'
+        address = self.static_alloc(len(raw), 1)
+        self.write(address, raw)
+        return address
+
+    def pack(self, sbtype, value):
+        if sbtype.IsPointerType():
+            return struct.pack(self._fmt('P'), value & ((1 << (8 * self.pointer_size)) - 1))
+        fmt = _C_FORMAT.get(sbtype.name)
+        if fmt is None:
+            return struct.pack(self._fmt('P'), value)
+        if fmt in 'bhiq':
+            bits = 8 * struct.calcsize(fmt)
+            value = int(value) & ((1 << bits) - 1)
+            value = value - (1 << bits) if value >= 1 << (bits - 1) else value
+        return struct.pack(self.prefix + fmt, value)
+
+    # Layout of the runtime structures.
+
+    @property
+    def type_info_size(self):
+        return 13 * self.pointer_size if self.pointer_size == 8 else 17 * 4
+
+    def _type_info_offsets(self):
+        p = self.pointer_size
+        offsets = {'typeInfo_': 0, 'extendedInfo_': p, 'unused_': 2 * p, 'instanceSize_': 2 * p + 4,
+                   'superType_': 2 * p + 8}
+        offsets['objOffsets_'] = offsets['superType_'] + p
+        offsets['objOffsetsCount_'] = offsets['objOffsets_'] + p
+        offsets['implementedInterfaces_'] = _align_up(offsets['objOffsetsCount_'] + 4, p)
+        offsets['implementedInterfacesCount_'] = offsets['implementedInterfaces_'] + p
+        offsets['interfaceTableSize_'] = offsets['implementedInterfacesCount_'] + 4
+        offsets['interfaceTable_'] = _align_up(offsets['interfaceTableSize_'] + 4, p)
+        offsets['packageName_'] = offsets['interfaceTable_'] + p
+        offsets['relativeName_'] = offsets['packageName_'] + p
+        offsets['flags_'] = offsets['relativeName_'] + p
+        offsets['classId_'] = offsets['flags_'] + 4
+        offsets['associatedObjects'] = _align_up(offsets['classId_'] + 4, p)
+        return offsets
+
+    def _field_size(self, runtime_type):
+        return struct.calcsize(self._fmt(_RUNTIME_TYPE_FORMAT[runtime_type]))
+
+    @property
+    def array_header_size(self):
+        return _align_up(self.pointer_size + 4, self.pointer_size)
+
+    def _extended_info(self, fields_count, offsets_address, types_address, names_address):
+        p = self.pointer_size
+        address = self.static_alloc(6 * p)
+        self.write_fmt(address, 'i', fields_count)
+        self.write_fmt(address + p, 'PPP', offsets_address, types_address, names_address)
+        self.write_fmt(address + 4 * p, 'i', 14)
+        self.write_fmt(address + 5 * p, 'P', self.debug_buffer)
+        return address
+
+    def _type_info(self, name, extended_info, instance_size, super_type, obj_offsets):
+        address = self.static_alloc(self.type_info_size)
+        offsets = self._type_info_offsets()
+        self.write_fmt(address + offsets['typeInfo_'], 'P', address)
+        self.write_fmt(address + offsets['extendedInfo_'], 'P', extended_info)
+        self.write_fmt(address + offsets['instanceSize_'], 'i', instance_size)
+        self.write_fmt(address + offsets['superType_'], 'P', super_type)
+        obj_offsets_address = self.static_alloc(4 * max(len(obj_offsets), 1), 4)
+        for (index, offset) in enumerate(obj_offsets):
+            self.write_fmt(obj_offsets_address + 4 * index, 'i', offset)
+        self.write_fmt(address + offsets['objOffsets_'], 'P', obj_offsets_address)
+        self.write_fmt(address + offsets['objOffsetsCount_'], 'i', len(obj_offsets))
+        self.image.symbols.append(('kclass:' + name, address))
+        return address
+
+    def _name_strings(self, type_info, name):
+        if 'kotlin.String' not in self.classes:
+            return
+        offsets = self._type_info_offsets()
+        (package, _, relative) = name.rpartition('.')
+        self.write_fmt(type_info + offsets['packageName_'], 'P', self.new_string(package, static=True))
+        self.write_fmt(type_info + offsets['relativeName_'], 'P', self.new_string(relative, static=True))
+
+    def define_array_class(self, name, element_type):
+        extended_info = self._extended_info(-element_type, 0, 0, 0)
+        super_type = self.classes['kotlin.Any'].address if 'kotlin.Any' in self.classes else 0
+        address = self._type_info(name, extended_info, -self._field_size(element_type), super_type, [])
+        kclass = KClass(name, address, [], [], -self._field_size(element_type), element_type)
+        self.classes[name] = kclass
+        self.classes_by_address[address] = kclass
+        self._name_strings(address, name)
+        return kclass
+
+    def define_class(self, name, fields, super_class=None):
+        """fields: list of (name, runtime type), all fields of super class have to be repeated first."""
+        offsets = []
+        size = self.pointer_size
+        for (_, runtime_type) in fields:
+            field_size = self._field_size(runtime_type)
+            size = _align_up(size, field_size)
+            offsets.append(size)
+            size += field_size
+        instance_size = _align_up(size, self.pointer_size)
+        offsets_address = self.static_alloc(4 * max(len(fields), 1), 4)
+        types_address = self.static_alloc(max(len(fields), 1), 1)
+        names_address = self.static_alloc(self.pointer_size * max(len(fields), 1))
+        for (index, (field_name, runtime_type)) in enumerate(fields):
+            self.write_fmt(offsets_address + 4 * index, 'i', offsets[index])
+            self.write_fmt(types_address + index, 'B', runtime_type)
+            self.write_fmt(names_address + self.pointer_size * index, 'P', self.static_cstring(field_name))
+        extended_info = self._extended_info(len(fields), offsets_address, types_address, names_address)
+        super_type = self.classes[super_class].address if super_class else \
+            (self.classes['kotlin.Any'].address if 'kotlin.Any' in self.classes else 0)
+        obj_offsets = [offset for ((_, runtime_type), offset) in zip(fields, offsets) if runtime_type == RT_OBJECT]
+        address = self._type_info(name, extended_info, instance_size, super_type, obj_offsets)
+        kclass = KClass(name, address, [field for (field, _) in fields], offsets, instance_size)
+        kclass.types = [runtime_type for (_, runtime_type) in fields]
+        self.classes[name] = kclass
+        self.classes_by_address[address] = kclass
+        self._name_strings(address, name)
+        return kclass
+
+    # Objects.
+
+    def new_object(self, class_name, meta=False, **values):
+        kclass = self.classes[class_name]
+        address = self.heap_alloc(kclass.instance_size)
+        header = kclass.address
+        if meta:
+            meta_object = self.heap_alloc(4 * self.pointer_size)
+            self.write_fmt(meta_object, 'P', kclass.address)
+            header = meta_object
+        self.write_fmt(address, 'P', header)
+        for (name, value) in values.items():
+            self.set_field(address, name, value)
+        return address
+
+    def set_field(self, address, name, value):
+        kclass = self.class_of(address)
+        index = kclass.fields.index(name)
+        runtime_type = kclass.types[index]
+        self.write_fmt(address + kclass.offsets[index], _RUNTIME_TYPE_FORMAT[runtime_type], value)
+
+    def new_array(self, class_name, values, static=False):
+        kclass = self.classes[class_name]
+        element_size = self._field_size(kclass.element_type)
+        start = _align_up(self.array_header_size, element_size)
+        size = _align_up(start + element_size * len(values), self.pointer_size)
+        address = self.static_alloc(size) if static else self.heap_alloc(size)
+        self.write_fmt(address, 'P', kclass.address)
+        self.write_fmt(address + self.pointer_size, 'I', len(values))
+        if values:
+            self.write(address + start, struct.pack(
+                self._fmt('{}{}'.format(len(values), _RUNTIME_TYPE_FORMAT[kclass.element_type])), *values))
+        return address
+
+    def new_string(self, text, static=False):
+        chars = struct.unpack(self.prefix + '{}H'.format(len(text.encode('utf-16-le')) // 2),
+                              text.encode('utf-16-be' if self.prefix == '>' else 'utf-16-le'))
+        return self.new_array('kotlin.String', [c - 0x10000 if c >= 0x8000 else c for c in chars], static)
+
+    def define_global(self, name, kotlin_type, value):
+        """Top level property with the storage kvar:<name>#internal and the getter kfun:<get-name>()<type>."""
+        runtime_type = {'kotlin.Byte': RT_INT8, 'kotlin.Short': RT_INT16, 'kotlin.Int': RT_INT32,
+                        'kotlin.Long': RT_INT64, 'kotlin.Char': RT_INT16, 'kotlin.Boolean': RT_BOOLEAN,
+                        'kotlin.Float': RT_FLOAT32, 'kotlin.Double': RT_FLOAT64}.get(kotlin_type, RT_OBJECT)
+        storage = self.static_alloc(8)
+        self.write_fmt(storage, _RUNTIME_TYPE_FORMAT[runtime_type], value)
+        getter = self._text
+        self._text += 0x10
+        self.functions[getter] = (storage, runtime_type)
+        self.image.symbols.append(('kvar:{}#internal'.format(name), storage))
+        self.image.symbols.append(('kfun:<get-{}>(){}'.format(name, kotlin_type), getter))
+        return storage
+
+    def add_library(self, path):
+        """Shared library without Kotlin symbols, like libc, frames of its functions are added with add_thread."""
+        image = Image(path, '{}-{}'.format(self.image.uuid, len(self.libraries) + 1), 0)
+        self.libraries.append(image)
+        return image
+
+    def add_thread(self, frames):
+        """frames: list of (function name, [(variable, type name, value)]) or (function name, variables, image)
+        for frames outside of the Kotlin image."""
+        thread = lldb.SBThread(len(self.threads) + 1, frames)
+        self.threads.append(thread)
+        return thread
+
+    def resume(self):
+        self.stop_id += 1
+
+    def restart(self):
+        self.process_id = next(_PROCESS_IDS)
+        self.stop_id = 1
+
+    # Runtime.
+
+    def header(self, obj):
+        return self.read_pointer(obj) & ~0x3
+
+    def type_info_of(self, obj):
+        return self.read_pointer(self.header(obj))
+
+    def class_of(self, obj):
+        return self.classes_by_address[self.type_info_of(obj)]
+
+    def string_value(self, obj):
+        count = self.read_fmt(obj + self.pointer_size, 'I')[0]
+        raw = self.read(obj + self.array_header_size, 2 * count)
+        return raw.decode('utf-16-be' if self.prefix == '>' else 'utf-16-le')
+
+    def is_instance(self, obj, type_info):
+        current = self.type_info_of(obj)
+        offsets = self._type_info_offsets()
+        while current:
+            if current == type_info:
+                return True
+            current = self.read_pointer(current + offsets['superType_'])
+        return False
+
+    def _layout_blob(self, obj):
+        kclass = self.class_of(obj)
+        if kclass.element_type is not None:
+            return struct.pack(self.prefix + 'i', -kclass.element_type)
+        count = len(kclass.fields)
+        return struct.pack(self.prefix + 'i{0}i{0}B'.format(count), count, *(kclass.offsets + kclass.types)) + \
+            b''.join(name.encode('utf-8') + b'\0' for name in kclass.fields)
+
+    def _field_count(self, obj):
+        kclass = self.class_of(obj)
+        if kclass.element_type is not None:
+            return self.read_fmt(obj + self.pointer_size, 'I')[0]
+        return len(kclass.fields)
+
+    def _field_type(self, obj, index):
+        kclass = self.class_of(obj)
+        if kclass.element_type is not None:
+            return kclass.element_type
+        return kclass.types[index] if 0 <= index < len(kclass.fields) else RT_INVALID
+
+    def _field_address(self, obj, index):
+        kclass = self.class_of(obj)
+        if kclass.element_type is not None:
+            element_size = self._field_size(kclass.element_type)
+            return obj + _align_up(self.array_header_size, element_size) + index * element_size
+        return obj + kclass.offsets[index] if 0 <= index < len(kclass.fields) else 0
+
+    def _field_name(self, obj, index):
+        kclass = self.class_of(obj)
+        key = (kclass.name, index)
+        if key not in self._type_names:
+            name = '' if kclass.element_type is not None else kclass.fields[index]
+            self._type_names[key] = self.static_cstring(name)
+        return self._type_names[key]
+
+    def _type_name(self, obj):
+        name = self.class_of(obj).name
+        if name not in self._type_names:
+            self._type_names[name] = self.static_cstring(name.rpartition('.')[2])
+        return self._type_names[name]
+
+    def _to_utf8(self, obj, buffer, size):
+        kclass = self.class_of(obj)
+        if kclass.name == 'kotlin.String':
+            text = self.string_value(obj)
+        else:
+            text = '{}@{:x}'.format(kclass.name.rpartition('.')[2], obj)
+        raw = text.encode('utf-8')[:size - 1] + b'\0'
+        self.write(buffer, raw)
+        return len(raw)
+
+    def _layout(self, obj, buffer, size):
+        blob = self._layout_blob(obj)
+        if len(blob) > size:
+            return -len(blob)
+        self.write(buffer, blob)
+        return len(blob)
+
+    def _call_getter(self, c_type, address):
+        (storage, runtime_type) = self.functions[address]
+        return c_type, self.read_fmt(storage, _RUNTIME_TYPE_FORMAT[runtime_type])[0]
+
+    def _type_info_expression(self, obj):
+        header = self.header(obj)
+        type_info = self.read_pointer(header)
+        return 'void *', type_info if type_info and self.read_pointer(type_info) == type_info else 0
+
+    def _expressions(self):
+        return [
+            (r'^\(void \*\)Konan_DebugBuffer\(\)$', lambda: ('void *', self.debug_buffer)),
+            (r'^\(int\)Konan_DebugBufferSize\(\)$', lambda: ('int', DEBUG_BUFFER_SIZE)),
+            (r'^\(int\)Konan_DebugGetTypeLayout\({0}, \(char \*\){0}, \(int\){0}\)$'.format(_HEX),
+             lambda o, b, s: ('int', self._layout(o, b, s))),
+            (r'^\(int\)Konan_DebugGetFieldCount\({0}\)$'.format(_HEX), lambda o: ('int', self._field_count(o))),
+            (r'^\(int\)Konan_DebugGetFieldType\({0}, (?:\(int\))?{0}\)$'.format(_HEX),
+             lambda o, i: ('int', self._field_type(o, i))),
+            (r'^\(void \*\)Konan_DebugGetFieldAddress\({0}, (?:\(int\))?{0}\)$'.format(_HEX),
+             lambda o, i: ('void *', self._field_address(o, i))),
+            (r'^\(char \*\)Konan_DebugGetFieldName\({0}, (?:\(int\))?{0}\)$'.format(_HEX),
+             lambda o, i: ('char *', self._field_name(o, i))),
+            (r'^\(char \*\)Konan_DebugGetTypeName\({0}\)$'.format(_HEX), lambda o: ('char *', self._type_name(o))),
+            (r'^\(int\)Konan_DebugIsArray\({0}\)$'.format(_HEX),
+             lambda o: ('int', int(self.class_of(o).element_type is not None))),
+            (r'^\(int\)Konan_DebugObjectToUtf8Array\({0}, \(void \*\){0}, '
+             r'\(int\)Konan_DebugBufferSize\(\)\);?$'.format(_HEX),
+             lambda o, b: ('int', self._to_utf8(o, b, DEBUG_BUFFER_SIZE))),
+            (r'^\(bool\)IsInstance\({0}, {0}\)$'.format(_HEX), lambda o, t: ('bool', self.is_instance(o, t))),
+            (r'^\(int\)IsInstance\({0}, {0}\) \? 1 : \(\(int\)Konan_DebugIsArray\({0}\)\) \? 2 : 0\)?$'.format(_HEX),
+             lambda o, t, _: ('int', 1 if self.is_instance(o, t) else
+                              2 if self.class_of(o).element_type is not None else 0)),
+            (r'^\*\(void \*\*\)\(\(uintptr_t\)\(\*\(void\*\*\){0}\) & ~0x3\) == .*$'.format(_HEX),
+             self._type_info_expression),
+            (r'^\(\((.*) \(\*\)\(\)\){0}\)\(\)$'.format(_HEX), self._call_getter),
+            (r'^\(([\w ]+\s*\*+)\)\s*{0}$'.format(_HEX), lambda t, a: (t.strip(), a)),
+        ]
+
+    def evaluate(self, expression):
+        if self._patterns is None:
+            self._patterns = [(re.compile(pattern), action) for (pattern, action) in self._expressions()]
+        for (pattern, action) in self._patterns:
+            match = pattern.match(expression)
+            if match is None:
+                continue
+            arguments = [int(group, 0) if re.match(_HEX + '$', group) else group for group in match.groups()]
+            try:
+                return action(*arguments)
+            except (TypeError, KeyError, IndexError, struct.error) as e:
+                return None, 'error: Execution was interrupted: {}'.format(e)
+        return None, 'error: unsupported expression: ' + expression
@@ -0,0 +1,975 @@
+##
+# Copyright 2010-2021 JetBrains s.r.o.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Stand-in for LLDB python module that is just enough to run konan_lldb.py against a simulated inferior,
+see inferior.py. Every SB* object here is backed by the `Inferior` instance installed with `install()`.
+"""
+
+import struct
+
+eByteOrderInvalid = 0
+eByteOrderBig = 1
+eByteOrderLittle = 4
+
+eBasicTypeInvalid = 0
+eBasicTypeVoid = 1
+eBasicTypeChar = 2
+eBasicTypeSignedChar = 3
+eBasicTypeShort = 8
+eBasicTypeUnsignedShort = 9
+eBasicTypeInt = 10
+eBasicTypeUnsignedInt = 11
+eBasicTypeLong = 12
+eBasicTypeUnsignedLong = 13
+eBasicTypeLongLong = 14
+eBasicTypeUnsignedLongLong = 15
+eBasicTypeBool = 20
+eBasicTypeFloat = 22
+eBasicTypeDouble = 23
+
+eStateInvalid = 0
+eStateUnloaded = 1
+eStateConnected = 2
+eStateAttaching = 3
+eStateLaunching = 4
+eStateStopped = 5
+eStateRunning = 6
+eStateStepping = 7
+eStateCrashed = 8
+eStateDetached = 9
+eStateExited = 10
+eStateSuspended = 11
+
+eReturnStatusSuccessFinishResult = 2
+eReturnStatusFailed = 6
+
+eValueTypeVariableGlobal = 1
+eValueTypeVariableStatic = 2
+eValueTypeVariableArgument = 3
+eValueTypeVariableLocal = 4
+
+_BASIC_TYPES = {
+    eBasicTypeVoid: ('void', 0, None),
+    eBasicTypeChar: ('char', 1, 'b'),
+    eBasicTypeSignedChar: ('signed char', 1, 'b'),
+    eBasicTypeShort: ('short', 2, 'h'),
+    eBasicTypeUnsignedShort: ('unsigned short', 2, 'H'),
+    eBasicTypeInt: ('int', 4, 'i'),
+    eBasicTypeUnsignedInt: ('unsigned int', 4, 'I'),
+    eBasicTypeLong: ('long', 8, 'q'),
+    eBasicTypeUnsignedLong: ('unsigned long', 8, 'Q'),
+    eBasicTypeLongLong: ('long long', 8, 'q'),
+    eBasicTypeUnsignedLongLong: ('unsigned long long', 8, 'Q'),
+    eBasicTypeBool: ('bool', 1, '?'),
+    eBasicTypeFloat: ('float', 4, 'f'),
+    eBasicTypeDouble: ('double', 8, 'd'),
+}
+
+_C_TYPES = {
+    'void': eBasicTypeVoid,
+    'char': eBasicTypeChar,
+    'int8_t': eBasicTypeSignedChar,
+    'short': eBasicTypeShort,
+    'int16_t': eBasicTypeShort,
+    'int': eBasicTypeInt,
+    'int32_t': eBasicTypeInt,
+    'long': eBasicTypeLong,
+    'int64_t': eBasicTypeLongLong,
+    'long long': eBasicTypeLongLong,
+    'uintptr_t': eBasicTypeUnsignedLong,
+    'bool': eBasicTypeBool,
+    'float': eBasicTypeFloat,
+    'double': eBasicTypeDouble,
+}
+
+_inferior = None
+
+
+def install(inferior):
+    """Makes `inferior` the process behind `lldb.debugger`."""
+    global _inferior, debugger
+    _inferior = inferior
+    debugger = SBDebugger()
+    return debugger
+
+
+class SBError:
+    def __init__(self, message=None):
+        self._message = message
+
+    def Success(self):
+        return self._message is None
+
+    def Fail(self):
+        return self._message is not None
+
+    def SetErrorString(self, message):
+        self._message = message
+
+    def GetCString(self):
+        return self._message
+
+    def Clear(self):
+        self._message = None
+
+    def __str__(self):
+        return self._message or 'success'
+
+
+class SBCommandReturnObject:
+    def __init__(self):
+        self._output = []
+        self._error = []
+        self._succeeded = True
+
+    def AppendMessage(self, message):
+        self._output.append(message + '\n')
+
+    def AppendWarning(self, message):
+        self._error.append('warning: ' + message + '\n')
+
+    def SetError(self, message):
+        self._succeeded = False
+        self._error.append('error: ' + str(message) + '\n')
+
+    def SetStatus(self, status):
+        self._succeeded = status != eReturnStatusFailed
+
+    def Succeeded(self):
+        return self._succeeded
+
+    def GetOutput(self):
+        return ''.join(self._output)
+
+    def GetError(self):
+        return ''.join(self._error)
+
+
+class SBSyntheticValueProvider(object):
+    def __init__(self, valobj=None):
+        pass
+
+
+class SBStringList:
+    def __init__(self, strings=()):
+        self._strings = list(strings)
+
+    def GetSize(self):
+        return len(self._strings)
+
+    def GetStringAtIndex(self, index):
+        return self._strings[index]
+
+    def __len__(self):
+        return len(self._strings)
+
+    def __iter__(self):
+        return iter(self._strings)
+
+
+class SBType:
+    def __init__(self, name, size, code=None, pointee=None, fields=None):
+        self._name = name
+        self._size = size
+        self._code = code
+        self._pointee = pointee
+        self._fields = fields or []
+
+    @property
+    def name(self):
+        return self._name
+
+    def GetName(self):
+        return self._name
+
+    def GetDisplayTypeName(self):
+        return self._name
+
+    def GetByteSize(self):
+        return self._size
+
+    @property
+    def size(self):
+        return self._size
+
+    def IsValid(self):
+        return self._name is not None
+
+    def IsPointerType(self):
+        return self._pointee is not None
+
+    def GetPointerType(self):
+        return SBType(self._name + ' *' if not self._name.endswith('*') else self._name + '*',
+                      _inferior.pointer_size, pointee=self)
+
+    def GetPointeeType(self):
+        return self._pointee if self._pointee is not None else SBType(None, 0)
+
+    def GetBasicType(self, kind=None):
+        if kind is None:
+            return self._code
+        return basic_type(kind)
+
+    def GetTypeClass(self):
+        return 0
+
+    def __eq__(self, other):
+        return isinstance(other, SBType) and self._name == other._name
+
+    def __hash__(self):
+        return hash(self._name)
+
+    def __str__(self):
+        return str(self._name)
+
+
+def basic_type(kind):
+    (name, size, _) = _BASIC_TYPES[kind]
+    return SBType(name, size, code=kind)
+
+
+def parse_c_type(text):
+    """Parses type names like 'int32_t *' or 'void **' or 'ObjHeader *'."""
+    text = text.strip()
+    stars = 0
+    while text.endswith('*'):
+        stars += 1
+        text = text[:-1].strip()
+    if text in _C_TYPES:
+        result = basic_type(_C_TYPES[text])
+    elif text == 'ObjHeader':
+        result = SBType('ObjHeader', _inferior.pointer_size)
+    else:
+        result = SBType(text, 0)
+    for _ in range(stars):
+        result = result.GetPointerType()
+    return result
+
+
+def _unpack(sbtype, raw, byte_order):
+    prefix = '>' if byte_order == eByteOrderBig else '<'
+    if sbtype.IsPointerType():
+        return struct.unpack(prefix + ('Q' if len(raw) == 8 else 'I'), raw)[0]
+    code = sbtype.GetBasicType()
+    if code in _BASIC_TYPES and _BASIC_TYPES[code][2] is not None:
+        return struct.unpack(prefix + _BASIC_TYPES[code][2], raw)[0]
+    return int.from_bytes(raw, 'big' if byte_order == eByteOrderBig else 'little')
+
+
+class SBData:
+    def __init__(self, raw=b'', byte_order=eByteOrderLittle, address_size=8):
+        self._raw = bytes(raw)
+        self._byte_order = byte_order
+        self._address_size = address_size
+
+    def SetData(self, error, raw, byte_order, address_size):
+        self._raw = bytes(raw)
+        self._byte_order = byte_order
+        self._address_size = address_size
+
+    def GetByteSize(self):
+        return len(self._raw)
+
+    def ReadRawData(self, error, offset, size):
+        return self._raw[offset:offset + size]
+
+    def IsValid(self):
+        return True
+
+    @staticmethod
+    def CreateDataFromUInt64Array(byte_order, address_size, values):
+        prefix = '>' if byte_order == eByteOrderBig else '<'
+        return SBData(struct.pack('{}{}Q'.format(prefix, len(values)), *values), byte_order, address_size)
+
+    @staticmethod
+    def CreateDataFromUInt32Array(byte_order, address_size, values):
+        prefix = '>' if byte_order == eByteOrderBig else '<'
+        return SBData(struct.pack('{}{}I'.format(prefix, len(values)), *values), byte_order, address_size)
+
+
+class SBValue:
+    """Value is either located in the inferior memory (address is not None) or holds raw bytes."""
+    def __init__(self, name, sbtype, address=None, raw=None, error=None):
+        self._name = name
+        self._type = sbtype
+        self._address = address
+        self._raw = raw
+        self._error = error
+        self._synthetic_generated = False
+
+    def _bytes(self):
+        if self._raw is not None:
+            return self._raw
+        if self._address is None:
+            return None
+        error = SBError()
+        raw = _inferior.process.ReadMemory(self._address, self._type.GetByteSize(), error, count=False)
+        return raw if error.Success() else None
+
+    def IsValid(self):
+        return self._error is None and self._type is not None
+
+    def GetError(self):
+        return SBError(self._error)
+
+    @property
+    def error(self):
+        return self.GetError()
+
+    @property
+    def name(self):
+        return self._name
+
+    def GetName(self):
+        return self._name
+
+    @property
+    def type(self):
+        return self._type
+
+    def GetType(self):
+        return self._type
+
+    def GetTypeName(self):
+        return self._type.name if self._type is not None else None
+
+    def GetLoadAddress(self):
+        return self._address if self._address is not None else 0xffffffffffffffff
+
+    def _number(self):
+        raw = self._bytes()
+        if raw is None or not raw or self._type.GetByteSize() == 0:
+            return None
+        return _unpack(self._type, raw, _inferior.byte_order)
+
+    @property
+    def unsigned(self):
+        return self.GetValueAsUnsigned()
+
+    @property
+    def signed(self):
+        return self.GetValueAsSigned()
+
+    def GetValueAsUnsigned(self, default=0):
+        number = self._number()
+        if number is None:
+            return default
+        if isinstance(number, float):
+            return int(number)
+        return number & ((1 << (8 * self._type.GetByteSize())) - 1)
+
+    def GetValueAsSigned(self, default=0):
+        number = self._number()
+        if number is None:
+            return default
+        if isinstance(number, float):
+            return int(number)
+        bits = 8 * self._type.GetByteSize()
+        number &= (1 << bits) - 1
+        return number - (1 << bits) if number >= 1 << (bits - 1) else number
+
+    def GetValue(self):
+        if not self.IsValid():
+            return None
+        number = self._number()
+        if number is None:
+            return None
+        if self._type.IsPointerType():
+            return '0x{:016x}'.format(number)
+        if isinstance(number, bool):
+            return 'true' if number else 'false'
+        if self._type.GetBasicType() in (eBasicTypeChar, eBasicTypeSignedChar):
+            return "'{}'".format(chr(number)) if 32 <= number < 127 else "'\\x{:02x}'".format(number & 0xff)
+        if isinstance(number, float):
+            return '{:g}'.format(number)
+        return str(number)
+
+    @property
+    def value(self):
+        return self.GetValue()
+
+    def GetSummary(self):
+        if self._type is not None and self._type.name == 'char *':
+            error = SBError()
+            text = _inferior.process.ReadCStringFromMemory(self.unsigned, 0x1000, error)
+            return '"{}"'.format(text) if error.Success() else None
+        return None
+
+    @property
+    def summary(self):
+        return self.GetSummary()
+
+    def Dereference(self):
+        if not self._type.IsPointerType():
+            return SBValue(None, None, error='not a pointer')
+        return SBValue('*' + str(self._name), self._type.GetPointeeType(), address=self.unsigned)
+
+    @property
+    def deref(self):
+        return self.Dereference()
+
+    def SetSyntheticChildrenGenerated(self, value):
+        self._synthetic_generated = value
+
+    def CreateValueFromExpression(self, name, expression):
+        _inferior.stats['expression_children'] += 1
+        result = _inferior.target.EvaluateExpression(expression)
+        result._name = name
+        return result
+
+    def CreateValueFromAddress(self, name, address, sbtype):
+        _inferior.stats['address_children'] += 1
+        return SBValue(name, sbtype, address=address)
+
+    def CreateValueFromData(self, name, data, sbtype):
+        _inferior.stats['data_children'] += 1
+        return SBValue(name, sbtype, raw=data.ReadRawData(SBError(), 0, data.GetByteSize()))
+
+    def GetNumChildren(self):
+        return 0
+
+    def __str__(self):
+        return '({}) {} = {}'.format(self.GetTypeName(), self._name, self.GetValue())
+
+
+class SBValueList:
+    def __init__(self, values=()):
+        self._values = list(values)
+
+    def GetSize(self):
+        return len(self._values)
+
+    def GetValueAtIndex(self, index):
+        return self._values[index]
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+
+class SBAddress:
+    def __init__(self, address, module=None):
+        self._address = address
+        self._module = module
+
+    def GetLoadAddress(self, target):
+        return self._address
+
+    def GetFileAddress(self):
+        return self._address - (self._module.slide if self._module is not None else 0)
+
+    def GetModule(self):
+        return self._module if self._module is not None else SBModule(None)
+
+    def IsValid(self):
+        return self._address is not None
+
+    @property
+    def module(self):
+        return self.GetModule()
+
+
+class SBSymbol:
+    def __init__(self, name, address, module):
+        self._name = name
+        self._address = address
+        self._module = module
+
+    @property
+    def name(self):
+        return self._name
+
+    def GetName(self):
+        return self._name
+
+    def GetStartAddress(self):
+        return SBAddress(self._address, self._module)
+
+    @property
+    def addr(self):
+        return self.GetStartAddress()
+
+    def IsValid(self):
+        return True
+
+
+class SBSymbolContext:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.function = symbol
+
+
+class SBSymbolContextList:
+    def __init__(self, contexts=()):
+        self._contexts = list(contexts)
+
+    def GetSize(self):
+        return len(self._contexts)
+
+    def GetContextAtIndex(self, index):
+        return self._contexts[index]
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def __getitem__(self, index):
+        return self._contexts[index]
+
+    def __iter__(self):
+        return iter(self._contexts)
+
+
+class SBFileSpec:
+    def __init__(self, path):
+        self._path = path
+
+    @property
+    def fullpath(self):
+        return self._path
+
+    def GetFilename(self):
+        return self._path.rsplit('/', 1)[-1] if self._path else None
+
+    def __str__(self):
+        return str(self._path)
+
+
+class SBModule:
+    def __init__(self, image):
+        self._image = image
+
+    @property
+    def slide(self):
+        return self._image.slide if self._image is not None else 0
+
+    def IsValid(self):
+        return self._image is not None
+
+    def __eq__(self, other):
+        return isinstance(other, SBModule) and self._image is other._image
+
+    def __hash__(self):
+        return id(self._image)
+
+    @property
+    def symbols(self):
+        return [SBSymbol(name, address, self) for (name, address) in self._image.symbols]
+
+    def GetNumSymbols(self):
+        return len(self._image.symbols)
+
+    def GetSymbolAtIndex(self, index):
+        _inferior.stats['symbols'] += 1
+        (name, address) = self._image.symbols[index]
+        return SBSymbol(name, address, self)
+
+    def FindSymbol(self, name):
+        for (symbol_name, address) in self._image.symbols:
+            if symbol_name == name:
+                return SBSymbol(name, address, self)
+        return SBSymbol(None, None, self)
+
+    def FindFunctions(self, name, name_type_mask=0):
+        return SBSymbolContextList(SBSymbolContext(SBSymbol(symbol_name, address, self))
+                                   for (symbol_name, address) in self._image.symbols if symbol_name == name)
+
+    def ResolveFileAddress(self, address):
+        return SBAddress(address + self.slide, self)
+
+    def GetUUIDString(self):
+        return self._image.uuid
+
+    def GetFileSpec(self):
+        return SBFileSpec(self._image.path)
+
+    @property
+    def file(self):
+        return self.GetFileSpec()
+
+
+class SBFrame:
+    def __init__(self, thread, index, function, variables, image=None):
+        self._thread = thread
+        self._index = index
+        self._function = function
+        self._variables = variables
+        self._image = image
+
+    def IsValid(self):
+        return True
+
+    def GetFrameID(self):
+        return self._index
+
+    def GetFunctionName(self):
+        return self._function
+
+    @property
+    def name(self):
+        return self._function
+
+    def GetDisplayFunctionName(self):
+        return self._function
+
+    def GetPC(self):
+        return 0x1000 + 0x10 * hash(self._function) % 0x100000
+
+    def GetThread(self):
+        return self._thread
+
+    @property
+    def module(self):
+        return SBModule(self._image or _inferior.image)
+
+    def GetModule(self):
+        return self.module
+
+    def GetVariables(self, arguments, locals, statics, in_scope_only):
+        return SBValueList(self._make(name, type_name, value) for (name, type_name, value) in self._variables)
+
+    def FindVariable(self, name):
+        for (variable, type_name, value) in self._variables:
+            if variable == name:
+                return self._make(variable, type_name, value)
+        return SBValue(name, None, error='no variable named ' + name)
+
+    def GetValueForVariablePath(self, path):
+        return self.FindVariable(path)
+
+    def EvaluateExpression(self, expression):
+        return _inferior.target.EvaluateExpression(expression)
+
+    @staticmethod
+    def _make(name, type_name, value):
+        sbtype = parse_c_type(type_name)
+        return SBValue(name, sbtype, raw=_inferior.pack(sbtype, value))
+
+
+class SBThread:
+    def __init__(self, thread_id, frames):
+        self._id = thread_id
+        self._frames = [SBFrame(self, index, *frame) for (index, frame) in enumerate(frames)]
+
+    def IsValid(self):
+        return True
+
+    def GetThreadID(self):
+        return self._id
+
+    def GetProcess(self):
+        return _inferior.process
+
+    def GetIndexID(self):
+        return self._id
+
+    def GetName(self):
+        return 'thread-{}'.format(self._id)
+
+    def GetNumFrames(self):
+        return len(self._frames)
+
+    def GetFrameAtIndex(self, index):
+        return self._frames[index]
+
+    def GetSelectedFrame(self):
+        return self._frames[0] if self._frames else SBFrame(self, 0, None, [])
+
+    @property
+    def frames(self):
+        return list(self._frames)
+
+    def __iter__(self):
+        return iter(self._frames)
+
+
+class SBMemoryRegionInfo:
+    def __init__(self, start=0, end=0, readable=False, writable=False, executable=False, name=None):
+        self._start = start
+        self._end = end
+        self._readable = readable
+        self._writable = writable
+        self._executable = executable
+        self._name = name
+
+    def GetRegionBase(self):
+        return self._start
+
+    def GetRegionEnd(self):
+        return self._end
+
+    def IsReadable(self):
+        return self._readable
+
+    def IsWritable(self):
+        return self._writable
+
+    def IsExecutable(self):
+        return self._executable
+
+    def IsMapped(self):
+        return True
+
+    def GetName(self):
+        return self._name
+
+
+class SBMemoryRegionInfoList:
+    def __init__(self, regions=()):
+        self._regions = list(regions)
+
+    def GetSize(self):
+        return len(self._regions)
+
+    def GetMemoryRegionAtIndex(self, index, region):
+        source = self._regions[index]
+        region.__dict__.update(source.__dict__)
+        return True
+
+
+class SBProcess:
+    def IsValid(self):
+        return _inferior.alive or _inferior.core
+
+    def GetUniqueID(self):
+        return _inferior.process_id
+
+    def GetProcessID(self):
+        return _inferior.process_id
+
+    def GetStopID(self, include_expression_stops=False):
+        return _inferior.stop_id
+
+    def GetState(self):
+        return eStateStopped if (_inferior.alive or _inferior.core) else eStateExited
+
+    def GetPluginName(self):
+        return 'elf-core' if _inferior.core else 'gdb-remote'
+
+    def GetTarget(self):
+        return _inferior.target
+
+    def GetAddressByteSize(self):
+        return _inferior.pointer_size
+
+    def GetByteOrder(self):
+        return _inferior.byte_order
+
+    def GetNumThreads(self):
+        return len(_inferior.threads)
+
+    def GetThreadAtIndex(self, index):
+        return _inferior.threads[index]
+
+    @property
+    def threads(self):
+        return list(_inferior.threads)
+
+    def GetSelectedThread(self):
+        return _inferior.threads[0] if _inferior.threads else SBThread(0, [])
+
+    def ReadMemory(self, address, size, error, count=True):
+        if count:
+            _inferior.stats['read_memory'] += 1
+            _inferior.stats['read_bytes'] += size
+        raw = _inferior.read(address, size)
+        if raw is None:
+            error.SetErrorString('memory read failed for {:#x}'.format(address))
+            return None
+        return raw
+
+    def ReadPointerFromMemory(self, address, error):
+        raw = self.ReadMemory(address, _inferior.pointer_size, error)
+        if raw is None:
+            return 0
+        return int.from_bytes(raw, 'big' if _inferior.byte_order == eByteOrderBig else 'little')
+
+    def ReadUnsignedFromMemory(self, address, size, error):
+        raw = self.ReadMemory(address, size, error)
+        if raw is None:
+            return 0
+        return int.from_bytes(raw, 'big' if _inferior.byte_order == eByteOrderBig else 'little')
+
+    def ReadCStringFromMemory(self, address, max_size, error):
+        _inferior.stats['read_memory'] += 1
+        result = bytearray()
+        while len(result) < max_size:
+            raw = _inferior.read(address + len(result), 1)
+            if raw is None:
+                error.SetErrorString('memory read failed for {:#x}'.format(address))
+                return None
+            if raw == b'\0':
+                break
+            result += raw
+        _inferior.stats['read_bytes'] += len(result) + 1
+        return result.decode('utf-8', 'replace')
+
+    def GetMemoryRegions(self):
+        return SBMemoryRegionInfoList(SBMemoryRegionInfo(start, start + len(data), True, True, False, name)
+                                      for (start, data, name) in _inferior.regions())
+
+    def Continue(self):
+        _inferior.resume()
+
+
+class SBTarget:
+    def IsValid(self):
+        return True
+
+    def GetProcess(self):
+        return _inferior.process
+
+    @property
+    def process(self):
+        return _inferior.process
+
+    def GetAddressByteSize(self):
+        return _inferior.pointer_size
+
+    def GetByteOrder(self):
+        return _inferior.byte_order
+
+    def GetNumModules(self):
+        return 1 + len(_inferior.libraries)
+
+    def GetModuleAtIndex(self, index):
+        return SBModule(([_inferior.image] + _inferior.libraries)[index])
+
+    @property
+    def modules(self):
+        return [SBModule(image) for image in [_inferior.image] + _inferior.libraries]
+
+    def GetExecutable(self):
+        return SBFileSpec(_inferior.image.path)
+
+    def ResolveLoadAddress(self, address):
+        return SBAddress(address, SBModule(_inferior.image))
+
+    def GetBasicType(self, kind):
+        return basic_type(kind)
+
+    def CreateValueFromData(self, name, data, sbtype):
+        _inferior.stats['data_children'] += 1
+        return SBValue(name, sbtype, raw=data.ReadRawData(SBError(), 0, data.GetByteSize()))
+
+    def CreateValueFromAddress(self, name, address, sbtype):
+        _inferior.stats['address_children'] += 1
+        return SBValue(name, sbtype, address=address)
+
+    def FindFirstType(self, name):
+        if name == 'ObjHeader':
+            return SBType('ObjHeader', _inferior.pointer_size)
+        if name in _C_TYPES:
+            return basic_type(_C_TYPES[name])
+        return SBType(None, 0)
+
+    def EvaluateExpression(self, expression, options=None):
+        _inferior.stats['evaluate'] += 1
+        _inferior.stats['expressions'][expression.split('(')[1] if '(' in expression else expression] += 1
+        if not _inferior.alive:
+            return SBValue(None, None, error='cannot evaluate expressions without a live process')
+        (type_name, value) = _inferior.evaluate(expression)
+        if type_name is None:
+            return SBValue(None, None, error=value)
+        sbtype = parse_c_type(type_name)
+        return SBValue('$0', sbtype, raw=_inferior.pack(sbtype, value))
+
+    def BreakpointCreateByLocation(self, file, line):
+        breakpoint = SBBreakpoint(len(_inferior.breakpoints) + 1)
+        _inferior.breakpoints[breakpoint.GetID()] = breakpoint
+        return breakpoint
+
+    def FindBreakpointByID(self, breakpoint_id):
+        return _inferior.breakpoints.get(breakpoint_id, SBBreakpoint(None))
+
+
+class SBBreakpoint:
+    def __init__(self, breakpoint_id):
+        self._id = breakpoint_id
+        self.callback = None
+        self.condition = None
+
+    def IsValid(self):
+        return self._id is not None
+
+    def GetID(self):
+        return self._id
+
+    def SetScriptCallbackFunction(self, name, extra_args=None):
+        self.callback = (name, extra_args)
+        return SBError()
+
+    def SetCondition(self, condition):
+        self.condition = condition
+
+
+class SBBreakpointLocation:
+    def __init__(self, breakpoint):
+        self._breakpoint = breakpoint
+
+    def GetBreakpoint(self):
+        return self._breakpoint
+
+
+class SBCommandInterpreter:
+    def HandleCommand(self, command, result, add_to_history=False):
+        _inferior.stats['commands'] += 1
+        if command == 'settings show target.max-children-count':
+            result.AppendMessage('target.max-children-count (int) = {}'.format(_inferior.max_children_count))
+        else:
+            result.AppendMessage(command)
+
+
+class SBDebugger:
+    def __init__(self):
+        self.commands = []
+
+    def GetSelectedTarget(self):
+        return _inferior.target
+
+    def GetCommandInterpreter(self):
+        return SBCommandInterpreter()
+
+    def HandleCommand(self, command):
+        self.commands.append(' '.join(command.split()))
+
+    def GetInstanceName(self):
+        return 'debugger_1'
+
+    def GetInternalVariableValue(self, name, instance):
+        if name == 'target.max-children-count':
+            return SBStringList([str(_inferior.max_children_count)])
+        return SBStringList()
+
+    @property
+    def selected_target(self):
+        return _inferior.target
+
+
+class _Formatters:
+    class Logger:
+        class Logger:
+            def __init__(self):
+                pass
+
+            def write(self, message):
+                pass
+
+
+formatters = _Formatters()
+debugger = None
@@ -0,0 +1,496 @@
+#!/usr/bin/python
+
+##
+# Copyright 2010-2021 JetBrains s.r.o.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Benchmarks of konan_lldb.py formatters against a simulated Kotlin/Native process, runs with plain python and
+doesn't need LLDB: lldb.py next to this file stands in for the LLDB python module and inferior.py lays out
+Kotlin objects in memory the way the runtime does.
+
+Every scenario formats a value the way `frame variable` does: builds the synthetic provider, computes the summary
+and materializes the first target.max-children-count children with their summaries, or runs konan_* commands.
+It's done twice, at the first stop of a new process (cold) and at the next stop (warm), counting expression
+evaluations and memory reads.
+Counts are deterministic, so they are checked against the budgets and the script fails if any is exceeded.
+
+    python3 run_benchmarks.py [-k FILTER] [-r REPEAT] [--pointer-size 4|8] [--json FILE]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lldb
+import inferior
+from inferior import RT_OBJECT, RT_INT8, RT_INT32, RT_INT64, RT_FLOAT64, RT_BOOLEAN
+
+import konan_lldb
+konan_lldb.__lldb_init_module(lldb.install(inferior.Inferior()), {})
+# Scenarios don't share layouts through the persistent cache, unless they ask for it
+konan_lldb.PERSISTENT_CACHE = False
+_PERSISTENT_CACHE_DIR = tempfile.TemporaryDirectory(prefix='konan_lldb_benchmarks')
+# Files written by commands
+_OUTPUT_DIR = tempfile.TemporaryDirectory(prefix='konan_lldb_benchmarks_output')
+
+class Scenario:
+    def __init__(self, name, build, budget, first_child=0, settings=None, prepare=None, summary=None, action=None):
+        """build creates objects in the inferior and returns address of the formatted one,
+        budget maps (cold|warm, counter) to the maximal allowed value,
+        settings are konan_lldb settings overridden while the scenario runs,
+        prepare(process, value, scenario) is called before the cold run,
+        summary is the expected summary of both runs or a function of the process returning it, if it's given,
+        action(process, value, scenario) returns the summary, by default the value is formatted."""
+        self.name = name
+        self.build = build
+        self.budget = budget
+        self.first_child = first_child
+        self.settings = settings or {}
+        self.prepare = prepare
+        self.summary = summary
+        self.action = action or _format
+
+
+def _classes(process):
+    process.define_class('demo.Point', [('x', RT_INT32), ('y', RT_INT32)])
+    process.define_class('demo.Person', [('name', RT_OBJECT), ('age', RT_INT32), ('friend', RT_OBJECT),
+                                         ('score', RT_FLOAT64), ('id', RT_INT64), ('flag', RT_BOOLEAN),
+                                         ('tag', RT_INT8)])
+    process.define_class('demo.Node', [('value', RT_INT32), ('next', RT_OBJECT)])
+    process.define_class('demo.Tree', [('left', RT_OBJECT), ('right', RT_OBJECT), ('label', RT_OBJECT)])
+    process.define_class('kotlin.collections.ArrayList', [('array', RT_OBJECT), ('offset', RT_INT32),
+                                                          ('length', RT_INT32), ('isReadOnly', RT_BOOLEAN),
+                                                          ('backing', RT_OBJECT), ('root', RT_OBJECT)])
+    process.define_class('kotlin.collections.HashMap', [('keysArray', RT_OBJECT), ('valuesArray', RT_OBJECT),
+                                                        ('presenceArray', RT_OBJECT), ('hashArray', RT_OBJECT),
+                                                        ('maxProbeDistance', RT_INT32), ('length', RT_INT32),
+                                                        ('hashShift', RT_INT32), ('_size', RT_INT32),
+                                                        ('isReadOnly', RT_BOOLEAN)])
+    process.define_class('kotlin.collections.HashSet', [('backing', RT_OBJECT)])
+
+
+def _person(process):
+    person = process.new_object('demo.Person', meta=True, name=process.new_string('John Doe'), age=42, score=1.5,
+                                id=1 << 40, flag=True, tag=7)
+    process.set_field(person, 'friend', person)
+    return person
+
+
+def _linked_list(process, length):
+    head = 0
+    for value in range(length):
+        head = process.new_object('demo.Node', value=value, next=head)
+    return head
+
+
+def _tree(process, depth):
+    if depth == 0:
+        return 0
+    return process.new_object('demo.Tree', left=_tree(process, depth - 1), right=_tree(process, depth - 1),
+                              label=process.new_string('depth {}'.format(depth)))
+
+
+def _shared(process, size, shared):
+    """Array of references to a few objects, like a frame where many values share a subgraph."""
+    people = [_person(process) for _ in range(shared)]
+    return process.new_array('kotlin.Array', [people[i % shared] for i in range(size)])
+
+
+def _array_list(process, size):
+    points = [process.new_object('demo.Point', x=i, y=-i) for i in range(size)]
+    array = process.new_array('kotlin.Array', points + [0] * (size // 2))
+    return process.new_object('kotlin.collections.ArrayList', array=array, offset=0, length=size)
+
+
+def _hash_map(process, size, values=True):
+    capacity = size + size // 3
+    keys = [process.new_string('key{}'.format(i)) if i % 4 else 0 for i in range(capacity)]
+    presence = [i if keys[i] else -1 for i in range(capacity)]
+    keys_array = process.new_array('kotlin.Array', keys)
+    values_array = process.new_array('kotlin.IntArray', list(range(capacity))) if values else 0
+    presence_array = process.new_array('kotlin.IntArray', presence)
+    return process.new_object('kotlin.collections.HashMap', keysArray=keys_array, valuesArray=values_array,
+                              presenceArray=presence_array, length=capacity,
+                              _size=sum(1 for entry in presence if entry >= 0))
+
+
+def _hash_set(process, size):
+    return process.new_object('kotlin.collections.HashSet', backing=_hash_map(process, size, values=False))
+
+
+def _format(process, value, scenario):
+    return format_value(value, scenario.first_child, process.max_children_count)
+
+
+def _main_frame(process):
+    """Stops in a function with a few Kotlin locals, a second thread is in another function."""
+    person = _person(process)
+    process.add_thread([('kfun:demo#main(){}', [('p', 'ObjHeader *', person),
+                                                ('m', 'ObjHeader *', _hash_map(process, 1000)),
+                                                ('n', 'int', 7)]),
+                        ('kfun:demo#run(){}', [('l', 'ObjHeader *', _array_list(process, 1000))]),
+                        ('start_thread', [])])
+    process.add_thread([('kfun:demo#worker(){}', [('p', 'ObjHeader *', person)]), ('start_thread', [])])
+    return person
+
+
+def _globals(process):
+    process.define_global('counter', 'kotlin.Int', 42)
+    process.define_global('greeting', 'kotlin.String', process.new_string('Hello', static=True))
+    process.define_global('people', 'kotlin.Array', _shared(process, 100, 3))
+    return 0
+
+
+def _heap(process):
+    """Heap of a few collections, the histogram counts every object in it."""
+    _array_list(process, 1000)
+    _hash_map(process, 1000)
+    return _person(process)
+
+
+def _meta_object_with_decoy(process):
+    """Object with a meta-object, whose field holds a TypeInfo address as if it was a header of another object."""
+    return process.new_object('demo.Person', meta=True, id=process.classes['demo.Point'].address)
+
+
+def _global_reference(process):
+    """Two points, only the second one is referenced from the storage of a global."""
+    process.new_object('demo.Point', x=1, y=2)
+    point = process.new_object('demo.Point', x=3, y=4)
+    process.define_global('origin', 'demo.Point', point)
+    return point
+
+
+def _heap_find(pattern):
+    """Action listing classes of the objects konan_heap finds, the formatted object is marked with "value"."""
+    def action(process, value, scenario):
+        found = [line.split() for line in _command('konan_heap find ' + pattern)(process, value, scenario)
+                 .splitlines()[:-1]]
+        return ', '.join(('value ' if int(address, 0) == value.unsigned else '') + name
+                         for (address, name, _) in found)
+    return action
+
+
+def _diamond(process):
+    """Tree whose both subtrees reference the same person, so only the root dominates the person."""
+    person = _person(process)
+    return process.new_object('demo.Tree', left=person, right=process.new_object('demo.Tree', left=person))
+
+
+def _retained_sizes(process):
+    """Retained sizes of _diamond objects: trees retain themselves, the person its name and the root everything."""
+    tree = process.classes['demo.Tree'].instance_size
+    person = process.classes['demo.Person'].instance_size
+    name = inferior._align_up(process.array_header_size + 2 * len('John Doe'), process.pointer_size)
+    return _by_retained_size([(2 * tree + person + name, 'demo.Tree'), (person + name, 'demo.Person'),
+                              (name, 'kotlin.String'), (tree, 'demo.Tree')])
+
+
+def _by_retained_size(rows):
+    return ', '.join('{} {}'.format(size, name) for (size, name) in sorted(rows, key=lambda row: (-row[0], row[1])))
+
+
+def _retained(process, value, scenario):
+    """Exports the graph of the value and lists retained sizes of its objects, the biggest first."""
+    output = _command('konan_graph export {:#x} {{output}}/retained.json'.format(value.unsigned),
+                      'konan_graph retained {output}/retained.json')(process, value, scenario)
+    return _by_retained_size([(int(row[0]), row[-1]) for row in map(str.split, output.splitlines()[2:])])
+
+
+def _command(*commands):
+    """Action running the konan_* commands instead of formatting the value, the summary is their output."""
+    def action(process, value, scenario):
+        output = []
+        for command in commands:
+            (name, _, arguments) = command.format(output=_OUTPUT_DIR.name).partition(' ')
+            result = lldb.SBCommandReturnObject()
+            getattr(konan_lldb, name + '_command')(lldb.debugger, arguments, result, {})
+            if not result.Succeeded():
+                raise RuntimeError("{}: {}".format(command, result.GetError().strip()))
+            output.append(result.GetOutput())
+        return ''.join(output)
+    return action
+
+
+def _watch(process, value, scenario):
+    _command('konan_watch clear', 'konan_watch add p')(process, value, scenario)
+
+
+def _predicate_frame(process):
+    """Stops in a function with Kotlin and primitive locals which breakpoint predicates check."""
+    process.define_class('demo.Special', [('value', RT_INT32), ('next', RT_OBJECT)], super_class='demo.Node')
+    person = _person(process)
+    node = process.new_object('demo.Node', value=3, next=process.new_object('demo.Special', value=5, next=0))
+    process.add_thread([('kfun:demo#loop(){}', [('p', 'ObjHeader *', person), ('node', 'ObjHeader *', node),
+                                                ('nil', 'ObjHeader *', 0), ('i', 'int', 7),
+                                                ('d', 'double', float('nan')), ('c', 'char', ord('a'))]),
+                        ('start_thread', [])])
+    return person
+
+
+# Predicates with their outcomes in _predicate_frame, invalid ones raise ValueError when they are compiled and
+# erroneous ones raise DebuggerException when they are evaluated
+_PREDICATES = [
+    ('p.age == 42', True),
+    ('p.age != 42', False),
+    ('p.age >= 40 && p.age < 50', True),
+    ('p.name == "John Doe"', True),
+    ('"John Doe" != p.name', False),
+    ('p.name == "John"', False),
+    ('p.friend.friend.name == "John Doe"', True),
+    ('p.flag && !(p.tag == 8)', True),
+    ('p.flag == false', False),
+    ('p.score > 1.25', True),
+    ('p.id == 0x10000000000', True),
+    ('node.next is demo.Special', True),
+    ('node is demo.Special', False),
+    ('node.next is demo.Node && node !is demo.Special', True),
+    ('node.next.next == null', True),
+    ('nil is demo.Node', False),
+    ('i == 7 || nil.age == 1', True),
+    ('(i < 0 || d == 1.5) && p.age == 42', False),
+    ('d != d', True),
+    ('p.friend == p', True),
+    ('p.age ==', 'invalid'),
+    ('p.age = 1', 'invalid'),
+    ('1 == 1', 'invalid'),
+    ('p.name < "a"', 'invalid'),
+    ('i is demo.Node', False),
+    ('c == 97', 'error'),
+    ('nil.age == 1', 'error'),
+    ('p.bogus == 1', 'error'),
+    ('zz == 1', 'error'),
+    ('node.next is demo.Bogus', 'error'),
+]
+
+
+def _predicates(process, value, scenario):
+    """Action evaluating _PREDICATES in the selected frame, the summary lists the ones with unexpected outcomes."""
+    frame = process.target.GetProcess().GetThreadAtIndex(0).GetFrameAtIndex(0)
+    unexpected = []
+    for (text, expected) in _PREDICATES:
+        try:
+            outcome = bool(konan_lldb.compile_predicate(text)(frame))
+        except ValueError:
+            outcome = 'invalid'
+        except konan_lldb.DebuggerException:
+            outcome = 'error'
+        if outcome != expected:
+            unexpected.append('{} is {}'.format(text, outcome))
+    return ', '.join(unexpected) or 'all {} predicates as expected'.format(len(_PREDICATES))
+
+
+def _break_if(process, value, scenario):
+    for _ in range(2):
+        process.target.BreakpointCreateByLocation('demo.kt', 1)
+    _command('konan_break_if 1 p.name == "John Doe" && node.next is demo.Special && p.age > 10',
+             'konan_break_if 2 c == 97')(process, value, scenario)
+
+
+def _breakpoint_hits(process, value, scenario):
+    """Action hitting the breakpoints of _break_if a hundred times each, every hit is a new stop."""
+    frame = process.target.GetProcess().GetThreadAtIndex(0).GetFrameAtIndex(0)
+    stops = []
+    for breakpoint_id in (1, 2):
+        location = lldb.SBBreakpointLocation(process.target.FindBreakpointByID(breakpoint_id))
+        hits = []
+        for _ in range(100):
+            process.resume()
+            hits.append(konan_lldb.breakpoint_predicate(frame, location, {}))
+        stops.append('breakpoint {} stops {} times'.format(breakpoint_id, sum(hits)))
+    return ', '.join(stops)
+
+
+def _next_page(process, value, scenario):
+    """Shows the first page of children and then the next one."""
+    _format(process, value, scenario)
+    return format_value(value, konan_lldb.ARRAY_WINDOW_SIZE, process.max_children_count)
+
+
+def _library_frame(process, value, scenario):
+    """Stops in a function of a library without Kotlin symbols, which is the module of the selected frame."""
+    process.add_thread([('write', [], process.add_library('/lib/libc.so.6'))])
+
+
+def _previous_session(process, value, scenario):
+    """Formats the value in a session which saves the persistent cache as it fills it, the cold run is then the next
+    session, which doesn't see what the previous one didn't save."""
+    format_value(value, scenario.first_child, process.max_children_count)
+    konan_lldb._PERSISTENT_CACHES.clear()
+    process.restart()
+
+
+def _budget(cold_evaluate, cold_read_memory, warm_evaluate, warm_read_memory):
+    return {('cold', 'evaluate'): cold_evaluate, ('cold', 'read_memory'): cold_read_memory,
+            ('warm', 'evaluate'): warm_evaluate, ('warm', 'read_memory'): warm_read_memory}
+
+
+SCENARIOS = [
+    Scenario('string', lambda p: p.new_string('Hello, World!'), _budget(0, 8, 0, 7)),
+    Scenario('string_long', lambda p: p.new_string('x' * 100000), _budget(0, 8, 0, 7)),
+    Scenario('string_unicode', lambda p: p.new_string('\u043f\u0440\u0438\u0432\u0435\u0442 \U0001F600' * 100),
+             _budget(0, 8, 0, 7)),
+    Scenario('point', lambda p: p.new_object('demo.Point', x=1, y=2), _budget(3, 7, 0, 5)),
+    Scenario('person', _person, _budget(3, 15, 0, 12)),
+    Scenario('int_array_1m', lambda p: p.new_array('kotlin.IntArray', list(range(1000000))), _budget(3, 9, 0, 7)),
+    Scenario('object_array', lambda p: p.new_array('kotlin.Array', [p.new_object('demo.Point', x=i, y=i)
+                                                                     for i in range(1000)]),
+             _budget(4, 1035, 0, 1031)),
+    Scenario('shared_subgraph', lambda p: _shared(p, 1000, 5), _budget(4, 57, 0, 52)),
+    Scenario('linked_list_10k', lambda p: _linked_list(p, 10000), _budget(3, 14, 0, 12)),
+    Scenario('tree_depth_10', lambda p: _tree(p, 10), _budget(3, 45, 0, 42)),
+    Scenario('tree_depth_10_summary', lambda p: _tree(p, 10), _budget(3, 423, 0, 420), settings={'SUMMARY_DEPTH': 4}),
+    Scenario('linked_list_10k_summary', lambda p: _linked_list(p, 10000), _budget(3, 169, 0, 167),
+             settings={'SUMMARY_DEPTH': 100}),
+    Scenario('array_list_10k', lambda p: _array_list(p, 10000), _budget(5, 1042, 0, 1036)),
+    Scenario('hash_map_100k', lambda p: _hash_map(p, 100000), _budget(5, 1516, 0, 1509)),
+    Scenario('hash_map_100k_scroll', lambda p: _hash_map(p, 100000), _budget(5, 2076, 0, 2069), first_child=50000),
+    Scenario('hash_set_10k', lambda p: _hash_set(p, 10000), _budget(6, 1515, 0, 1506)),
+    Scenario('person_persistent_cache', _person, _budget(0, 14, 0, 12), prepare=_previous_session,
+             settings={'PERSISTENT_CACHE': True, 'PERSISTENT_CACHE_DIR': _PERSISTENT_CACHE_DIR.name,
+                       'PERSISTENT_CACHE_SAVE_INTERVAL': 0.0}),
+    Scenario('person_memory', _person, _budget(0, 26, 0, 12), settings={'BACKEND': 'memory'}),
+    Scenario('string_libc_frame', lambda p: p.new_string('Hello, World!'), _budget(0, 8, 0, 7),
+             prepare=_library_frame, summary='Hello, World!'),
+    Scenario('string_libc_frame_memory', lambda p: p.new_string('Hello, World!'), _budget(0, 8, 0, 7),
+             prepare=_library_frame, summary='Hello, World!', settings={'BACKEND': 'memory'}),
+    Scenario('hash_map_100k_memory', lambda p: _hash_map(p, 100000), _budget(0, 1531, 0, 1509),
+             settings={'BACKEND': 'memory'}),
+    Scenario('array_list_10k_next_page', lambda p: _array_list(p, 10000), _budget(5, 2069, 0, 2063),
+             settings={'SUMMARY_DEPTH': 1}, action=_next_page),
+    Scenario('array_list_10k_prefetch', lambda p: _array_list(p, 10000), _budget(5, 1561, 0, 1555),
+             settings={'SUMMARY_DEPTH': 1, 'PREFETCH': True, 'PREFETCH_TIME_SLICE': 1.0}, action=_next_page),
+    Scenario('konan_globals', _globals, _budget(6, 25, 2, 20), action=_command('konan_globals')),
+    Scenario('konan_heap', _heap, _budget(0, 9, 0, 9), action=_command('konan_heap')),
+    Scenario('konan_heap_meta_object', _meta_object_with_decoy, _budget(0, 4, 0, 4), action=_heap_find('demo'),
+             summary='value demo.Person'),
+    Scenario('konan_heap_global_reference', _global_reference, _budget(0, 4, 0, 4), summary='demo.Point, value demo.Point',
+             action=_heap_find('demo')),
+    Scenario('konan_graph_retained', _diamond, _budget(5, 15, 0, 12), action=_retained, summary=_retained_sizes),
+    Scenario('konan_graph', _main_frame, _budget(6, 2015, 0, 2011),
+             action=_command('konan_graph export m {output}/graph.json', 'konan_graph retained {output}/graph.json')),
+    Scenario('konan_bt', _main_frame, _budget(8, 850, 0, 837), action=_command('konan_bt all')),
+    Scenario('konan_watch', _main_frame, _budget(0, 8, 0, 8), prepare=_watch, action=_command('konan_watch')),
+    Scenario('konan_break_if_predicates', _predicate_frame, _budget(0, 113, 0, 77), action=_predicates,
+             summary='all {} predicates as expected'.format(len(_PREDICATES))),
+    Scenario('konan_break_if', _predicate_frame, _budget(0, 1221, 0, 1200), prepare=_break_if,
+             action=_breakpoint_hits, summary='breakpoint 1 stops 100 times, breakpoint 2 stops 100 times'),
+    Scenario('konan_print_batch', _main_frame, _budget(6, 750, 0, 741),
+             action=_command('konan_print_batch p m n')),
+]
+
+
+def format_value(value, first_child, max_children):
+    """Does what LLDB does for `frame variable` of the value."""
+    provider = konan_lldb.KonanProxyTypeProvider(value, {})
+    summary = konan_lldb.kotlin_object_type_summary(value, {})
+    count = provider.num_children()
+    for index in range(first_child, min(count, first_child + max_children)):
+        child = provider.get_child_at_index(index)
+        if child is not None and child.GetTypeName() == 'ObjHeader *':
+            konan_lldb.kotlin_object_type_summary(child, {})
+    return summary
+
+
+def run(scenario, pointer_size, repeat):
+    defaults = {name: getattr(konan_lldb, name) for name in scenario.settings}
+    for name, value in scenario.settings.items():
+        setattr(konan_lldb, name, value)
+    try:
+        return _run(scenario, pointer_size, repeat)
+    finally:
+        for name, value in defaults.items():
+            setattr(konan_lldb, name, value)
+
+
+def _run(scenario, pointer_size, repeat):
+    process = inferior.Inferior(pointer_size=pointer_size)
+    lldb.install(process)
+    _classes(process)
+    address = scenario.build(process)
+    object_type = lldb.parse_c_type('ObjHeader *')
+    value = lldb.SBValue(scenario.name, object_type, raw=process.pack(object_type, address))
+    if scenario.prepare is not None:
+        scenario.prepare(process, value, scenario)
+    result = {'expected_summary': scenario.summary(process) if callable(scenario.summary) else scenario.summary}
+    for phase in ('cold', 'warm'):
+        process.reset_stats()
+        start = time.monotonic()
+        summary = scenario.action(process, value, scenario)
+        elapsed = time.monotonic() - start
+        if phase == 'warm':
+            for _ in range(repeat - 1):
+                process.resume()
+                process.reset_stats()
+                start = time.monotonic()
+                scenario.action(process, value, scenario)
+                elapsed = min(elapsed, time.monotonic() - start)
+        counts = {counter: process.stats[counter] for counter in ('evaluate', 'read_memory', 'read_bytes',
+                                                                  'symbols', 'commands')}
+        result[phase] = dict(counts, ms=1000 * elapsed, summary=summary)
+        process.resume()
+    return result
+
+
+def check(scenario, result):
+    failures = ["{}: {} {} = {} exceeds budget {}".format(scenario.name, phase, counter, result[phase][counter], limit)
+                for ((phase, counter), limit) in sorted(scenario.budget.items()) if result[phase][counter] > limit]
+    expected = result['expected_summary']
+    if expected is not None:
+        failures += ["{}: {} summary {!r} isn't {!r}".format(scenario.name, phase, result[phase]['summary'], expected)
+                     for phase in ('cold', 'warm') if result[phase]['summary'] != expected]
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of Kotlin/Native LLDB formatters.')
+    parser.add_argument('-k', '--filter', default=None, help='regular expression for names of scenarios to run')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of warm runs, the fastest is reported')
+    parser.add_argument('--pointer-size', type=int, choices=(4, 8), default=8, help='pointer size of the inferior')
+    parser.add_argument('--json', default=None, help='file to write results to')
+    args = parser.parse_args()
+
+    results = {}
+    failures = []
+    print("{:<24} {:>6} {:>6} {:>9} {:>6} {:>6} {:>9}  {}".format(
+        'scenario', 'eval', 'reads', 'cold ms', 'eval', 'reads', 'warm ms', 'summary'))
+    for scenario in SCENARIOS:
+        if args.filter and not re.search(args.filter, scenario.name):
+            continue
+        result = run(scenario, args.pointer_size, max(args.repeat, 1))
+        results[scenario.name] = result
+        failures += check(scenario, result)
+        cold, warm = result['cold'], result['warm']
+        print("{:<24} {:>6} {:>6} {:>9.2f} {:>6} {:>6} {:>9.2f}  {}".format(
+            scenario.name, cold['evaluate'], cold['read_memory'], cold['ms'], warm['evaluate'], warm['read_memory'],
+            warm['ms'], cold['summary'].partition('\n')[0][:40]))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
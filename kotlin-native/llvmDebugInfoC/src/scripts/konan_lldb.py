@@ -29,6 +29,14 @@ import os
 import time
 import io
 import traceback
+import argparse
+import bisect
+import shlex
+import json
+import atexit
+import gzip
+import tempfile
+from collections import OrderedDict, deque
 
 NULL = 'null'
 logging=False
@@ -41,64 +49,418 @@ def log(msg):
         sys.stderr.write('\n')
     exelog(msg)
 
+_EXELOG_FILE = None
+
 def exelog(stmt):
+    global _EXELOG_FILE
     if exe_logging:
-        f = open(os.getenv('HOME', '') + "/lldbexelog.txt", "a")
-        f.write(stmt())
-        f.write("\n")
-        f.close()
+        if _EXELOG_FILE is None:
+            # Line buffered: LLDB never runs atexit handlers, and the last lines before a hang matter most
+            _EXELOG_FILE = open(os.getenv('HOME', '') + "/lldbexelog.txt", "a", buffering=1)
+            atexit.register(_EXELOG_FILE.close)
+        _EXELOG_FILE.write(stmt())
+        _EXELOG_FILE.write("\n")
 
 def bench(start, msg):
     if bench_logging:
         print("{}: {}".format(msg(), time.monotonic() - start))
 
+
+class _Profile:
+    """Ring buffer of (category, detail, start, duration) records of the calls into the debugger
+    and of the formatter entry points, filled only when profiling is on."""
+    def __init__(self, capacity):
+        self.enabled = False
+        self.records = deque(maxlen=capacity)
+
+    def record(self, category, detail, start):
+        if self.enabled:
+            self.records.append((category, detail, start, time.monotonic() - start))
+
+    def resize(self, capacity):
+        self.records = deque(self.records, maxlen=capacity)
+
+
+PROFILE_BUFFER_SIZE = 100000
+PROFILE = _Profile(PROFILE_BUFFER_SIZE)
+
+
+# Number of expressions evaluated so far, to limit them per summary
+_EVALUATIONS = 0
+
+
 def evaluate(expr):
+    global _EVALUATIONS
+    _EVALUATIONS += 1
+    start = time.monotonic()
     result = lldb.debugger.GetSelectedTarget().EvaluateExpression(expr)
+    PROFILE.record('evaluate', expr, start)
     log(lambda : "evaluate: {} => {}".format(expr, result))
     return result
 
 
+def read_memory(process, address, size, error):
+    start = time.monotonic()
+    data = process.ReadMemory(address, size, error)
+    PROFILE.record('read_memory', size, start)
+    return data
+
+
+def read_pointer(process, address, error):
+    start = time.monotonic()
+    pointer = process.ReadPointerFromMemory(address, error)
+    PROFILE.record('read_memory', process.GetAddressByteSize(), start)
+    return pointer
+
+
+def read_unsigned(process, address, size, error):
+    start = time.monotonic()
+    value = process.ReadUnsignedFromMemory(address, size, error)
+    PROFILE.record('read_memory', size, start)
+    return value
+
+
 class DebuggerException(Exception):
     pass
 
 
+def _process_generation():
+    """Changes when process is restarted or modules are loaded/unloaded, so everything computed from the binary
+    layout (TypeInfo addresses, field layouts) has to be recomputed."""
+    target = lldb.debugger.GetSelectedTarget()
+    return target.GetProcess().GetUniqueID(), target.GetNumModules()
+
+
+def _stop_generation():
+    """Changes every time process stops, so everything computed from the process state has to be recomputed."""
+    process = lldb.debugger.GetSelectedTarget().GetProcess()
+    return process.GetUniqueID(), process.GetStopID()
+
+
+class _LruCache:
+    """Cache of limited capacity which evicts least recently used entries and is dropped as a whole
+    when value returned by generation function changes."""
+    def __init__(self, capacity, generation=_process_generation):
+        self._capacity = capacity
+        self._generation = generation
+        self._current = None
+        self._entries = OrderedDict()
+
+    def _validate(self):
+        current = self._generation()
+        if current != self._current:
+            self._entries.clear()
+            self._current = current
+
+    def get(self, key):
+        self._validate()
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._validate()
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._capacity:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
 _OUTPUT_MAX_CHILDREN = re.compile(r"target.max-children-count \(int\) = (.*)\n")
+# target.max-children-count setting, re-read on every stop
+_MAX_CHILDREN_COUNT = _LruCache(1, _stop_generation)
+
+
 def _max_children_count():
-    result = lldb.SBCommandReturnObject()
-    lldb.debugger.GetCommandInterpreter().HandleCommand("settings show target.max-children-count", result, False)
-    if not result.Succeeded():
-        raise DebuggerException()
-    v = _OUTPUT_MAX_CHILDREN.search(result.GetOutput()).group(1)
-    return int(v)
+    max_children_count = _MAX_CHILDREN_COUNT.get('target.max-children-count')
+    if max_children_count is not None:
+        return max_children_count
+    debugger = lldb.debugger
+    values = debugger.GetInternalVariableValue('target.max-children-count', debugger.GetInstanceName())
+    if values.GetSize() > 0:
+        max_children_count = int(values.GetStringAtIndex(0))
+    else:
+        result = lldb.SBCommandReturnObject()
+        debugger.GetCommandInterpreter().HandleCommand("settings show target.max-children-count", result, False)
+        if not result.Succeeded():
+            raise DebuggerException()
+        max_children_count = int(_OUTPUT_MAX_CHILDREN.search(result.GetOutput()).group(1))
+    return _MAX_CHILDREN_COUNT.put('target.max-children-count', max_children_count)
+
+
+class _SymbolIndex:
+    """Index of module symbols built with a single pass over the symbol table: name to symbol, lazily built load
+    address to symbols map, and sorted names for lookups by prefix such as kclass:, kfun: or kvar:."""
+    def __init__(self, module, target):
+        start = time.monotonic()
+        self._module = module
+        self._target = target
+        self._by_name = {}
+        for index in range(module.GetNumSymbols()):
+            name = module.GetSymbolAtIndex(index).GetName()
+            if name is not None and name not in self._by_name:
+                self._by_name[name] = index
+        self._addresses = {}
+        self._by_address = None
+        self._sorted_names = None
+        bench(start, lambda: "_SymbolIndex({}) = {} names".format(module.GetFileSpec(), len(self._by_name)))
+
+    def names(self):
+        """All distinct symbol names in order of the symbol table."""
+        return self._by_name.keys()
+
+    def names_with_prefix(self, prefix):
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self._by_name.keys())
+        index = bisect.bisect_left(self._sorted_names, prefix)
+        while index < len(self._sorted_names) and self._sorted_names[index].startswith(prefix):
+            yield self._sorted_names[index]
+            index += 1
+
+    def symbol(self, name):
+        index = self._by_name.get(name)
+        return self._module.GetSymbolAtIndex(index) if index is not None else None
+
+    def address(self, name):
+        if name not in self._addresses:
+            symbol = self.symbol(name)
+            self._addresses[name] = symbol.GetStartAddress().GetLoadAddress(self._target) if symbol else None
+        return self._addresses[name]
+
+    def symbols_at(self, address):
+        if self._by_address is None:
+            self._by_address = {}
+            for index in range(self._module.GetNumSymbols()):
+                symbol_address = self._module.GetSymbolAtIndex(index).GetStartAddress().GetLoadAddress(self._target)
+                self._by_address.setdefault(symbol_address, []).append(index)
+        return [self._module.GetSymbolAtIndex(index) for index in self._by_address.get(address, [])]
+
+
+# Cache module to its _SymbolIndex, indexes are rebuilt when modules are loaded or unloaded
+SYMBOL_INDEX_CACHE = _LruCache(16)
+
+
+def _current_module(target):
+    frame = target.GetProcess().GetSelectedThread().GetSelectedFrame()
+    module = frame.GetModule() if frame.IsValid() else None
+    return module if module is not None and module.IsValid() else target.GetModuleAtIndex(0)
+
+
+def symbol_index(debugger=None, module=None):
+    target = (debugger or lldb.debugger).GetSelectedTarget()
+    module = module or _current_module(target)
+    key = (str(module.GetFileSpec()), module.GetUUIDString())
+    index = SYMBOL_INDEX_CACHE.get(key)
+    if index is None:
+        index = SYMBOL_INDEX_CACHE.put(key, _SymbolIndex(module, target))
+    return index
 
 
 def _symbol_loaded_address(name, debugger = lldb.debugger):
-    target = debugger.GetSelectedTarget()
-    process = target.GetProcess()
-    thread = process.GetSelectedThread()
-    frame = thread.GetSelectedFrame()
-    candidates = list(filter(lambda x: x.name == name, frame.module.symbols))
-    # take first
-    for candidate in candidates:
-        address = candidate.GetStartAddress().GetLoadAddress(target)
-        log(lambda: "_symbol_loaded_address:{} {:#x}".format(name, address))
-        return address
+    address = symbol_index(debugger).address(name)
+    log(lambda: "_symbol_loaded_address:{} {}".format(name, address))
+    return address
 
 def _type_info_by_address(address, debugger = lldb.debugger):
-    target = debugger.GetSelectedTarget()
-    process = target.GetProcess()
-    thread = process.GetSelectedThread()
-    frame = thread.GetSelectedFrame()
-    candidates = list(filter(lambda x: x.GetStartAddress().GetLoadAddress(target) == address, frame.module.symbols))
-    return candidates
+    return symbol_index(debugger).symbols_at(address)
 
 def is_instance_of(addr, typeinfo):
     return evaluate("(bool)IsInstance({:#x}, {:#x})".format(addr, typeinfo)).GetValue() == "true"
 
-def is_string_or_array(value):
+class _PersistentCache:
+    """Type layouts and runtime symbols of a module kept on disk between debugging sessions in a file named by the
+    module UUID. Addresses are file addresses, which don't depend on where the module is loaded. The file is read on
+    the first lookup and replaced atomically on save, merged with what other sessions have saved meanwhile. LLDB never
+    runs atexit handlers, so changes are saved as they are made, at most once per PERSISTENT_CACHE_SAVE_INTERVAL."""
+    VERSION = 1
+
+    def __init__(self, path):
+        self._path = path
+        self._data = None
+        self._dirty = False
+        self._saved_at = None
+
+    def _read(self):
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if isinstance(data, dict) and data.get('version') == self.VERSION else None
+
+    def _entries(self, kind):
+        if self._data is None:
+            self._data = self._read() or {'version': self.VERSION, 'layouts': {}, 'symbols': {}}
+        return self._data[kind]
+
+    def layout(self, file_address):
+        entry = self._entries('layouts').get(str(file_address))
+        return TypeLayout(*entry) if entry is not None else None
+
+    def put_layout(self, file_address, layout):
+        self._entries('layouts')[str(file_address)] = [layout.fields_count, layout.offsets, layout.types, layout.names]
+        self._dirty = True
+        self.save_if_due()
+
+    def symbol(self, name):
+        """File address of the symbol, None if it isn't known."""
+        return self._entries('symbols').get(name)
+
+    def put_symbol(self, name, file_address):
+        self._entries('symbols')[name] = file_address
+        self._dirty = True
+        self.save_if_due()
+
+    def save_if_due(self):
+        """Saves the changes unless the cache was saved less than PERSISTENT_CACHE_SAVE_INTERVAL seconds ago, then
+        they are saved by a later change or lookup."""
+        now = time.monotonic()
+        if not self._dirty or self._saved_at is not None and now - self._saved_at < PERSISTENT_CACHE_SAVE_INTERVAL:
+            return
+        self._saved_at = now
+        try:
+            self.save()
+        except OSError as e:
+            log(lambda: "_PersistentCache.save({}): {}".format(self._path, e))
+
+    def save(self):
+        if not self._dirty:
+            return
+        saved = self._read()
+        if saved is not None:
+            for kind in ('layouts', 'symbols'):
+                saved[kind].update(self._data[kind])
+            self._data = saved
+        directory = os.path.dirname(self._path)
+        os.makedirs(directory, exist_ok=True)
+        (fd, temporary) = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self._path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._data, f)
+            os.replace(temporary, self._path)
+        except OSError:
+            os.unlink(temporary)
+            raise
+        self._dirty = False
+
+
+# Module UUID to its _PersistentCache
+_PERSISTENT_CACHES = {}
+
+
+def persistent_cache(module):
+    """Persistent cache of the module, None if it's disabled or the module has no UUID to tell its builds apart."""
+    if not PERSISTENT_CACHE or module is None or not module.IsValid():
+        return None
+    uuid = module.GetUUIDString()
+    if not uuid:
+        return None
+    cache = _PERSISTENT_CACHES.get(uuid)
+    if cache is None:
+        cache = _PERSISTENT_CACHES[uuid] = _PersistentCache(
+            os.path.join(os.path.expanduser(PERSISTENT_CACHE_DIR), '{}.json'.format(uuid)))
+    cache.save_if_due()
+    return cache
+
+
+def save_persistent_caches():
+    for cache in _PERSISTENT_CACHES.values():
+        try:
+            cache.save()
+        except OSError as e:
+            log(lambda: "save_persistent_caches: {}".format(e))
+
+
+
+_RUNTIME_SYMBOLS = _LruCache(64)
+# Cache type info pointer to kind of the object: 1 for strings, 2 for arrays and 0 otherwise
+_TYPE_INFO_KINDS = _LruCache(4096)
+
+
+def _symbol_module(target, tip):
+    """Module defining the type info, the module of the selected frame may be a system library without Kotlin
+    symbols."""
+    module = target.ResolveLoadAddress(tip).GetModule() if tip else None
+    return module if module is not None and module.IsValid() else _current_module(target)
+
+
+def _runtime_symbol(name, tip=None):
+    """Load address of the runtime symbol in the module of the type info tip or None, misses aren't cached as the
+    symbol may be found once another frame is selected or its module is loaded."""
+    target = lldb.debugger.GetSelectedTarget()
+    module = _symbol_module(target, tip)
+    key = (str(module.GetFileSpec()), module.GetUUIDString(), name)
+    address = _RUNTIME_SYMBOLS.get(key)
+    if address is None:
+        address = _persistent_symbol_address(target, module, name)
+        if address:
+            _RUNTIME_SYMBOLS.put(key, address)
+    return address or None
+
+
+def _persistent_symbol_address(target, module, name):
+    """Load address of the symbol of the module or 0, the persistent cache is looked up before symbols."""
+    cache = persistent_cache(module)
+    file_address = cache.symbol(name) if cache is not None else None
+    if file_address:
+        return module.ResolveFileAddress(file_address).GetLoadAddress(target)
+    address = symbol_index(module=module).address(name) or 0
+    log(lambda: "_persistent_symbol_address:{} {}".format(name, address))
+    if cache is not None and address:
+        cache.put_symbol(name, target.ResolveLoadAddress(address).GetFileAddress())
+    return address
+
+
+def _memory_layout_known(process):
+    return process.IsValid() and process.GetAddressByteSize() in (4, 8)
+
+
+def memory_only(process=None):
+    """Whether Kotlin values have to be decoded from memory alone, without running code in the process: always for
+    the memory backend, and for the auto one when the process can't run code, as for core files."""
+    if BACKEND != 'auto':
+        return BACKEND == 'memory'
+    process = process or lldb.debugger.GetSelectedTarget().GetProcess()
+    if not process.IsValid():
+        return True
+    plugin = process.GetPluginName() or ''
+    return 'core' in plugin or plugin == 'minidump'
+
+
+def _type_info_kind(process, tip):
+    """Strings are distinguished by type info of kotlin.String, arrays have negative TypeInfo::instanceSize_."""
+    kind = _TYPE_INFO_KINDS.get(tip)
+    if kind is not None:
+        return kind
+    string_tip = _runtime_symbol('kclass:kotlin.String', tip)
+    if string_tip is None and not memory_only(process):
+        return None
+    error = lldb.SBError()
+    pointer_size = process.GetAddressByteSize()
+    instance_size = read_unsigned(process, tip + 2 * pointer_size + 4, 4, error)
+    if not error.Success():
+        return None
+    kind = 1 if tip == string_tip else 2 if instance_size & 0x80000000 else 0
+    return _TYPE_INFO_KINDS.put(tip, kind) if string_tip is not None else kind
+
+
+def is_string_or_array(value, tip=None):
     start = time.monotonic()
-    soa = evaluate("(int)IsInstance({0:#x}, {1:#x}) ? 1 : ((int)Konan_DebugIsArray({0:#x})) ? 2 : 0)"
-                   .format(value.unsigned, _symbol_loaded_address('kclass:kotlin.String'))).unsigned
+    process = lldb.debugger.GetSelectedTarget().GetProcess()
+    tip = tip or type_info(value)
+    soa = _type_info_kind(process, tip) if tip and _memory_layout_known(process) else None
+    if soa is None and not memory_only(process):
+        string_tip = _runtime_symbol('kclass:kotlin.String', tip)
+        soa = evaluate("(int)IsInstance({0:#x}, {1:#x}) ? 1 : ((int)Konan_DebugIsArray({0:#x})) ? 2 : 0)"
+                       .format(value.unsigned, string_tip)).unsigned if string_tip is not None else 0
     log(lambda: "is_string_or_array:{:#x}:{}".format(value.unsigned, soa))
     bench(start, lambda: "is_string_or_array({:#x}) = {}".format(value.unsigned, soa))
     return soa
@@ -109,6 +471,13 @@ def type_info(value):
     log(lambda: "type_info({:#x}: {})".format(value.unsigned, value.GetTypeName()))
     if value.GetTypeName() != "ObjHeader *":
         return None
+    process = lldb.debugger.GetSelectedTarget().GetProcess()
+    if _memory_layout_known(process):
+        error = lldb.SBError()
+        header = read_pointer(process, value.unsigned, error) & ~0x3
+        tip = read_pointer(process, header, error) if error.Success() else 0
+        tip_self = read_pointer(process, tip, error) if error.Success() else 0
+        return tip if error.Success() and tip != 0 and tip == tip_self else None
     expr = "*(void **)((uintptr_t)(*(void**){0:#x}) & ~0x3) == **(void***)((uintptr_t)(*(void**){0:#x}) & ~0x3) " \
            "? *(void **)((uintptr_t)(*(void**){0:#x}) & ~0x3) : (void *)0".format(value.unsigned)
     result = evaluate(expr)
@@ -116,43 +485,307 @@ def type_info(value):
     return result.unsigned if result.IsValid() and result.unsigned != 0 else None
 
 
+class TypeLayout:
+    """Layout of Kotlin type: names, runtime types (see Konan_RuntimeType) and offsets of fields from the object
+    address. For arrays fields_count is negated runtime type of elements, see ExtendedTypeInfo in TypeInfo.h."""
+    def __init__(self, fields_count, offsets, types, names):
+        self.fields_count = fields_count
+        self.offsets = offsets
+        self.types = types
+        self.names = names
+
+    def is_array(self):
+        return self.fields_count < 0
+
+    def field_count(self):
+        return max(self.fields_count, 0)
+
+
+_DEBUG_BUFFER = {}
+# Cache type info pointer to TypeLayout
+LAYOUT_CACHE_SIZE = 4096
+SYNTHETIC_OBJECT_LAYOUT_CACHE = _LruCache(LAYOUT_CACHE_SIZE)
+
+
+def _byte_order(target):
+    return '>' if target.GetByteOrder() == lldb.eByteOrderBig else '<'
+
+
+def _align_up(value, alignment):
+    return (value + alignment - 1) & ~(alignment - 1)
+
+
+# Konan_RuntimeType to struct format of the value, see runtimeTypeSize in KDebug.cpp, pointers are sized by target.
+_RUNTIME_TYPE_FORMAT = [None, 'P', 'b', 'h', 'i', 'q', 'f', 'd', 'P', '?']
+
+
+def _runtime_type_format(runtime_type, pointer_size):
+    if runtime_type <= 0 or runtime_type >= len(_RUNTIME_TYPE_FORMAT):
+        return None
+    value_format = _RUNTIME_TYPE_FORMAT[runtime_type]
+    return value_format if value_format != 'P' else ('Q' if pointer_size == 8 else 'I')
+
+
+def _array_header_size(pointer_size):
+    """sizeof(ArrayHeader): type info pointer and 32-bit elements count."""
+    return _align_up(pointer_size + 4, pointer_size)
+
+
+def _array_count(process, address):
+    error = lldb.SBError()
+    count = read_unsigned(process, address + process.GetAddressByteSize(), 4, error)
+    return count if error.Success() else None
+
+
+def _debug_buffer(process):
+    """Address and size of the debug buffer in the inferior, they don't change during the process life."""
+    key = process.GetUniqueID()
+    if key not in _DEBUG_BUFFER:
+        address = evaluate("(void *)Konan_DebugBuffer()").unsigned
+        size = evaluate("(int)Konan_DebugBufferSize()").signed
+        _DEBUG_BUFFER.clear()
+        _DEBUG_BUFFER[key] = (address, size)
+    return _DEBUG_BUFFER[key]
+
+
+def _decode_type_layout(blob, byte_order):
+    fields_count = struct.unpack_from(byte_order + 'i', blob, 0)[0]
+    count = max(fields_count, 0)
+    offsets = struct.unpack_from('{}{}i'.format(byte_order, count), blob, 4)
+    types = struct.unpack_from('{}B'.format(count), blob, 4 + 4 * count)
+    names = [name.decode('utf-8') for name in bytes(blob[4 + 5 * count:]).split(b'\0')[:count]]
+    return TypeLayout(fields_count, list(offsets), list(types), names)
+
+
+def _type_layout_by_fields(address, is_array):
+    """Fallback for binaries without Konan_DebugGetTypeLayout: asks for every field separately."""
+    if is_array:
+        return TypeLayout(-evaluate("(int)Konan_DebugGetFieldType({:#x}, 0)".format(address)).signed, [], [], [])
+    process = lldb.debugger.GetSelectedTarget().GetProcess()
+    count = evaluate("(int)Konan_DebugGetFieldCount({:#x})".format(address)).signed
+    offsets, types, names = [], [], []
+    for index in range(count):
+        error = lldb.SBError()
+        name = process.ReadCStringFromMemory(
+            evaluate("(char *)Konan_DebugGetFieldName({:#x}, (int){})".format(address, index)).unsigned, 0x1000, error)
+        if not error.Success():
+            raise DebuggerException()
+        names.append(name)
+        types.append(evaluate("(int)Konan_DebugGetFieldType({:#x}, {})".format(address, index)).unsigned)
+        offsets.append(
+            evaluate("(void *)Konan_DebugGetFieldAddress({:#x}, {})".format(address, index)).unsigned - address)
+    return TypeLayout(count, offsets, types, names)
+
+
+def type_layout(value, tip=None, is_array=False):
+    """Fetches layout of the object type with a single call into the process, see Konan_DebugGetTypeLayout.
+    Layouts are cached by type info pointer, so it's done once per class."""
+    return _type_layout_at(value.unsigned, tip, is_array)
+
+
+def _type_layout_from_memory(process, tip):
+    """Decodes layout from ExtendedTypeInfo of the type, which the runtime functions read too, None if it can't be
+    read, e.g. the binary is compiled without debug info for the type."""
+    pointer_size = process.GetAddressByteSize()
+    byte_order = _byte_order(process.GetTarget())
+    pointer_format = 'Q' if pointer_size == 8 else 'I'
+    error = lldb.SBError()
+    extended_info = read_pointer(process, tip + pointer_size, error)
+    if not error.Success() or not extended_info:
+        return None
+    blob = read_memory(process, extended_info, 4 * pointer_size, error)
+    if not error.Success():
+        return None
+    fields_count = struct.unpack_from(byte_order + 'i', blob, 0)[0]
+    if fields_count <= 0:
+        return TypeLayout(fields_count, [], [], [])
+    (offsets_address, types_address, names_address) = struct.unpack_from(
+        byte_order + 3 * pointer_format, blob, pointer_size)
+    offsets = read_memory(process, offsets_address, 4 * fields_count, error) if error.Success() else None
+    types = read_memory(process, types_address, fields_count, error) if error.Success() else None
+    names = read_memory(process, names_address, pointer_size * fields_count, error) if error.Success() else None
+    if not error.Success():
+        return None
+    names = [process.ReadCStringFromMemory(name, 0x1000, error) for name in struct.unpack(
+        '{}{}{}'.format(byte_order, fields_count, pointer_format), names)]
+    if not error.Success():
+        return None
+    return TypeLayout(fields_count, list(struct.unpack('{}{}i'.format(byte_order, fields_count), offsets)),
+                      list(bytes(types)), names)
+
+
+def _type_layout_at(address, tip, is_array):
+    if not tip:
+        return _fetch_type_layout(address, tip, is_array)
+    layout = SYNTHETIC_OBJECT_LAYOUT_CACHE.get(tip)
+    if layout is not None:
+        return layout
+    resolved = lldb.debugger.GetSelectedTarget().ResolveLoadAddress(tip)
+    cache = persistent_cache(resolved.GetModule())
+    layout = cache.layout(resolved.GetFileAddress()) if cache is not None else None
+    if layout is None:
+        layout = _fetch_type_layout(address, tip, is_array)
+        if cache is not None:
+            cache.put_layout(resolved.GetFileAddress(), layout)
+    return SYNTHETIC_OBJECT_LAYOUT_CACHE.put(tip, layout)
+
+
+def _fetch_type_layout(address, tip, is_array):
+    start = time.monotonic()
+    target = lldb.debugger.GetSelectedTarget()
+    process = target.GetProcess()
+    if memory_only(process):
+        layout = _type_layout_from_memory(process, tip) if tip else None
+        if layout is None:
+            raise DebuggerException()
+        log(lambda: "type_layout({:#x}) = {}:{} from memory".format(address, layout.fields_count, layout.names))
+        return layout
+    (buffer_address, buffer_size) = _debug_buffer(process)
+    result = evaluate("(int)Konan_DebugGetTypeLayout({:#x}, (char *){:#x}, (int){})".format(
+        address, buffer_address, buffer_size)) if buffer_address else None
+    size = result.signed if result is not None and result.GetError().Success() else 0
+    if size <= 0:
+        log(lambda: "type_layout({:#x}): no batched layout ({}), fallback".format(address, size))
+        layout = _type_layout_by_fields(address, is_array)
+    else:
+        error = lldb.SBError()
+        blob = read_memory(process, buffer_address, size, error)
+        if not error.Success():
+            raise DebuggerException()
+        layout = _decode_type_layout(blob, _byte_order(target))
+    log(lambda: "type_layout({:#x}) = {}:{}".format(address, layout.fields_count, layout.names))
+    bench(start, lambda: "type_layout({:#x})".format(address))
+    return layout
+
+
 __FACTORY = {}
 
 
-# Cache type info pointer to [ChildMetaInfo]
-SYNTHETIC_OBJECT_LAYOUT_CACHE = {}
+# Depth up to which nested objects are expanded by to_string() of providers
 TO_STRING_DEPTH = 2
+# Depth up to which nested objects are expanded in the summaries shown by lldb, 1 shows primitive fields and
+# elements, the summary budget and cycle checks keep deeper ones bounded
+SUMMARY_DEPTH = 1
+# Summaries are computed recursively, so depth is limited to stay far from python recursion limit
+_MAX_SUMMARY_DEPTH = 32
+# Maximal number of fields or elements shown for nested objects
 ARRAY_TO_STRING_LIMIT = 10
+# Time in seconds and number of expression evaluations a single summary may take, the rest is shown as ...
+SUMMARY_TIME_BUDGET = 0.5
+SUMMARY_EVALUATION_BUDGET = 20
+# Number of array elements fetched from the process with a single read
+ARRAY_WINDOW_SIZE = 256
+# Number of pages of children kept by every synthetic provider
+CHILDREN_PAGE_CACHE_SIZE = 16
+# Show logical elements of ArrayList, HashMap and HashSet instead of their fields
+COLLECTION_VIEWS = True
+# 'memory' decodes strings reading their characters directly, 'runtime' asks Konan_DebugObjectToUtf8Array
+STRING_DECODING = 'memory'
+# Maximal number of characters of a string fetched for its summary
+STRING_SUMMARY_LIMIT = 1024
+# Maximal number of fields or elements shown in a summary, in addition to target.max-children-count
+SUMMARY_ELEMENT_LIMIT = 100
+# Size of memory blocks read at once when konan_heap scans the process memory
+HEAP_SCAN_CHUNK_SIZE = 1 << 20
+# Keep type layouts and runtime symbols of modules on disk, so that they aren't fetched again in the next sessions
+PERSISTENT_CACHE = True
+PERSISTENT_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', '~/.cache'), 'konan_lldb')
+# Minimal time in seconds between saves of a persistent cache, changes made meanwhile are saved together
+PERSISTENT_CACHE_SAVE_INTERVAL = 1.0
+# 'runtime' calls Konan_Debug* functions in the process, 'memory' decodes values from memory alone, 'auto' does
+# the latter only when the process can't run code, as for core files
+BACKEND = 'auto'
+# Read ahead the pages of children following the shown ones and the first PREFETCH_OBJECT_SIZE bytes of at most
+# PREFETCH_OBJECTS objects referenced from them, keeping at most PREFETCH_CACHE_SIZE memory blocks, for at most
+# PREFETCH_TIME_SLICE seconds after a page of children is read
+PREFETCH = False
+PREFETCH_PAGES = 2
+PREFETCH_OBJECTS = 256
+PREFETCH_OBJECT_SIZE = 256
+PREFETCH_CACHE_SIZE = 1024
+PREFETCH_TIME_SLICE = 0.05
+# Maximal size of the blocks merged into a single read
+_PREFETCH_READ_LIMIT = 1 << 16
+
+# Settings which can be changed with konan_settings command, with allowed values if they are restricted.
+_SETTINGS = {
+    'ARRAY_TO_STRING_LIMIT': None,
+    'ARRAY_WINDOW_SIZE': None,
+    'BACKEND': ('auto', 'memory', 'runtime'),
+    'CHILDREN_PAGE_CACHE_SIZE': None,
+    'COLLECTION_VIEWS': None,
+    'HEAP_SCAN_CHUNK_SIZE': None,
+    'PERSISTENT_CACHE': None,
+    'PERSISTENT_CACHE_DIR': None,
+    'PERSISTENT_CACHE_SAVE_INTERVAL': None,
+    'PREFETCH': None,
+    'PREFETCH_CACHE_SIZE': None,
+    'PREFETCH_OBJECTS': None,
+    'PREFETCH_OBJECT_SIZE': None,
+    'PREFETCH_PAGES': None,
+    'PREFETCH_TIME_SLICE': None,
+    'STRING_DECODING': ('memory', 'runtime'),
+    'STRING_SUMMARY_LIMIT': None,
+    'SUMMARY_DEPTH': None,
+    'SUMMARY_ELEMENT_LIMIT': None,
+    'SUMMARY_EVALUATION_BUDGET': None,
+    'SUMMARY_TIME_BUDGET': None,
+    'TO_STRING_DEPTH': None,
+}
+
+# SBTypes of values of every Konan_RuntimeType, resolved once per target
+_RUNTIME_SBTYPES = _LruCache(1)
+_RUNTIME_BASIC_TYPES = [lldb.eBasicTypeChar, lldb.eBasicTypeShort, lldb.eBasicTypeInt, lldb.eBasicTypeLongLong,
+                        lldb.eBasicTypeFloat, lldb.eBasicTypeDouble]
+
+
+def runtime_types(value):
+    """SBTypes indexed by Konan_RuntimeType, objects get the type of the value, that is ObjHeader *."""
+    types = _RUNTIME_SBTYPES.get('types')
+    if types is None:
+        object_type = value.GetType()
+        void_pointer = object_type.GetBasicType(lldb.eBasicTypeVoid).GetPointerType()
+        types = _RUNTIME_SBTYPES.put('types', [void_pointer, object_type] +
+                                     [object_type.GetBasicType(kind) for kind in _RUNTIME_BASIC_TYPES] +
+                                     [void_pointer, object_type.GetBasicType(lldb.eBasicTypeBool)])
+    return types
+
+
+def value_at(value, address, runtime_type, name):
+    """Child of the value located at the address, None for unknown runtime types."""
+    types = runtime_types(value)
+    if not 0 <= runtime_type < len(types):
+        return None
+    return value.CreateValueFromAddress(name, address, types[runtime_type])
+
+
+# Provider kinds and summaries of the objects computed at the current stop, by object address
+OBJECT_CACHE_SIZE = 4096
+_OBJECT_KINDS = _LruCache(OBJECT_CACHE_SIZE, _stop_generation)
+_OBJECT_SUMMARIES = _LruCache(OBJECT_CACHE_SIZE, _stop_generation)
+# Addresses of the objects which summaries are being computed, an object met again is a cycle
+_FORMATTING = set()
+CYCLE = '[...]'
+
+
+def object_kind(value):
+    """Type info and provider kind of the object, computed once per stop."""
+    address = value.unsigned
+    cached = _OBJECT_KINDS.get(address)
+    if cached is None:
+        tip = type_info(value)
+        cached = _OBJECT_KINDS.put(address, (tip, _provider_kind(value, tip) if tip else None))
+    return cached
 
-_TYPE_CONVERSION = [
-     lambda obj, value, address, name: value.CreateValueFromExpression(name, "(void *){:#x}".format(address)),
-     lambda obj, value, address, name: value.CreateValueFromAddress(name, address, value.type),
-     lambda obj, value, address, name: value.CreateValueFromExpression(name, "(int8_t *){:#x}".format(address)),
-     lambda obj, value, address, name: value.CreateValueFromExpression(name, "(int16_t *){:#x}".format(address)),
-     lambda obj, value, address, name: value.CreateValueFromExpression(name, "(int32_t *){:#x}".format(address)),
-     lambda obj, value, address, name: value.CreateValueFromExpression(name, "(int64_t *){:#x}".format(address)),
-     lambda obj, value, address, name: value.CreateValueFromExpression(name, "(float *){:#x}".format(address)),
-     lambda obj, value, address, name: value.CreateValueFromExpression(name, "(double *){:#x}".format(address)),
-     lambda obj, value, address, name: value.CreateValueFromExpression(name, "(void **){:#x}".format(address)),
-     lambda obj, value, address, name: value.CreateValueFromExpression(name, "(bool *){:#x}".format(address)),
-     lambda obj, value, address, name: None]
-
-_TYPES = [
-      lambda x: x.GetType().GetBasicType(lldb.eBasicTypeVoid).GetPointerType(),
-      lambda x: x.GetType(),
-      lambda x: x.GetType().GetBasicType(lldb.eBasicTypeChar),
-      lambda x: x.GetType().GetBasicType(lldb.eBasicTypeShort),
-      lambda x: x.GetType().GetBasicType(lldb.eBasicTypeInt),
-      lambda x: x.GetType().GetBasicType(lldb.eBasicTypeLongLong),
-      lambda x: x.GetType().GetBasicType(lldb.eBasicTypeFloat),
-      lambda x: x.GetType().GetBasicType(lldb.eBasicTypeDouble),
-      lambda x: x.GetType().GetBasicType(lldb.eBasicTypeVoid).GetPointerType(),
-      lambda x: x.GetType().GetBasicType(lldb.eBasicTypeBool)
-]
 
 def kotlin_object_type_summary(lldb_val, internal_dict = {}):
     """Hook that is run by lldb to display a Kotlin object."""
-    start = time.monotonic()
+    return object_summary(lldb_val, internal_dict)
+
+
+def object_summary(lldb_val, internal_dict = {}, budget=None):
+    """Summary of a Kotlin object, computed within the budget of the command showing it or a budget of its own."""
+    start = entry = time.monotonic()
     log(lambda: "kotlin_object_type_summary({:#x}: {})".format(lldb_val.unsigned, lldb_val.type.name))
     fallback = lldb_val.GetValue()
     if lldb_val.GetTypeName() != "ObjHeader *":
@@ -162,35 +795,192 @@ def kotlin_object_type_summary(lldb_val, internal_dict = {}):
         bench(start, lambda: "kotlin_object_type_summary:({:#x}) = {}".format(lldb_val.unsigned, lldb_val.signed))
         return lldb_val.value
 
-    if lldb_val.unsigned == 0:
+    address = lldb_val.unsigned
+    if address == 0:
             bench(start, lambda: "kotlin_object_type_summary:({:#x}) = NULL".format(lldb_val.unsigned))
             return NULL
-    tip = internal_dict["type_info"] if "type_info" in internal_dict.keys() else type_info(lldb_val)
+    if address in _FORMATTING:
+        return CYCLE
+    # Summary of the object met while formatting another one depends on the path to it, so isn't memoized.
+    nested = len(_FORMATTING) > 0
+    summary = _OBJECT_SUMMARIES.get(address) if not nested else None
+    if summary is not None:
+        bench(start, lambda: "kotlin_object_type_summary:({:#x}) = cached".format(address))
+        return summary
+    (tip, kind) = (internal_dict["type_info"], None) if "type_info" in internal_dict.keys() else object_kind(lldb_val)
 
     if not tip:
         bench(start, lambda: "kotlin_object_type_summary:({0:#x}) = falback:{0:#x}".format(lldb_val.unsigned))
         return fallback
 
-    value = select_provider(lldb_val, tip, internal_dict)
-    bench(start, lambda: "kotlin_object_type_summary:({:#x}) = value:{:#x}".format(lldb_val.unsigned, value._valobj.unsigned))
-    start = time.monotonic()
-    str0 = value.to_short_string()
+    _FORMATTING.add(address)
+    try:
+        value = select_provider(lldb_val, tip, internal_dict, kind)
+        bench(start, lambda: "kotlin_object_type_summary:({:#x}) = value:{:#x}".format(lldb_val.unsigned, value._valobj.unsigned))
+        start = time.monotonic()
+        str0 = value.to_short_string(budget)
+    finally:
+        _FORMATTING.discard(address)
+    # Summary cut short by the shared budget would be shown for the object for the rest of the stop
+    if not nested and (budget is None or not budget.exhausted()):
+        _OBJECT_SUMMARIES.put(address, str0)
+    PROFILE.record('summary', value.__class__.__name__, entry)
     bench(start, lambda: "kotlin_object_type_summary:({:#x}) = str:'{}...'".format(lldb_val.unsigned, str0[:3]))
     return str0
 
 
-def select_provider(lldb_val, tip, internal_dict):
+def select_provider(lldb_val, tip, internal_dict, kind=None):
     start = time.monotonic()
     log(lambda : "select_provider: {:#x} name:{} tip:{:#x}".format(lldb_val.unsigned, lldb_val.name, tip))
-    soa = is_string_or_array(lldb_val)
-    log(lambda : "select_provider: {:#x} : soa: {}".format(lldb_val.unsigned, soa))
-    ret = __FACTORY['string'](lldb_val, tip, internal_dict) if soa == 1 \
-        else __FACTORY['array'](lldb_val, tip, internal_dict) if soa == 2 \
-        else __FACTORY['object'](lldb_val, tip, internal_dict)
+    kind = kind or _provider_kind(lldb_val, tip)
+    log(lambda : "select_provider: {:#x} : kind: {}".format(lldb_val.unsigned, kind))
+    try:
+        ret = __FACTORY[kind](lldb_val, tip, internal_dict)
+    except (DebuggerException, ValueError):
+        if kind not in _COLLECTION_CLASSES.values():
+            raise
+        log(lambda: "select_provider({:#x}): {} layout isn't known".format(lldb_val.unsigned, kind))
+        ret = __FACTORY['object'](lldb_val, tip, internal_dict)
     log(lambda: "select_provider({:#x}) = {}".format(lldb_val.unsigned, ret))
     bench(start, lambda: "select_provider({:#x})".format(lldb_val.unsigned))
     return ret
 
+_COLLECTION_CLASSES = {
+    'kclass:kotlin.collections.ArrayList': 'array_list',
+    'kclass:kotlin.collections.HashMap': 'hash_map',
+    'kclass:kotlin.collections.HashSet': 'hash_set',
+}
+
+def _provider_kind(lldb_val, tip):
+    soa = is_string_or_array(lldb_val, tip)
+    log(lambda : "_provider_kind: {:#x} : soa: {}".format(lldb_val.unsigned, soa))
+    if soa == 1:
+        return 'string'
+    if soa == 2:
+        return 'array'
+    if COLLECTION_VIEWS:
+        for name, kind in _COLLECTION_CLASSES.items():
+            if _runtime_symbol(name, tip) == tip:
+                return kind
+    return 'object'
+
+ELLIPSIS = '...'
+# Marks the rest of a summary which isn't shown because its budget is exhausted, unlike CYCLE
+CUT_OFF = '<budget exhausted>'
+
+
+class SummaryBudget:
+    """Time and expression evaluations a single summary may take."""
+    def __init__(self, seconds=None, evaluations=None):
+        self._deadline = time.monotonic() + (SUMMARY_TIME_BUDGET if seconds is None else seconds)
+        self._evaluations = _EVALUATIONS + (SUMMARY_EVALUATION_BUDGET if evaluations is None else evaluations)
+
+    def exhausted(self):
+        return _EVALUATIONS > self._evaluations or time.monotonic() > self._deadline
+
+
+def value_summary(value, depth, budget):
+    """Summary of a field or an element: primitives are shown as they are, objects are expanded up to the depth,
+    ... stands for everything deeper or beyond the budget."""
+    if depth <= 0 or budget.exhausted():
+        return ELLIPSIS
+    if not value:
+        return NULL
+    if value.GetTypeName() != "ObjHeader *":
+        return value.value if not value.GetType().IsPointerType() else value.deref.value
+    address = value.unsigned
+    if address == 0:
+        return NULL
+    if address in _FORMATTING:
+        return CYCLE
+    (tip, kind) = object_kind(value)
+    if not tip:
+        return value.value
+    _FORMATTING.add(address)
+    try:
+        return select_provider(value, tip, {}, kind).summary(depth - 1, budget, ARRAY_TO_STRING_LIMIT)
+    finally:
+        _FORMATTING.discard(address)
+
+
+class _Prefetcher:
+    """Reads memory blocks which are likely to be shown next. LLDB API isn't safe to call from other threads while a
+    command runs, so they are read by the formatters themselves in slices of PREFETCH_TIME_SLICE seconds after a page
+    is read. Blocks are kept only until the process resumes or stops again, pending reads of the previous stop are
+    dropped before they are made."""
+    def __init__(self):
+        self._generation = None
+        self._queue = deque()
+        # Start address to bytes of the blocks read at the current stop, in order of reading, and sorted addresses
+        self._blocks = OrderedDict()
+        self._starts = []
+
+    def _validate(self, process):
+        generation = (process.GetUniqueID(), process.GetStopID()) if process is not None else None
+        if generation != self._generation:
+            self._generation = generation
+            self._queue.clear()
+            self._blocks.clear()
+            del self._starts[:]
+
+    def _find(self, address, size):
+        index = bisect.bisect_right(self._starts, address) - 1
+        if index < 0:
+            return None
+        start = self._starts[index]
+        data = self._blocks[start]
+        return data[address - start:address - start + size] if address + size <= start + len(data) else None
+
+    def _store(self, address, data):
+        if address not in self._blocks:
+            bisect.insort(self._starts, address)
+        self._blocks[address] = data
+        while len(self._blocks) > max(PREFETCH_CACHE_SIZE, 1):
+            (start, _) = self._blocks.popitem(last=False)
+            del self._starts[bisect.bisect_left(self._starts, start)]
+
+    def schedule(self, process, blocks):
+        """Queues reads of the (address, size) blocks which aren't read yet."""
+        self._validate(process)
+        self._queue.extend((address, size) for (address, size) in blocks
+                           if address and size > 0 and self._find(address, size) is None)
+
+    def run(self, process, seconds):
+        """Reads the queued blocks for at most the given time, the rest is left to the next slices. Blocks which are
+        close to each other, as objects allocated one after another, are read at once."""
+        self._validate(process)
+        deadline = time.monotonic() + seconds
+        blocks = sorted(self._queue)
+        self._queue.clear()
+        index = 0
+        while index < len(blocks) and time.monotonic() < deadline:
+            (start, size) = blocks[index]
+            end = start + size
+            index += 1
+            while index < len(blocks) and blocks[index][0] <= end + PREFETCH_OBJECT_SIZE and \
+                    blocks[index][0] + blocks[index][1] - start <= _PREFETCH_READ_LIMIT:
+                end = max(end, blocks[index][0] + blocks[index][1])
+                index += 1
+            if self._find(start, end - start) is not None:
+                continue
+            error = lldb.SBError()
+            data = read_memory(process, start, end - start, error)
+            if error.Success():
+                self._store(start, data)
+        self._queue.extend(blocks[index:])
+
+    def lookup(self, process, address, size):
+        """Bytes of the memory if they are already read at this stop, None otherwise."""
+        self._validate(process)
+        return self._find(address, size)
+
+    def cancel(self):
+        self._validate(None)
+
+
+PREFETCHER = _Prefetcher()
+
+
 class KonanHelperProvider(lldb.SBSyntheticValueProvider):
     def __init__(self, valobj, amString, internal_dict = {}):
         self._target = lldb.debugger.GetSelectedTarget()
@@ -199,7 +989,8 @@ class KonanHelperProvider(lldb.SBSyntheticValueProvider):
         self._internal_dict = internal_dict.copy()
         if amString:
             return
-        if self._children_count == 0:
+        self._pages = _LruCache(CHILDREN_PAGE_CACHE_SIZE, _stop_generation)
+        if self._children_count is None:
             children_count = evaluate("(int)Konan_DebugGetFieldCount({:#x})".format(self._valobj.unsigned)).signed
             log(lambda: "(int)[{}].Konan_DebugGetFieldCount({:#x}) = {}".format(self._valobj.name,
                                                                                 self._valobj.unsigned, children_count))
@@ -208,24 +999,73 @@ class KonanHelperProvider(lldb.SBSyntheticValueProvider):
     def _read_string(self, expr, error):
         return self._process.ReadCStringFromMemory(evaluate(expr).unsigned, 0x1000, error)
 
+    def _page_location(self, page):
+        """Address and size of the memory holding the page of children, empty unless children are read from pages."""
+        return self._valobj.unsigned, 0
+
+    def _child_location(self, index):
+        """Page, offset in the page and size of the child, or None if the child can't be read from memory."""
+        return None
+
+    def _page_references(self, page, data):
+        """Addresses of the objects referenced from the page of children."""
+        return []
+
+    def _next_pages(self, page):
+        """Pages of children which are likely to be shown after the page."""
+        return []
+
+    def _read_page(self, page):
+        data = self._pages.get(page)
+        if data is None:
+            address, size = self._page_location(page)
+            data = PREFETCHER.lookup(self._process, address, size) if PREFETCH and size > 0 else None
+            if data is None:
+                error = lldb.SBError()
+                data = read_memory(self._process, address, size, error) if size > 0 else b''
+                if not error.Success():
+                    raise DebuggerException()
+            log(lambda: "_read_page({:#x}, {}) = {} bytes at {:#x}".format(self._valobj.unsigned, page, size, address))
+            self._pages.put(page, data)
+            if PREFETCH:
+                references = self._page_references(page, data)[:max(PREFETCH_OBJECTS, 0)]
+                PREFETCHER.schedule(self._process, [self._page_location(next_page)
+                                                    for next_page in self._next_pages(page)] +
+                                    [(reference, PREFETCH_OBJECT_SIZE) for reference in references])
+                PREFETCHER.run(self._process, PREFETCH_TIME_SLICE)
+        return data
+
+    def _child_from_page(self, index, name):
+        location = self._child_location(index)
+        value_type = self._field_type(index)
+        if location is None or not 0 <= value_type < len(runtime_types(self._valobj)):
+            return None
+        page, offset, size = location
+        data = lldb.SBData()
+        error = lldb.SBError()
+        data.SetData(error, self._read_page(page)[offset:offset + size], self._process.GetByteOrder(),
+                     self._process.GetAddressByteSize())
+        return self._valobj.CreateValueFromData(name, data, runtime_types(self._valobj)[value_type])
+
     def _read_value(self, index):
+        value = self._child_from_page(index, str(self._field_name(index)))
+        if value is not None:
+            return value
         value_type = self._field_type(index)
         address = self._field_address(index)
         log(lambda: "_read_value: [{}, type:{}, address:{:#x}]".format(index, value_type, address))
-        return _TYPE_CONVERSION[int(value_type)](self, self._valobj, address, str(self._field_name(index)))
+        return value_at(self._valobj, address, int(value_type), str(self._field_name(index)))
 
     def _read_type(self, index):
-        type = _TYPES[self._field_type(index)](self._valobj)
+        type = runtime_types(self._valobj)[self._field_type(index)]
         log(lambda: "type:{0} of {1:#x} of {2:#x}".format(type, self._valobj.unsigned,
                                                           self._valobj.unsigned + self._children[index].offset()))
         return type
 
-    def _deref_or_obj_summary(self, index, internal_dict = {}):
-        value = self._read_value(index)
-        if not value:
-            log(lambda : "_deref_or_obj_summary: value none, index:{}, type:{}".format(index, self._children[index].type()))
-            return None
-        return value.value if type_info(value) else value.deref.value
+    def _child_summary(self, index, depth, budget):
+        if depth <= 0:
+            return ELLIPSIS
+        return value_summary(self._read_value(index), depth, budget)
 
     def _field_address(self, index):
         return evaluate("(void *)Konan_DebugGetFieldAddress({:#x}, {})".format(self._valobj.unsigned, index)).unsigned
@@ -233,18 +1073,61 @@ class KonanHelperProvider(lldb.SBSyntheticValueProvider):
     def _field_type(self, index):
         return evaluate("(int)Konan_DebugGetFieldType({:#x}, {})".format(self._valobj.unsigned, index)).unsigned
 
-    def to_string(self, representation):
+    def summary(self, depth, budget, limit=None):
+        """Lists the children, expanding objects among them up to the depth."""
         writer = io.StringIO()
-        max_children_count=_max_children_count()
+        max_children_count = min(_max_children_count(), SUMMARY_ELEMENT_LIMIT) if limit is None else limit
         limit = min(self._children_count, max_children_count)
         for i in range(limit):
-            writer.write(representation(i))
+            if budget.exhausted():
+                writer.write(CUT_OFF)
+                return "[{}]".format(writer.getvalue())
+            writer.write(self._child_summary(i, depth, budget))
             if (i != limit - 1):
                 writer.write(", ")
         if max_children_count < self._children_count:
             writer.write(', ...')
         return "[{}]".format(writer.getvalue())
 
+    def _own_summary(self, depth, budget=None):
+        address = self._valobj.unsigned
+        formatting = address in _FORMATTING
+        _FORMATTING.add(address)
+        try:
+            return self.summary(min(depth, _MAX_SUMMARY_DEPTH), budget or SummaryBudget())
+        finally:
+            if not formatting:
+                _FORMATTING.discard(address)
+
+    def to_short_string(self, budget=None):
+        log(lambda: "to_short_string:{:#x}".format(self._valobj.unsigned))
+        return self._own_summary(SUMMARY_DEPTH, budget)
+
+    def to_string(self):
+        log(lambda: "to_string:{:#x}".format(self._valobj.unsigned))
+        return self._own_summary(TO_STRING_DEPTH)
+
+
+def read_string(process, address, limit):
+    """Decodes Kotlin string, which is an array of UTF-16 characters, reading at most limit characters from memory."""
+    count = _array_count(process, address)
+    if count is None:
+        return None
+    length = min(count, limit)
+    error = lldb.SBError()
+    data = read_memory(process, address + _array_header_size(process.GetAddressByteSize()), 2 * length, error) \
+        if length > 0 else b''
+    if not error.Success():
+        return None
+    encoding = 'utf-16-be' if process.GetByteOrder() == lldb.eByteOrderBig else 'utf-16-le'
+    if length < count:
+        # Don't show half of the surrogate pair.
+        last = struct.unpack_from(_byte_order(process) + 'H', data, len(data) - 2)[0] if data else 0
+        if 0xd800 <= last < 0xdc00:
+            data = data[:-2]
+        return bytes(data).decode(encoding, 'replace') + '...'
+    return bytes(data).decode(encoding, 'replace')
+
 
 class KonanStringSyntheticProvider(KonanHelperProvider):
     def __init__(self, valobj):
@@ -252,6 +1135,14 @@ class KonanStringSyntheticProvider(KonanHelperProvider):
         self._children_count = 0
         super(KonanStringSyntheticProvider, self).__init__(valobj, True)
         fallback = valobj.GetValue()
+        if STRING_DECODING == 'memory' or memory_only(self._process):
+            self._representation = read_string(self._process, self._valobj.unsigned, STRING_SUMMARY_LIMIT)
+            if self._representation is not None:
+                return
+            if memory_only(self._process):
+                self._representation = fallback
+                return
+            log(lambda: "KonanStringSyntheticProvider:{:#x} can't be read, fallback".format(valobj.unsigned))
         buff_addr = evaluate("(void *)Konan_DebugBuffer()").unsigned
         buff_len = evaluate(
             '(int)Konan_DebugObjectToUtf8Array({:#x}, (void *){:#x}, (int)Konan_DebugBufferSize());'.format(
@@ -284,7 +1175,10 @@ class KonanStringSyntheticProvider(KonanHelperProvider):
     def get_child_at_index(self, _):
         return None
 
-    def to_short_string(self):
+    def summary(self, depth, budget, limit=None):
+        return self._representation
+
+    def to_short_string(self, budget=None):
         return self._representation
 
     def to_string(self):
@@ -295,23 +1189,55 @@ class KonanObjectSyntheticProvider(KonanHelperProvider):
     def __init__(self, valobj, tip, internal_dict):
         # Save an extra call into the process
         log(lambda: "KonanObjectSyntheticProvider({:#x})".format(valobj.unsigned))
-        self._children_count = 0
+        self._layout = type_layout(valobj, tip)
+        self._children_count = self._layout.field_count()
         super(KonanObjectSyntheticProvider, self).__init__(valobj, False, internal_dict)
-        self._children = [self._field_name(i) for i in range(self._children_count)]
+        self._children = self._layout.names
+        pointer_size = self._process.GetAddressByteSize()
+        self._formats = [_runtime_type_format(field_type, pointer_size) for field_type in self._layout.types]
+        # All the fields are read with a single read of the object body.
+        spans = [(offset, offset + struct.calcsize(field_format))
+                 for offset, field_format in zip(self._layout.offsets, self._formats) if field_format]
+        self._body = (min(start for start, _ in spans), max(end for _, end in spans)) if spans else (0, 0)
         log(lambda: "KonanObjectSyntheticProvider::__init__({:#x}) _children:{}".format(self._valobj.unsigned,
                                                                                         self._children))
 
+    def _page_location(self, page):
+        return self._valobj.unsigned + self._body[0], self._body[1] - self._body[0]
+
+    def _child_location(self, index):
+        field_format = self._formats[index]
+        if not field_format:
+            return None
+        return 0, self._layout.offsets[index] - self._body[0], struct.calcsize(field_format)
+
+    def _page_references(self, page, data):
+        byte_order = _byte_order(self._process)
+        references = []
+        for (index, runtime_type) in enumerate(self._layout.types):
+            if runtime_type == 1:
+                references.append(struct.unpack_from(byte_order + self._formats[index], data,
+                                                     self._child_location(index)[1])[0])
+        return references
+
+    def _field_value(self, name):
+        """Reads value of the primitive field or address of the object stored in the field."""
+        index = self._layout.names.index(name)
+        location = self._child_location(index)
+        if location is None:
+            raise DebuggerException()
+        page, offset, _ = location
+        return struct.unpack_from(_byte_order(self._process) + self._formats[index], self._read_page(page), offset)[0]
+
     def _field_name(self, index):
         log(lambda: "KonanObjectSyntheticProvider::_field_name({:#x}, {})".format(self._valobj.unsigned, index))
-        error = lldb.SBError()
-        name =  self._read_string("(char *)Konan_DebugGetFieldName({:#x}, (int){})".format(self._valobj.unsigned,
-                                                                                           index),
-                                  error)
-        if not error.Success():
-            raise DebuggerException()
-        log(lambda: "KonanObjectSyntheticProvider::_field_name({:#x}, {}) = {}".format(self._valobj.unsigned,
-                                                                                       index, name))
-        return name
+        return self._layout.names[index]
+
+    def _field_address(self, index):
+        return self._valobj.unsigned + self._layout.offsets[index]
+
+    def _field_type(self, index):
+        return self._layout.types[index]
 
     def num_children(self):
         log(lambda: "KonanObjectSyntheticProvider::num_children({:#x}) = {}".format(self._valobj.unsigned,
@@ -334,24 +1260,63 @@ class KonanObjectSyntheticProvider(KonanHelperProvider):
         log(lambda: "KonanObjectSyntheticProvider::get_child_at_index({:#x}, {})".format(self._valobj.unsigned, index))
         return self._read_value(index)
 
-    def to_short_string(self):
-        log(lambda: "to_short_string:{:#x}".format(self._valobj.unsigned))
-        return super().to_string(lambda index: "{}: ...".format(self._field_name(index)))
-
-    def to_string(self):
-        log(lambda: "to_string:{:#x}".format(self._valobj.unsigned))
-        return super().to_string(lambda index: "{}: {}".format(self._field_name(index),
-                                                               self._deref_or_obj_summary(index)))
+    def _child_summary(self, index, depth, budget):
+        return "{}: {}".format(self._field_name(index), KonanHelperProvider._child_summary(self, index, depth, budget))
 
 class KonanArraySyntheticProvider(KonanHelperProvider):
-    def __init__(self, valobj, internal_dict):
-        self._children_count = 0
+    def __init__(self, valobj, tip, internal_dict):
+        process = lldb.debugger.GetSelectedTarget().GetProcess()
+        self._children_count = _array_count(process, valobj.unsigned)
         super(KonanArraySyntheticProvider, self).__init__(valobj, False, internal_dict)
         log(lambda: "KonanArraySyntheticProvider: valobj:{:#x}".format(valobj.unsigned))
         if self._valobj is None:
             return
         valobj.SetSyntheticChildrenGenerated(True)
-        type = self._field_type(0)
+        self._layout = type_layout(valobj, tip, is_array=True)
+        self._element_type = -self._layout.fields_count
+        pointer_size = self._process.GetAddressByteSize()
+        self._element_format = _runtime_type_format(self._element_type, pointer_size)
+        self._element_size = struct.calcsize(self._element_format) if self._element_format else 0
+        self._elements_address = self._valobj.unsigned + _align_up(_array_header_size(pointer_size),
+                                                                   max(self._element_size, 1))
+        self._page_size = max(ARRAY_WINDOW_SIZE, 1)
+
+    def _field_type(self, index):
+        return self._element_type
+
+    def _field_address(self, index):
+        return self._elements_address + index * self._element_size
+
+    def _page_location(self, page):
+        start = page * self._page_size
+        return self._field_address(start), min(self._page_size, self._children_count - start) * self._element_size
+
+    def _child_location(self, index):
+        if not self._element_format or not 0 <= index < self._children_count:
+            return None
+        return index // self._page_size, index % self._page_size * self._element_size, self._element_size
+
+    def _page_references(self, page, data):
+        return list(self.page_values(page)) if self._element_type == 1 else []
+
+    def _next_pages(self, page):
+        pages_count = (self._children_count + self._page_size - 1) // self._page_size
+        return range(page + 1, min(page + 1 + max(PREFETCH_PAGES, 0), pages_count))
+
+    def page_values(self, page):
+        """Elements of the page of the array of primitives or object addresses, read with a single memory read."""
+        data = self._read_page(page)
+        return struct.unpack("{}{}{}".format(_byte_order(self._process), len(data) // self._element_size,
+                                             self._element_format), data)
+
+    def element(self, index, name):
+        value = self._child_from_page(index, name)
+        if value is not None:
+            return value
+        return value_at(self._valobj, self._field_address(index), int(self._element_type), name)
+
+    def _read_value(self, index):
+        return self.element(index, self._field_name(index))
 
     def num_children(self):
         log(lambda: "KonanArraySyntheticProvider::num_children({:#x}) = {}".format(self._valobj.unsigned,
@@ -376,13 +1341,123 @@ class KonanArraySyntheticProvider(KonanHelperProvider):
         log(lambda: "KonanArraySyntheticProvider::_field_name({:#x}, {})".format(self._valobj.unsigned, index))
         return str(index)
 
-    def to_short_string(self):
-        log(lambda: "to_short_string:{:#x}".format(self._valobj.unsigned))
-        return super().to_string(lambda index: "...")
 
-    def to_string(self):
-        log(lambda: "to_string:{self._valobj.unsigned:#x}")
-        return super().to_string(lambda index: "{}".format(self._deref_or_obj_summary(index)))
+class KonanCollectionSyntheticProvider(KonanObjectSyntheticProvider):
+    """Shows logical elements of a Kotlin collection instead of its fields. Children are read lazily
+    by the pages of the backing arrays, so only visible elements are fetched from the process."""
+    def __init__(self, valobj, tip, internal_dict):
+        super(KonanCollectionSyntheticProvider, self).__init__(valobj, tip, internal_dict)
+
+    def _element(self, index, name):
+        """Child shown for the element, the fields of the collection object unless the view knows its elements."""
+        return self._raw_field(index)
+
+    def _read_value(self, index):
+        if index >= self._children_count:
+            return None
+        return self._element(index, str(index))
+
+    def _raw_field(self, index):
+        return super(KonanCollectionSyntheticProvider, self)._read_value(index)
+
+    def _child_summary(self, index, depth, budget):
+        return KonanHelperProvider._child_summary(self, index, depth, budget)
+
+    def _field_provider(self, name):
+        """Provider for the object stored in the field, or None if the field is null."""
+        value = self._raw_field(self._layout.names.index(name))
+        (tip, kind) = object_kind(value) if value and value.unsigned != 0 else (None, None)
+        return select_provider(value, tip, self._internal_dict, kind) if tip else None
+
+    def get_child_index(self, name):
+        log(lambda: "KonanCollectionSyntheticProvider::get_child_index({:#x}, {})".format(self._valobj.unsigned, name))
+        try:
+            index = int(name.strip('[]'))
+        except ValueError:
+            return -1
+        return index if (0 <= index < self._children_count) else -1
+
+
+class KonanArrayListSyntheticProvider(KonanCollectionSyntheticProvider):
+    def __init__(self, valobj, tip, internal_dict):
+        super(KonanArrayListSyntheticProvider, self).__init__(valobj, tip, internal_dict)
+        self._array = self._field_provider('array')
+        self._offset = self._field_value('offset')
+        self._children_count = self._field_value('length') if self._array else 0
+        log(lambda: "KonanArrayListSyntheticProvider({:#x}): offset:{} length:{}".format(
+            self._valobj.unsigned, self._offset, self._children_count))
+
+    def _element(self, index, name):
+        return self._array.element(self._offset + index, name)
+
+
+class KonanHashMapSyntheticProvider(KonanCollectionSyntheticProvider):
+    """Entries are shown as values named by summaries of their keys."""
+    def __init__(self, valobj, tip, internal_dict):
+        super(KonanHashMapSyntheticProvider, self).__init__(valobj, tip, internal_dict)
+        self._keys = self._field_provider('keysArray')
+        self._values = self._field_provider('valuesArray')
+        self._presence = self._field_provider('presenceArray')
+        self._length = self._field_value('length') if self._keys and self._presence else 0
+        self._children_count = self._field_value('_size') if self._length else 0
+        self._entries = []
+        self._scanned = 0
+        self._generation = _stop_generation()
+        self._names = {}
+        log(lambda: "KonanHashMapSyntheticProvider({:#x}): length:{} size:{}".format(
+            self._valobj.unsigned, self._length, self._children_count))
+
+    def _entry_index(self, index):
+        """Index of the entry in keysArray, found scanning presenceArray by pages up to the entry."""
+        if self._generation != _stop_generation():
+            self._entries, self._scanned, self._names = [], 0, {}
+            self._generation = _stop_generation()
+        while len(self._entries) <= index and self._scanned < self._length:
+            page = self._scanned // self._presence._page_size
+            start = page * self._presence._page_size
+            presence = self._presence.page_values(page)[:self._length - start]
+            self._entries.extend(start + i for i, entry in enumerate(presence) if entry >= 0)
+            self._scanned = start + len(presence)
+        return self._entries[index] if index < len(self._entries) else None
+
+    def key(self, index, name):
+        entry = self._entry_index(index)
+        return self._keys.element(entry, name) if entry is not None else None
+
+    def value(self, index, name):
+        entry = self._entry_index(index)
+        return self._values.element(entry, name) if entry is not None and self._values else None
+
+    def _element(self, index, name):
+        key = self.key(index, name)
+        if key is None:
+            return None
+        name = "[{}]".format(kotlin_object_type_summary(key, {}))
+        self._names[name] = index
+        value = self.value(index, name)
+        return value if value is not None else key
+
+    def get_child_index(self, name):
+        log(lambda: "KonanHashMapSyntheticProvider::get_child_index({:#x}, {})".format(self._valobj.unsigned, name))
+        return self._names.get(name, super(KonanHashMapSyntheticProvider, self).get_child_index(name))
+
+    def _child_summary(self, index, depth, budget):
+        if depth <= 0:
+            return ELLIPSIS
+        return "{}: {}".format(value_summary(self.key(index, "key"), depth, budget),
+                               value_summary(self.value(index, "value"), depth, budget))
+
+
+class KonanHashSetSyntheticProvider(KonanCollectionSyntheticProvider):
+    def __init__(self, valobj, tip, internal_dict):
+        super(KonanHashSetSyntheticProvider, self).__init__(valobj, tip, internal_dict)
+        self._backing = self._field_provider('backing')
+        self._children_count = self._backing.num_children() \
+            if isinstance(self._backing, KonanHashMapSyntheticProvider) else 0
+
+    def _element(self, index, name):
+        return self._backing.key(index, name)
+
 
 class KonanZerroSyntheticProvider(lldb.SBSyntheticValueProvider):
     def __init__(self, valobj):
@@ -409,7 +1484,7 @@ class KonanZerroSyntheticProvider(lldb.SBSyntheticValueProvider):
         log(lambda: "KonanZerroSyntheticProvider::to_string")
         return NULL
 
-    def to_short_string(self):
+    def to_short_string(self, budget=None):
         log(lambda: "KonanZerroSyntheticProvider::to_short_string")
         return NULL
 
@@ -436,7 +1511,7 @@ class KonanProxyTypeProvider:
            self._proxy = KonanNullSyntheticProvider(valobj)
            return
 
-        tip = type_info(valobj)
+        (tip, kind) = object_kind(valobj)
         if not tip:
            log(lambda : "KonanProxyTypeProvider:{:#x}, name: {} not initialized syntectic {}".format(valobj.unsigned,
                                                                                                      valobj.name,
@@ -445,7 +1520,8 @@ class KonanProxyTypeProvider:
            self._proxy = KonanNotInitializedObjectSyntheticProvider(valobj)
            return
         log(lambda : "KonanProxyTypeProvider:{:#x} tip: {:#x}".format(valobj.unsigned, tip))
-        self._proxy = select_provider(valobj, tip, internal_dict)
+        self._proxy = select_provider(valobj, tip, internal_dict, kind)
+        PROFILE.record('provider', self._proxy.__class__.__name__, start)
         bench(start, lambda: "KonanProxyTypeProvider({:#x})".format(valobj.unsigned))
         log(lambda: "KonanProxyTypeProvider:{:#x} _proxy: {}".format(valobj.unsigned, self._proxy.__class__.__name__))
 
@@ -457,6 +1533,44 @@ def type_name_command(debugger, command, result, internal_dict):
     result.AppendMessage(evaluate('(char *)Konan_DebugGetTypeName({})'.format(command)).summary)
 
 
+def _parse_setting(current, text):
+    if isinstance(current, bool):
+        if text.lower() not in ('true', 'false', 'on', 'off', '1', '0'):
+            raise ValueError(text)
+        return text.lower() in ('true', 'on', '1')
+    return type(current)(text)
+
+
+def konan_settings_command(debugger, command, result, internal_dict):
+    """konan_settings [name [value]]: shows or changes settings of Kotlin formatters."""
+    module = sys.modules[__name__]
+    tokens = command.split()
+    names = [tokens[0].upper().replace('-', '_')] if tokens else sorted(_SETTINGS.keys())
+    if names[0] not in _SETTINGS:
+        result.SetError("unknown setting: {}, known ones: {}".format(
+            tokens[0], ", ".join(name.lower() for name in sorted(_SETTINGS.keys()))))
+        return
+    if len(tokens) > 1:
+        try:
+            value = _parse_setting(getattr(module, names[0]), tokens[1])
+        except ValueError:
+            result.SetError("invalid value for {}: {}".format(tokens[0], tokens[1]))
+            return
+        if _SETTINGS[names[0]] is not None and value not in _SETTINGS[names[0]]:
+            result.SetError("{} should be one of: {}".format(tokens[0], ", ".join(_SETTINGS[names[0]])))
+            return
+        if names[0].startswith('PERSISTENT_CACHE'):
+            save_persistent_caches()
+            _PERSISTENT_CACHES.clear()
+        if names[0].startswith('PREFETCH'):
+            PREFETCHER.cancel()
+        setattr(module, names[0], value)
+        _OBJECT_KINDS.clear()
+        _OBJECT_SUMMARIES.clear()
+    for name in names:
+        result.AppendMessage("{} = {}".format(name.lower(), getattr(module, name)))
+
+
 __KONAN_VARIABLE = re.compile('kvar:(.*)#internal')
 __KONAN_VARIABLE_TYPE = re.compile('^kfun:<get-(.*)>\\(\\)(.*)$')
 __TYPES_KONAN_TO_C = {
@@ -481,66 +1595,1452 @@ def type_by_address_command(debugger, command, result, internal_dict):
     target = debugger.GetSelectedTarget()
     process = target.GetProcess()
     thread = process.GetSelectedThread()
-    types = _type_info_by_address(tokens[0])
+    types = _type_info_by_address(int(tokens[0], 0), debugger)
     result.AppendMessage("DEBUG: {}".format(types))
     for t in types:
         result.AppendMessage("{}: {:#x}".format(t.name, t.GetStartAddress().GetLoadAddress(target)))
 
 
 def symbol_by_name_command(debugger, command, result, internal_dict):
-    target = debugger.GetSelectedTarget()
-    process = target.GetProcess()
-    thread = process.GetSelectedThread()
-    frame = thread.GetSelectedFrame()
     tokens = command.split()
     mask = re.compile(tokens[0])
-    symbols = list(filter(lambda v: mask.match(v.name), frame.GetModule().symbols))
-    visited = list()
-    for symbol in symbols:
-       name = symbol.name
-       if name in visited:
-           continue
-       visited.append(name)
-       result.AppendMessage("{}: {:#x}".format(name, symbol.GetStartAddress().GetLoadAddress(target)))
+    index = symbol_index(debugger)
+    for name in index.names():
+       if mask.match(name):
+           result.AppendMessage("{}: {:#x}".format(name, index.address(name)))
+
+
+_C_BASIC_TYPES = {
+   'int8_t': lldb.eBasicTypeSignedChar,
+   'short': lldb.eBasicTypeShort,
+   'int': lldb.eBasicTypeInt,
+   'long': lldb.eBasicTypeLongLong,
+   'bool': lldb.eBasicTypeBool,
+   'float': lldb.eBasicTypeFloat,
+   'double': lldb.eBasicTypeDouble
+}
 
 
-def konan_globals_command(debugger, command, result, internal_dict):
-    target = debugger.GetSelectedTarget()
-    process = target.GetProcess()
-    thread = process.GetSelectedThread()
-    frame = thread.GetSelectedFrame()
+class _CommandParser(argparse.ArgumentParser):
+    """Argument parser for LLDB commands, which reports help and errors to the command result instead of exiting."""
+    def _print_message(self, message, file=None):
+        self._messages.append(message)
 
-    konan_variable_symbols = list(filter(lambda v: __KONAN_VARIABLE.match(v.name), frame.GetModule().symbols))
-    visited = list()
-    for symbol in konan_variable_symbols:
-       name = __KONAN_VARIABLE.search(symbol.name).group(1)
+    def exit(self, status=0, message=None):
+        raise DebuggerException(message or "")
 
-       if name in visited:
-           continue
-       visited.append(name)
+    def error(self, message):
+        raise DebuggerException("{}\n{}".format(message, self.format_usage()))
+
+    def parse_command(self, command, result):
+        self._messages = []
+        try:
+            return self.parse_args(shlex.split(command))
+        except (DebuggerException, ValueError) as e:
+            if self._messages:
+                result.AppendMessage("".join(self._messages))
+            if str(e):
+                result.SetError(str(e))
+            return None
+
+
+def _read_global_storage(target, address, c_type, name):
+    """Reads primitive global directly from its storage, None if it can't be read."""
+    if address is None:
+        return None
+    value_type = target.FindFirstType('ObjHeader').GetPointerType() if c_type == 'ObjHeader *' \
+        else target.GetBasicType(_C_BASIC_TYPES[c_type])
+    error = lldb.SBError()
+    data = read_memory(target.GetProcess(), address, value_type.GetByteSize(), error)
+    if not error.Success():
+        return None
+    sbdata = lldb.SBData()
+    sbdata.SetData(error, data, target.GetByteOrder(), target.GetAddressByteSize())
+    value = target.CreateValueFromData(name, sbdata, value_type)
+    return value if value.IsValid() else None
 
-       getters = list(filter(lambda v: re.match('^kfun:<get-{}>\\(\\).*$'.format(name), v.name), frame.module.symbols))
-       if not getters:
-           result.AppendMessage("storage not found for name:{}".format(name))
-           continue
 
-       getter_functions = frame.module.FindFunctions(getters[0].name)
-       if not getter_functions:
+_GLOBALS_PARSER = _CommandParser(prog='konan_globals', description='Show values of Kotlin top level properties.')
+_GLOBALS_PARSER.add_argument('filter', nargs='?', default=None, help='regular expression for property names')
+_GLOBALS_PARSER.add_argument('-s', '--start', type=int, default=0, help='index of the first property to show')
+_GLOBALS_PARSER.add_argument('-c', '--count', type=int, default=50, help='number of properties to show')
+
+
+def konan_globals_command(debugger, command, result, internal_dict):
+    args = _GLOBALS_PARSER.parse_command(command, result)
+    if args is None:
+        return
+    target = debugger.GetSelectedTarget()
+    index = symbol_index(debugger)
+    mask = re.compile(args.filter) if args.filter else None
+
+    getters = {}
+    for getter in index.names_with_prefix('kfun:<get-'):
+        match = __KONAN_VARIABLE_TYPE.match(getter)
+        if match:
+            getters.setdefault(match.group(1), (getter, match.group(2)))
+    names = []
+    for storage in index.names_with_prefix('kvar:'):
+        match = __KONAN_VARIABLE.match(storage)
+        if match and (mask is None or mask.search(match.group(1))):
+            names.append((match.group(1), storage))
+
+    for (name, storage) in names[args.start:args.start + args.count]:
+       if name not in getters:
+           result.AppendMessage("storage not found for name:{}".format(name))
            continue
 
-       address = getter_functions[0].function.GetStartAddress().GetLoadAddress(target)
-       type = __KONAN_VARIABLE_TYPE.search(getters[0].name).group(2)
+       (getter, type) = getters[name]
        (c_type, extractor) = __TYPES_KONAN_TO_C[type] if type in __TYPES_KONAN_TO_C.keys() else ('ObjHeader *', lambda v: kotlin_object_type_summary(v))
-       value = evaluate('(({0} (*)()){1:#x})()'.format(c_type, address))
+       from_storage = c_type != 'ObjHeader *' or memory_only(target.GetProcess())
+       value = _read_global_storage(target, index.address(storage), c_type, name) if from_storage else None
+       if value is None and memory_only(target.GetProcess()):
+           result.AppendMessage("{} {}: can't be read".format(type, name))
+           continue
+       if value is None:
+           address = index.address(getter)
+           if address is None:
+               continue
+           value = evaluate('(({0} (*)()){1:#x})()'.format(c_type, address))
        str_value = extractor(value)
        result.AppendMessage('{} {}: {}'.format(type, name, str_value))
+    if args.start + args.count < len(names):
+        result.AppendMessage("... {} more, use --start {} to see them".format(
+            len(names) - args.start - args.count, args.start + args.count))
+
+
+# Cache of TypeInfo pointers of all classes in the target to class names
+_CLASS_NAMES = _LruCache(1)
+
+
+def class_names(target):
+    """Maps TypeInfo addresses to class names using kclass: symbols of all modules, built once per process."""
+    names = _CLASS_NAMES.get('kclass:')
+    if names is not None:
+        return names
+    names = {}
+    for module_index in range(target.GetNumModules()):
+        index = symbol_index(module=target.GetModuleAtIndex(module_index))
+        for symbol in index.names_with_prefix('kclass:'):
+            address = index.address(symbol)
+            if address:
+                names.setdefault(address, symbol[len('kclass:'):])
+    return _CLASS_NAMES.put('kclass:', names)
+
+
+def _heap_regions(process):
+    """Readable and writable regions which may contain Kotlin objects as (start, end, anonymous), stacks are skipped.
+    Regions mapped from files hold data and bss sections of the binaries, anonymous ones are the heap."""
+    regions = process.GetMemoryRegions()
+    for index in range(regions.GetSize()):
+        region = lldb.SBMemoryRegionInfo()
+        if not regions.GetMemoryRegionAtIndex(index, region):
+            continue
+        if region.IsReadable() and region.IsWritable() and not region.IsExecutable() \
+                and not (region.GetName() or '').startswith('[stack'):
+            name = region.GetName() or ''
+            yield region.GetRegionBase(), region.GetRegionEnd(), not name or name.startswith('[')
+
+
+def _instance_size(process, tip):
+    """TypeInfo::instanceSize_, negated element size for arrays, None if it can't be read."""
+    error = lldb.SBError()
+    size = read_unsigned(process, tip + 2 * process.GetAddressByteSize() + 4, 4, error)
+    if not error.Success():
+        return None
+    return size - (1 << 32) if size & 0x80000000 else size
+
+
+def heap_objects(process, type_infos, chunk_size=None):
+    """Finds Kotlin objects by scanning writable memory chunk by chunk for object headers and yields (address, type
+    info, shallow size) as soon as they are found, so memory use doesn't depend on heap size. A header is a word
+    pointing either to one of the given TypeInfos or to a meta-object whose first word is one of them.
+
+    It's a heuristic, as the allocator isn't walked: values which look like object headers are reported too, unless
+    they are in bodies of found objects or TypeInfos, which are skipped. Meta-objects have no pointer back to their
+    objects, so a pointer to an object would look like a pointer to a meta-object: they are only trusted in the heap,
+    where objects with meta-objects are allocated, and not in sections of binaries, which hold global variables and
+    runtime tables. Meta-objects are skipped once their objects are found, so the ones placed before their objects in
+    memory are reported as objects."""
+    pointer_size = process.GetAddressByteSize()
+    byte_order = _byte_order(process.GetTarget())
+    word_format = 'Q' if pointer_size == 8 else 'I'
+    chunk_size = _align_up(max(chunk_size or HEAP_SCAN_CHUNK_SIZE, pointer_size), pointer_size)
+    header_size = _array_header_size(pointer_size)
+    regions = list(_heap_regions(process))
+    instance_sizes = {}
+    # Meta-objects of the found objects, which are skipped when they are met
+    metas = set()
+    error = lldb.SBError()
+    for (start, end, anonymous) in regions:
+        address = _align_up(start, pointer_size)
+        skip_to = address
+        while address + pointer_size <= end:
+            size = min(chunk_size, (end - address) & ~(pointer_size - 1))
+            data = read_memory(process, address, size, error)
+            if not error.Success():
+                error.Clear()
+                address += size
+                continue
+            words = struct.unpack_from('{}{}{}'.format(byte_order, size // pointer_size, word_format), data)
+            index = max(skip_to - address, 0) // pointer_size
+            while index < len(words):
+                obj = address + index * pointer_size
+                index += 1
+                header = words[index - 1] & ~0x3
+                if header in type_infos:
+                    if obj == header:
+                        # TypeInfo itself, its superType_ isn't a header either
+                        skip_to = obj + 3 * pointer_size + 8
+                        index = (skip_to - address) // pointer_size
+                        continue
+                    if obj in metas:
+                        continue
+                    (tip, meta) = (header, None)
+                elif anonymous and header and not header % pointer_size and \
+                        any(low <= header < high for (low, high, _) in regions):
+                    meta_index = (header - address) // pointer_size
+                    tip = words[meta_index] if address <= header < address + size \
+                        else read_pointer(process, header, error)
+                    if not error.Success():
+                        error.Clear()
+                        continue
+                    if tip not in type_infos:
+                        continue
+                    meta = header
+                else:
+                    continue
+                if tip not in instance_sizes:
+                    instance_sizes[tip] = _instance_size(process, tip)
+                instance_size = instance_sizes[tip]
+                if instance_size is None:
+                    continue
+                if instance_size < 0:
+                    offset = index * pointer_size
+                    count = struct.unpack_from(byte_order + 'I', data, offset)[0] if offset + 4 <= size \
+                        else _array_count(process, obj)
+                    if count is None:
+                        continue
+                    object_size = _align_up(header_size - instance_size * count, pointer_size)
+                else:
+                    object_size = _align_up(instance_size, pointer_size)
+                if object_size < pointer_size or obj + object_size > end:
+                    continue
+                if meta is not None:
+                    metas.add(meta)
+                yield obj, tip, object_size
+                skip_to = obj + object_size
+                index = (skip_to - address) // pointer_size
+            address = max(address + size, skip_to)
+
+
+_HEAP_PARSER = _CommandParser(prog='konan_heap', description='Show Kotlin objects found in the process memory.')
+_HEAP_PARSER.add_argument('action', nargs='?', choices=('histogram', 'find'), default='histogram',
+                          help='count objects and their shallow sizes by class, or list addresses of objects')
+_HEAP_PARSER.add_argument('filter', nargs='?', default=None, help='regular expression for class names')
+_HEAP_PARSER.add_argument('-c', '--count', type=int, default=50, help='number of classes or objects to show')
+_HEAP_PARSER.add_argument('-s', '--sort', choices=('size', 'count', 'name'), default='size',
+                          help='order of classes in the histogram')
+
+
+def konan_heap_command(debugger, command, result, internal_dict):
+    """konan_heap [histogram|find] [filter]: shows number and shallow size of Kotlin objects by class, or addresses
+    of objects of the matching classes."""
+    args = _HEAP_PARSER.parse_command(command, result)
+    if args is None:
+        return
+    target = debugger.GetSelectedTarget()
+    process = target.GetProcess()
+    if not _memory_layout_known(process):
+        result.SetError("process memory can't be read")
+        return
+    names = class_names(target)
+    if not names:
+        result.SetError("no Kotlin classes found in the target")
+        return
+    mask = re.compile(args.filter) if args.filter else None
+    matches = {}
+    start = time.monotonic()
+    objects = heap_objects(process, names)
+    if args.action == 'find':
+        found = 0
+        for (address, tip, size) in objects:
+            if tip not in matches:
+                matches[tip] = mask is None or mask.search(names[tip]) is not None
+            if not matches[tip]:
+                continue
+            if found == args.count:
+                result.AppendMessage("... more objects, use --count to see them")
+                return
+            result.AppendMessage("{:#x} {} {}".format(address, names[tip], size))
+            found += 1
+        result.AppendMessage("{} objects found".format(found))
+        return
+
+    histogram = {}
+    for (address, tip, size) in objects:
+        entry = histogram.get(tip)
+        if entry is None:
+            histogram[tip] = [1, size]
+        else:
+            entry[0] += 1
+            entry[1] += size
+    rows = [(names[tip], count, size) for (tip, (count, size)) in histogram.items()
+            if mask is None or mask.search(names[tip])]
+    rows.sort(key={'size': lambda row: (-row[2], row[0]), 'count': lambda row: (-row[1], row[0]),
+                   'name': lambda row: row[0]}[args.sort])
+    result.AppendMessage("{:>10} {:>14}  {}".format('count', 'bytes', 'class'))
+    for (name, count, size) in rows[:args.count]:
+        result.AppendMessage("{:>10} {:>14}  {}".format(count, size, name))
+    if len(rows) > args.count:
+        result.AppendMessage("... {} more classes, use --count to see them".format(len(rows) - args.count))
+    result.AppendMessage("{} objects, {} bytes of {} classes, scanned in {:.2f}s".format(
+        sum(row[1] for row in rows), sum(row[2] for row in rows), len(rows), time.monotonic() - start))
+
+
+# First line of files written by konan_graph, the number is version of the format
+_GRAPH_HEADER = '# konan object graph 1'
+
+
+def _object_type_info(process, address, names, error):
+    """TypeInfo of the object, looking through its meta-object if there is one, None if it isn't a Kotlin object."""
+    header = read_pointer(process, address, error) & ~0x3
+    if error.Success() and header not in names:
+        header = read_pointer(process, header, error)
+    return header if error.Success() and header in names else None
+
+
+def _object_size(process, address, instance_size):
+    """Shallow size of the object, instance_size is TypeInfo::instanceSize_ of its type."""
+    pointer_size = process.GetAddressByteSize()
+    if instance_size >= 0:
+        return _align_up(instance_size, pointer_size)
+    count = _array_count(process, address) or 0
+    return _align_up(_array_header_size(pointer_size) - instance_size * count, pointer_size)
+
+
+def _field_references(data, layout, byte_order, pointer_size):
+    """(field name, address) of non-null references among the object fields, data are bytes of the object."""
+    word_format = byte_order + ('Q' if pointer_size == 8 else 'I')
+    references = []
+    for (name, offset, runtime_type) in zip(layout.names, layout.offsets, layout.types):
+        if runtime_type == 1 and offset + pointer_size <= len(data):
+            child = struct.unpack_from(word_format, data, offset)[0]
+            if child:
+                references.append((name, child))
+    return references
+
+
+def _object_references(process, address, instance_size, layout, error):
+    """Shallow size of the object and (label, address) of its non-null references. Objects are read with a single
+    read, elements of arrays with a read per HEAP_SCAN_CHUNK_SIZE."""
+    pointer_size = process.GetAddressByteSize()
+    byte_order = _byte_order(process.GetTarget())
+    word_format = 'Q' if pointer_size == 8 else 'I'
+    if instance_size >= 0:
+        size = _object_size(process, address, instance_size)
+        data = read_memory(process, address, size, error)
+        return size, _field_references(data, layout, byte_order, pointer_size) if error.Success() else []
+    header_size = _array_header_size(pointer_size)
+    count = _array_count(process, address) or 0
+    size = _align_up(header_size - instance_size * count, pointer_size)
+    if layout.fields_count != -1:
+        return size, []
+    references = []
+    chunk = max(HEAP_SCAN_CHUNK_SIZE // pointer_size, 1)
+    for first in range(0, count, chunk):
+        length = min(chunk, count - first)
+        data = read_memory(process, address + header_size + first * pointer_size, length * pointer_size, error)
+        if not error.Success():
+            break
+        elements = struct.unpack('{}{}{}'.format(byte_order, length, word_format), data)
+        references.extend(('[{}]'.format(index), child) for (index, child) in enumerate(elements, first) if child)
+    return size, references
+
+
+def object_graph(process, root, names, max_objects):
+    """Walks objects reachable from root breadth first and yields (id, address, type info, shallow size,
+    [(label, child id)]) for each of them in order of ids, root gets id 0. Only ids of found objects are kept, so
+    memory use is bounded by max_objects: references to objects beyond the limit are dropped."""
+    ids = {root: 0}
+    queue = deque([root])
+    instance_sizes = {}
+    error = lldb.SBError()
+    while queue:
+        address = queue.popleft()
+        tip = _object_type_info(process, address, names, error)
+        if tip is not None and tip not in instance_sizes:
+            instance_sizes[tip] = _instance_size(process, tip)
+        if tip is None or instance_sizes[tip] is None:
+            error.Clear()
+            yield ids[address], address, None, 0, []
+            continue
+        instance_size = instance_sizes[tip]
+        layout = _type_layout_at(address, tip, instance_size < 0)
+        (size, references) = _object_references(process, address, instance_size, layout, error)
+        error.Clear()
+        edges = []
+        for (label, child) in references:
+            child_id = ids.get(child)
+            if child_id is None:
+                if len(ids) >= max_objects:
+                    continue
+                child_id = ids[child] = len(ids)
+                queue.append(child)
+            edges.append((label, child_id))
+        yield ids[address], address, tip, size, edges
+
+
+def _open_graph(path, mode):
+    path = os.path.expanduser(path)
+    return gzip.open(path, mode + 't') if path.endswith('.gz') else open(path, mode)
+
+
+def write_object_graph(f, nodes, names):
+    """Writes the graph as lines of: c <class id> <class name>, once per class before its first object;
+    n <id> <address> <shallow size> <class id>; e <from id> <to id> <field name or [index]>."""
+    f.write(_GRAPH_HEADER + '\n')
+    classes = {None: 0}
+    f.write('c 0 <unknown>\n')
+    count = 0
+    for (node, address, tip, size, edges) in nodes:
+        if tip not in classes:
+            classes[tip] = len(classes)
+            f.write('c {} {}\n'.format(classes[tip], names[tip]))
+        f.write('n {} {:#x} {} {}\n'.format(node, address, size, classes[tip]))
+        for (label, child) in edges:
+            f.write('e {} {} {}\n'.format(node, child, label))
+        count += 1
+    return count
+
+
+def read_object_graph(f):
+    """Reads the graph written by write_object_graph as (addresses, sizes, class names, successors) indexed by id."""
+    if f.readline().rstrip('\n') != _GRAPH_HEADER:
+        raise DebuggerException("not an object graph written by konan_graph")
+    classes, addresses, sizes, node_classes, successors = {}, [], [], [], []
+    for line in f:
+        (kind, first, second, rest) = (line.rstrip('\n').split(' ', 3) + [''])[:4]
+        if kind == 'e':
+            successors[int(first)].append(int(second))
+        elif kind == 'n':
+            addresses.append(int(second, 16))
+            (size, class_id) = rest.split(' ')
+            sizes.append(int(size))
+            node_classes.append(classes[class_id])
+            successors.append([])
+        elif kind == 'c':
+            classes[first] = second if not rest else second + ' ' + rest
+    return addresses, sizes, node_classes, successors
+
+
+def dominators(successors, root=0):
+    """Immediate dominators of nodes reachable from root, and the nodes in post order, by the iterative algorithm of
+    Cooper, Harvey and Kennedy. Immediate dominator of root is root itself, of unreachable nodes is None."""
+    count = len(successors)
+    order = []
+    visited = bytearray(count)
+    visited[root] = 1
+    stack = [(root, iter(successors[root]))]
+    while stack:
+        (node, children) = stack[-1]
+        for child in children:
+            if not visited[child]:
+                visited[child] = 1
+                stack.append((child, iter(successors[child])))
+                break
+        else:
+            stack.pop()
+            order.append(node)
+    position = [0] * count
+    predecessors = [[] for _ in range(count)]
+    for (index, node) in enumerate(order):
+        position[node] = index
+        for child in successors[node]:
+            predecessors[child].append(node)
+
+    idom = [None] * count
+    idom[root] = root
+    changed = True
+    while changed:
+        changed = False
+        for node in reversed(order):
+            if node == root:
+                continue
+            dominator = None
+            for predecessor in predecessors[node]:
+                if idom[predecessor] is None:
+                    continue
+                if dominator is None:
+                    dominator = predecessor
+                    continue
+                while predecessor != dominator:
+                    while position[predecessor] < position[dominator]:
+                        predecessor = idom[predecessor]
+                    while position[dominator] < position[predecessor]:
+                        dominator = idom[dominator]
+            if idom[node] != dominator:
+                idom[node] = dominator
+                changed = True
+    return idom, order
+
+
+def retained_sizes(sizes, successors, root=0):
+    """Sizes of objects which would be freed together with each object: sum of shallow sizes over its subtree in the
+    dominator tree. Immediate dominators are returned too."""
+    (idom, order) = dominators(successors, root)
+    retained = list(sizes)
+    for node in order:
+        if node != root and idom[node] is not None:
+            retained[idom[node]] += retained[node]
+    return retained, idom
+
+
+def _graph_root(debugger, text):
+    """Address of the object referenced by a variable of the selected frame, a top level property or an address."""
+    frame = debugger.GetSelectedTarget().GetProcess().GetSelectedThread().GetSelectedFrame()
+    if frame.IsValid():
+        value = frame.GetValueForVariablePath(text)
+        if value.IsValid():
+            return value.unsigned
+    storage = symbol_index(debugger).address('kvar:{}#internal'.format(text))
+    if storage:
+        error = lldb.SBError()
+        address = read_pointer(debugger.GetSelectedTarget().GetProcess(), storage, error)
+        return address if error.Success() else None
+    try:
+        return int(text, 0)
+    except ValueError:
+        return None
+
+
+_GRAPH_PARSER = _CommandParser(prog='konan_graph', description='Export graph of Kotlin objects reachable from a root '
+                                                               'and compute retained sizes from an exported graph.')
+_GRAPH_PARSER.add_argument('action', choices=('export', 'retained'))
+_GRAPH_PARSER.add_argument('root', metavar='ROOT|FILE',
+                           help='variable, top level property or address to start export from, file to read for retained')
+_GRAPH_PARSER.add_argument('file', nargs='?', default=None,
+                           help='file to export the graph to, files ending with .gz are compressed')
+_GRAPH_PARSER.add_argument('-m', '--max-objects', type=int, default=1000000, help='maximal number of objects to export')
+_GRAPH_PARSER.add_argument('-c', '--count', type=int, default=20, help='number of the biggest objects to show')
+
+
+def konan_graph_command(debugger, command, result, internal_dict):
+    """konan_graph export ROOT FILE | retained FILE: writes graph of objects reachable from ROOT to FILE and shows
+    objects retaining the most memory in an exported graph."""
+    args = _GRAPH_PARSER.parse_command(command, result)
+    if args is None:
+        return
+    if (args.file is None) == (args.action == 'export'):
+        result.SetError(_GRAPH_PARSER.format_usage())
+        return
+    if args.action == 'retained':
+        try:
+            with _open_graph(args.root, 'r') as f:
+                (addresses, sizes, classes, successors) = read_object_graph(f)
+        except (DebuggerException, OSError, ValueError, IndexError, KeyError) as e:
+            result.SetError("can't read graph from {}: {}".format(args.root, e))
+            return
+        if not addresses:
+            result.SetError("graph is empty")
+            return
+        (retained, idom) = retained_sizes(sizes, successors)
+        result.AppendMessage("{:>14} {:>10} {:>10} {:>18}  {}".format('retained', 'shallow', 'dominator', 'address',
+                                                                      'class'))
+        for node in sorted(range(len(sizes)), key=lambda node: -retained[node])[:args.count]:
+            result.AppendMessage("{:>14} {:>10} {:>10} {:>#18x}  {}".format(
+                retained[node], sizes[node], idom[node] if node else '-', addresses[node], classes[node]))
+        return
+
+    process = debugger.GetSelectedTarget().GetProcess()
+    if not _memory_layout_known(process):
+        result.SetError("process memory can't be read")
+        return
+    root = _graph_root(debugger, args.root)
+    if not root:
+        result.SetError("{} isn't a variable, top level property or address of an object".format(args.root))
+        return
+    names = class_names(debugger.GetSelectedTarget())
+    start = time.monotonic()
+    try:
+        with _open_graph(args.file, 'w') as f:
+            count = write_object_graph(f, object_graph(process, root, names, args.max_objects), names)
+    except OSError as e:
+        result.SetError("can't write graph to {}: {}".format(args.file, e))
+        return
+    except DebuggerException as e:
+        result.SetError("can't read objects reachable from {}{}".format(args.root,
+                                                                      ": {}".format(e) if str(e) else ""))
+        return
+    result.AppendMessage("{} objects are written to {} in {:.2f}s{}".format(
+        count, args.file, time.monotonic() - start,
+        ", --max-objects limit is reached" if count >= args.max_objects else ""))
+
+
+def _frame_locals(frame, budget):
+    """Names and summaries of object arguments and locals of the frame, ... for the ones beyond the budget."""
+    variables = frame.GetVariables(True, True, False, True)
+    result = []
+    for index in range(variables.GetSize()):
+        value = variables.GetValueAtIndex(index)
+        if value.GetTypeName() != 'ObjHeader *':
+            continue
+        try:
+            summary = ELLIPSIS if budget.exhausted() else object_summary(value, budget=budget)
+        except DebuggerException:
+            summary = value.GetValue()
+        result.append((value.GetName(), summary))
+    return result
+
+
+def thread_backtraces(threads, max_frames, budget):
+    """Backtraces of the threads with summaries of object locals, computed with the shared budget. Threads having
+    identical backtraces are grouped, as are the threads of a thread pool waiting for work. Returns list of
+    ([thread index ids], [(pc, function, [(name, summary)])], number of frames) in order of the first threads."""
+    groups = OrderedDict()
+    for thread in threads:
+        frames_count = thread.GetNumFrames()
+        frames = []
+        for index in range(min(frames_count, max_frames)):
+            frame = thread.GetFrameAtIndex(index)
+            frames.append((frame.GetPC(), frame.GetFunctionName() or '???', tuple(_frame_locals(frame, budget))))
+        groups.setdefault((tuple(frames), frames_count), []).append(thread.GetIndexID())
+    return [(ids, list(frames), frames_count) for ((frames, frames_count), ids) in groups.items()]
+
+
+def _id_ranges(ids):
+    """Formats sorted ids as #1-#3, #5."""
+    ranges = []
+    for i in ids:
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ", ".join("#{}".format(first) if first == last else "#{}-#{}".format(first, last)
+                     for (first, last) in ranges)
+
+
+def _backtraces_text(groups):
+    for (ids, frames, frames_count) in groups:
+        yield "{} thread{}: {}".format(len(ids), 's' if len(ids) > 1 else '', _id_ranges(ids))
+        for (index, (pc, function, variables)) in enumerate(frames):
+            yield "  frame #{}: {:#018x} {}".format(index, pc, function)
+            for (name, summary) in variables:
+                yield "    {} = {}".format(name, summary)
+        if frames_count > len(frames):
+            yield "  ... {} more frames".format(frames_count - len(frames))
+
+
+def _backtraces_json(groups):
+    return [{'threads': ids, 'frames_count': frames_count,
+             'frames': [{'pc': pc, 'function': function,
+                         'locals': [{'name': name, 'summary': summary} for (name, summary) in variables]}
+                        for (pc, function, variables) in frames]}
+            for (ids, frames, frames_count) in groups]
+
+
+_BT_PARSER = _CommandParser(prog='konan_bt', description='Show backtraces with summaries of Kotlin object locals, '
+                                                         'threads having identical backtraces are shown once.')
+_BT_PARSER.add_argument('threads', nargs='?', choices=('current', 'all'), default='current',
+                        help='backtrace of the selected thread or of all threads')
+_BT_PARSER.add_argument('-c', '--count', type=int, default=64, help='maximal number of frames per thread')
+_BT_PARSER.add_argument('-f', '--format', choices=('text', 'json'), default='text', help='format of the report')
+_BT_PARSER.add_argument('-o', '--output', default=None, help='file to write the report to')
+_BT_PARSER.add_argument('-t', '--time', type=float, default=5.0, help='seconds to spend on summaries of all locals')
+_BT_PARSER.add_argument('-e', '--evaluations', type=int, default=1000,
+                        help='number of expression evaluations to spend on summaries of all locals')
+
+
+def konan_bt_command(debugger, command, result, internal_dict):
+    """konan_bt [current|all]: backtraces with summaries of Kotlin objects, identical ones are grouped."""
+    args = _BT_PARSER.parse_command(command, result)
+    if args is None:
+        return
+    process = debugger.GetSelectedTarget().GetProcess()
+    if not process.IsValid():
+        result.SetError("there is no process")
+        return
+    start = time.monotonic()
+    threads = [process.GetThreadAtIndex(index) for index in range(process.GetNumThreads())] \
+        if args.threads == 'all' else [process.GetSelectedThread()]
+    budget = SummaryBudget(args.time, args.evaluations)
+    groups = thread_backtraces(threads, args.count, budget)
+    if args.format == 'json':
+        report = [json.dumps({'threads': len(threads), 'budget_exhausted': budget.exhausted(),
+                              'backtraces': _backtraces_json(groups)}, indent=1)]
+    else:
+        report = list(_backtraces_text(groups))
+        report.append("{} threads, {} distinct backtraces in {:.2f}s{}".format(
+            len(threads), len(groups), time.monotonic() - start,
+            ", summaries were cut by the budget, see --time and --evaluations" if budget.exhausted() else ""))
+    if args.output is None:
+        for line in report:
+            result.AppendMessage(line)
+        return
+    try:
+        with open(os.path.expanduser(args.output), 'w') as f:
+            f.write("\n".join(report) + "\n")
+    except OSError as e:
+        result.SetError("can't write report to {}: {}".format(args.output, e))
+        return
+    result.AppendMessage("backtraces of {} threads are written to {}".format(len(threads), args.output))
+
+
+def object_value(target, address, name):
+    """ObjHeader * value referring to the object at the address."""
+    data = lldb.SBData()
+    error = lldb.SBError()
+    data.SetData(error, struct.pack(_byte_order(target) + ('Q' if target.GetAddressByteSize() == 8 else 'I'), address),
+                 target.GetByteOrder(), target.GetAddressByteSize())
+    return target.CreateValueFromData(name, data, target.FindFirstType('ObjHeader').GetPointerType())
+
+
+def watch_snapshot(process, root, names, depth, max_objects, max_bytes):
+    """Bytes of the objects reachable from root within depth references, at most max_objects of them and first
+    max_bytes of each, read with a single read per object: ordered map of address to (type info, bytes)."""
+    pointer_size = process.GetAddressByteSize()
+    byte_order = _byte_order(process.GetTarget())
+    header_size = _array_header_size(pointer_size)
+    objects = OrderedDict()
+    instance_sizes = {}
+    seen = {root}
+    queue = deque([(root, 0)])
+    error = lldb.SBError()
+    while queue:
+        (address, level) = queue.popleft()
+        tip = _object_type_info(process, address, names, error)
+        if tip is not None and tip not in instance_sizes:
+            instance_sizes[tip] = _instance_size(process, tip)
+        instance_size = instance_sizes.get(tip)
+        if instance_size is None:
+            error.Clear()
+            continue
+        data = read_memory(process, address, min(_object_size(process, address, instance_size), max_bytes), error)
+        if not error.Success():
+            error.Clear()
+            continue
+        objects[address] = (tip, data)
+        if level >= depth:
+            continue
+        layout = _type_layout_at(address, tip, instance_size < 0)
+        if instance_size >= 0:
+            children = [child for (_, child) in _field_references(data, layout, byte_order, pointer_size)]
+        elif layout.fields_count == -1:
+            words = (len(data) - header_size) // pointer_size
+            children = [child for child in struct.unpack_from(
+                '{}{}{}'.format(byte_order, max(words, 0), 'Q' if pointer_size == 8 else 'I'), data, header_size) if child]
+        else:
+            children = []
+        for child in children:
+            if child not in seen and len(seen) < max_objects:
+                seen.add(child)
+                queue.append((child, level + 1))
+    return objects
+
+
+def _format_field(data, offset, value_format, runtime_type):
+    value = struct.unpack_from(value_format, data, offset)[0]
+    if runtime_type == 1:
+        return "{:#x}".format(value) if value else NULL
+    if runtime_type == 9:
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def field_changes(layout, old, new, pointer_size, byte_order, limit):
+    """(field name or [index], old value, new value) of fields and elements which bytes differ, at most limit of them."""
+    if layout.is_array():
+        runtime_type = -layout.fields_count
+        element_format = _runtime_type_format(runtime_type, pointer_size)
+        if element_format is None:
+            return []
+        element_size = struct.calcsize(element_format)
+        start = _align_up(_array_header_size(pointer_size), element_size)
+        fields = [('[{}]'.format(index), start + index * element_size, runtime_type)
+                  for index in range(max((min(len(old), len(new)) - start) // element_size, 0))]
+    else:
+        fields = list(zip(layout.names, layout.offsets, layout.types))
+    changes = []
+    for (name, offset, runtime_type) in fields:
+        value_format = _runtime_type_format(runtime_type, pointer_size)
+        if value_format is None:
+            continue
+        end = offset + struct.calcsize(value_format)
+        if end > len(old) or end > len(new) or old[offset:end] == new[offset:end]:
+            continue
+        changes.append((name, _format_field(old, offset, byte_order + value_format, runtime_type),
+                        _format_field(new, offset, byte_order + value_format, runtime_type)))
+        if len(changes) >= limit:
+            break
+    return changes
+
+
+class _Watch:
+    """Expression watched by konan_watch with the last snapshot of objects reachable from it: address to
+    (type info, bytes, summary). Objects which bytes didn't change since the snapshot keep their summaries."""
+    def __init__(self, expression, depth, max_objects, max_bytes):
+        self.expression = expression
+        self.depth = depth
+        self.max_objects = max_objects
+        self.max_bytes = max_bytes
+        self.root = None
+        self.objects = {}
+
+    def update(self, debugger):
+        """Takes a new snapshot, returns (root, [(address, type info, old entry or None, new entry)], [removed
+        addresses]) for the objects which appeared or changed since the previous one."""
+        target = debugger.GetSelectedTarget()
+        process = target.GetProcess()
+        root = _graph_root(debugger, self.expression)
+        snapshot = watch_snapshot(process, root, class_names(target), self.depth, self.max_objects,
+                                  self.max_bytes) if root else {}
+        objects = {}
+        changed = []
+        for (address, (tip, data)) in snapshot.items():
+            old = self.objects.get(address)
+            if old is not None and old[0] == tip and old[1] == data:
+                objects[address] = old
+                continue
+            summary = value_summary(object_value(target, address, self.expression), TO_STRING_DEPTH, SummaryBudget())
+            objects[address] = (tip, data, summary)
+            changed.append((address, tip, old, objects[address]))
+        removed = [address for address in self.objects if address not in objects]
+        self.root = root
+        self.objects = objects
+        return root, changed, removed
+
+
+# Watched expressions to their _Watch, in order of konan_watch add
+_WATCHES = OrderedDict()
+# Id of the stop hook running konan_watch diff, see konan_watch auto
+_WATCH_STOP_HOOK = {}
+_STOP_HOOK_ADDED = re.compile(r'Stop hook #(\d+) added')
+
+
+def _watch_report(debugger, watch, limit):
+    target = debugger.GetSelectedTarget()
+    pointer_size = target.GetAddressByteSize()
+    byte_order = _byte_order(target)
+    names = class_names(target)
+    previous_root = watch.root
+    (root, changed, removed) = watch.update(debugger)
+    if not root:
+        yield "{}: can't be evaluated to an object".format(watch.expression)
+        return
+    if previous_root is None:
+        yield "{}: watching {} objects".format(watch.expression, len(watch.objects))
+        return
+    yield "{}: {} of {} objects changed{}{}".format(
+        watch.expression, len(changed), len(watch.objects),
+        ", {} gone".format(len(removed)) if removed else "",
+        ", now refers to {:#x}".format(root) if root != previous_root else "")
+    for (address, tip, old, new) in changed[:limit]:
+        if old is None:
+            yield "  {:#x} {} (new) = {}".format(address, names.get(tip), new[2])
+            continue
+        yield "  {:#x} {} = {}".format(address, names.get(tip), new[2])
+        if _type_info_kind(target.GetProcess(), tip) == 1:
+            continue
+        layout = _type_layout_at(address, tip, _instance_size(target.GetProcess(), tip) < 0)
+        for (name, old_value, new_value) in field_changes(layout, old[1], new[1], pointer_size, byte_order, limit):
+            yield "    {}: {} -> {}".format(name, old_value, new_value)
+    if len(changed) > limit:
+        yield "  ... {} more".format(len(changed) - limit)
+
+
+def _append_watch_report(debugger, watch, limit, result):
+    """Appends the report of the watch to the result, objects which can't be read are reported as an error, so the
+    other watches are still reported by the stop hook."""
+    try:
+        for line in _watch_report(debugger, watch, limit):
+            result.AppendMessage(line)
+    except DebuggerException as e:
+        result.SetError("{}: objects can't be read{}".format(watch.expression, ": {}".format(e) if str(e) else ""))
+
+
+_WATCH_PARSER = _CommandParser(prog='konan_watch', description='Watch Kotlin objects reachable from expressions and '
+                                                               'show what changed in them between stops.')
+_WATCH_PARSER.add_argument('action', nargs='?', choices=('diff', 'add', 'remove', 'clear', 'list', 'auto'),
+                           default='diff', help='diff shows the changes since the last diff or add, auto on|off runs '
+                                                'diff on every stop')
+_WATCH_PARSER.add_argument('expression', nargs='?', default=None,
+                           help='variable, top level property or address of an object; on or off for auto')
+_WATCH_PARSER.add_argument('-d', '--depth', type=int, default=2, help='number of references to follow from the root')
+_WATCH_PARSER.add_argument('-n', '--max-objects', type=int, default=1000, help='maximal number of watched objects')
+_WATCH_PARSER.add_argument('-b', '--max-bytes', type=int, default=4096,
+                           help='number of the first bytes of every object which are compared')
+_WATCH_PARSER.add_argument('-c', '--count', type=int, default=10,
+                           help='number of changed objects and of changed fields per object to show')
+
+
+def konan_watch_command(debugger, command, result, internal_dict):
+    """konan_watch [diff|add EXPR|remove EXPR|clear|list|auto on|off]: snapshots objects reachable from watched
+    expressions and shows the objects and fields which changed since the previous snapshot."""
+    args = _WATCH_PARSER.parse_command(command, result)
+    if args is None:
+        return
+    if (args.expression is None) == (args.action in ('add', 'remove', 'auto')):
+        result.SetError(_WATCH_PARSER.format_usage())
+        return
+    if args.action == 'add':
+        _WATCHES[args.expression] = _Watch(args.expression, args.depth, args.max_objects, args.max_bytes)
+        _append_watch_report(debugger, _WATCHES[args.expression], args.count, result)
+    elif args.action == 'remove':
+        if _WATCHES.pop(args.expression, None) is None:
+            result.SetError("{} isn't watched".format(args.expression))
+    elif args.action == 'clear':
+        _WATCHES.clear()
+    elif args.action == 'list':
+        for watch in _WATCHES.values():
+            result.AppendMessage("{}: depth {}, {} objects".format(watch.expression, watch.depth, len(watch.objects)))
+    elif args.action == 'auto':
+        _watch_auto(debugger, args.expression, result)
+    elif not _WATCHES:
+        result.AppendMessage("nothing is watched, add expressions with: konan_watch add EXPR")
+    else:
+        for watch in _WATCHES.values():
+            _append_watch_report(debugger, watch, args.count, result)
+
+
+def _watch_auto(debugger, mode, result):
+    interpreter = debugger.GetCommandInterpreter()
+    output = lldb.SBCommandReturnObject()
+    if mode == 'on' and 'id' not in _WATCH_STOP_HOOK:
+        interpreter.HandleCommand('target stop-hook add -o "konan_watch diff"', output)
+        match = _STOP_HOOK_ADDED.search(output.GetOutput() or '')
+        if not output.Succeeded() or match is None:
+            result.SetError("stop hook can't be added: {}".format(output.GetError() or output.GetOutput()))
+            return
+        _WATCH_STOP_HOOK['id'] = match.group(1)
+    elif mode == 'off' and 'id' in _WATCH_STOP_HOOK:
+        interpreter.HandleCommand('target stop-hook delete {}'.format(_WATCH_STOP_HOOK.pop('id')), output)
+    elif mode not in ('on', 'off'):
+        result.SetError("auto should be on or off")
+        return
+    result.AppendMessage("konan_watch diff runs on every stop: {}".format('on' if 'id' in _WATCH_STOP_HOOK else 'off'))
+
+
+def _batch_value(debugger, text):
+    """Value of a variable path of the selected frame, a top level property or an expression."""
+    target = debugger.GetSelectedTarget()
+    frame = target.GetProcess().GetSelectedThread().GetSelectedFrame()
+    if frame.IsValid():
+        value = frame.GetValueForVariablePath(text)
+        if value.IsValid():
+            return value
+    index = symbol_index(debugger)
+    storage = index.address('kvar:{}#internal'.format(text))
+    if storage:
+        kotlin_types = [match.group(2) for match in map(__KONAN_VARIABLE_TYPE.match,
+                                                        index.names_with_prefix('kfun:<get-{}>()'.format(text)))
+                        if match and match.group(1) == text]
+        c_type = __TYPES_KONAN_TO_C[kotlin_types[0]][0] if kotlin_types and kotlin_types[0] in __TYPES_KONAN_TO_C \
+            else 'ObjHeader *'
+        return _read_global_storage(target, storage, c_type, text)
+    if memory_only():
+        return None
+    value = evaluate(text)
+    return value if value.IsValid() and value.GetError().Success() else None
+
+
+def _batch_kind(value):
+    if value.GetTypeName() != 'ObjHeader *':
+        return None
+    if value.unsigned == 0:
+        return NULL
+    return object_kind(value)[1]
+
+
+def _batch_summary(value, depth, budget):
+    if budget.exhausted():
+        return ELLIPSIS
+    if value.GetTypeName() == 'ObjHeader *':
+        return value_summary(value, depth, budget)
+    return value.GetSummary() or value.GetValue()
+
+
+def batch_entry(debugger, text, depth, max_children, budget):
+    """Summary, kind and first level children of the value, as a dictionary ready for JSON."""
+    entry = {'path': text}
+    try:
+        value = None if budget.exhausted() else _batch_value(debugger, text)
+        if value is None:
+            entry['error'] = "can't be evaluated" if not budget.exhausted() else "budget is exhausted"
+            return entry
+        entry.update(type=value.GetTypeName(), kind=_batch_kind(value))
+        if entry['kind'] is None or entry['kind'] == NULL:
+            entry['summary'] = _batch_summary(value, depth, budget)
+            return entry
+        entry.update(address="{:#x}".format(value.unsigned), summary=object_summary(value, budget=budget))
+        provider = KonanProxyTypeProvider(value, {})
+        entry['children_count'] = provider.num_children()
+        children = []
+        for index in range(min(entry['children_count'], max_children)):
+            if budget.exhausted():
+                break
+            child = provider.get_child_at_index(index)
+            if child is None:
+                break
+            children.append({'name': child.GetName(), 'type': child.GetTypeName(), 'kind': _batch_kind(child),
+                             'summary': _batch_summary(child, depth, budget)})
+        entry['children'] = children
+    except DebuggerException:
+        entry['error'] = "can't be formatted"
+    return entry
+
+
+_BATCH_PARSER = _CommandParser(prog='konan_print_batch', description='Print summaries and first level children of '
+                                                                     'several values as a single JSON document.')
+_BATCH_PARSER.add_argument('paths', nargs='+', help='variable paths, top level properties or expressions')
+_BATCH_PARSER.add_argument('-c', '--children', type=int, default=100, help='maximal number of children per value')
+_BATCH_PARSER.add_argument('-d', '--depth', type=int, default=TO_STRING_DEPTH, help='depth of children summaries')
+_BATCH_PARSER.add_argument('-t', '--time', type=float, default=2.0, help='seconds to spend on all values')
+_BATCH_PARSER.add_argument('-e', '--evaluations', type=int, default=200,
+                           help='number of expression evaluations to spend on all values')
+
+
+def konan_print_batch_command(debugger, command, result, internal_dict):
+    """konan_print_batch PATH...: values for IDE frontends in a single round trip, the ones beyond the budget are
+    reported without summaries."""
+    args = _BATCH_PARSER.parse_command(command, result)
+    if args is None:
+        return
+    budget = SummaryBudget(args.time, args.evaluations)
+    values = [batch_entry(debugger, path, args.depth, args.children, budget) for path in args.paths]
+    result.AppendMessage(json.dumps({'stop_id': debugger.GetSelectedTarget().GetProcess().GetStopID(),
+                                     'budget_exhausted': budget.exhausted(), 'values': values}))
+
+
+_PREDICATE_TOKEN = re.compile(r'\s*(?:(-?(?:0x[0-9a-fA-F]+|\d+\.\d*|\.\d+|\d+))|("(?:[^"\\]|\\.)*")|'
+                              r'(==|!=|<=|>=|&&|\|\||!is\b|[<>!().])|([A-Za-z_$][\w$]*))')
+_PREDICATE_COMPARISONS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
+# Field offsets and runtime types by (type info, field name) and results of is checks by (type info, class type info)
+_PREDICATE_CACHE = _LruCache(4096)
+
+
+def _frame_variable(frame, name):
+    value = frame.FindVariable(name)
+    if not value.IsValid() and name == 'this':
+        value = frame.FindVariable('<this>')
+    if not value.IsValid():
+        raise DebuggerException("{} isn't found".format(name))
+    return value
+
+
+def _predicate_field(process, address, name):
+    """Offset and runtime type of the field of the object at the address, the layout is decoded from memory when it
+    can be, so breakpoint callbacks don't run code in the process."""
+    error = lldb.SBError()
+    tip = _object_type_info(process, address, class_names(process.GetTarget()), error)
+    if tip is None:
+        raise DebuggerException("{:#x} isn't a Kotlin object".format(address))
+    field = _PREDICATE_CACHE.get(('field', tip, name))
+    if field is None:
+        layout = SYNTHETIC_OBJECT_LAYOUT_CACHE.get(tip)
+        if layout is None:
+            layout = _type_layout_from_memory(process, tip)
+            layout = _type_layout_at(address, tip, False) if layout is None else \
+                SYNTHETIC_OBJECT_LAYOUT_CACHE.put(tip, layout)
+        if name not in layout.names:
+            raise DebuggerException("{} has no field {}".format(class_names(process.GetTarget()).get(tip), name))
+        index = layout.names.index(name)
+        field = _PREDICATE_CACHE.put(('field', tip, name), (layout.offsets[index], layout.types[index]))
+    return field
+
+
+def _predicate_primitive(name, text):
+    """Parses the value of a primitive variable as shown by LLDB, chars and values other than booleans and numbers
+    can't be compared."""
+    if text in ('true', 'false'):
+        return text == 'true'
+    try:
+        return int(text, 0)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        raise DebuggerException("{} = {} isn't a boolean or a number".format(name, text))
+
+
+def _predicate_path(names):
+    """Compiles a.b.c to a function of the frame returning (runtime type, value) of the last field, runtime type is
+    None for variables which aren't Kotlin objects."""
+    def evaluate_path(frame):
+        value = _frame_variable(frame, names[0])
+        if value.GetTypeName() != 'ObjHeader *':
+            if len(names) > 1:
+                raise DebuggerException("{} isn't a Kotlin object".format(names[0]))
+            return None, _predicate_primitive(names[0], value.GetValue() or '')
+        (runtime_type, result) = (1, value.unsigned)
+        process = frame.GetThread().GetProcess()
+        for (index, name) in enumerate(names[1:]):
+            if runtime_type != 1 or result == 0:
+                raise DebuggerException("{} is {}".format('.'.join(names[:index + 1]), NULL if result == 0 else result))
+            (offset, runtime_type) = _predicate_field(process, result, name)
+            value_format = _runtime_type_format(runtime_type, process.GetAddressByteSize())
+            if value_format is None:
+                raise DebuggerException("{} has unsupported type".format('.'.join(names[:index + 2])))
+            error = lldb.SBError()
+            data = read_memory(process, result + offset, struct.calcsize(value_format), error)
+            if not error.Success():
+                raise DebuggerException(error.GetCString())
+            result = struct.unpack(_byte_order(process) + value_format, data)[0]
+        return runtime_type, result
+    return evaluate_path
+
+
+def _is_subclass(process, tip, class_tip):
+    """Whether the type is the class, extends it or implements it when it's an interface."""
+    cached = _PREDICATE_CACHE.get(('is', tip, class_tip))
+    if cached is not None:
+        return cached
+    pointer_size = process.GetAddressByteSize()
+    interfaces_offset = _align_up(4 * pointer_size + 12, pointer_size)
+    error = lldb.SBError()
+    result = False
+    current = tip
+    while current and not result and error.Success():
+        result = current == class_tip
+        interfaces = read_pointer(process, current + interfaces_offset, error)
+        count = read_unsigned(process, current + interfaces_offset + pointer_size, 4, error) if interfaces else 0
+        if count and count < 0x10000 and error.Success():
+            data = read_memory(process, interfaces, count * pointer_size, error)
+            result = result or (error.Success() and class_tip in struct.unpack(
+                '{}{}{}'.format(_byte_order(process), count, 'Q' if pointer_size == 8 else 'I'), data))
+        current = read_pointer(process, current + 2 * pointer_size + 8, error)
+    return _PREDICATE_CACHE.put(('is', tip, class_tip), result)
+
+
+def _predicate_string_equals(process, address, text):
+    if address == 0:
+        return False
+    error = lldb.SBError()
+    tip = _object_type_info(process, address, class_names(process.GetTarget()), error)
+    if tip is None or tip != _runtime_symbol('kclass:kotlin.String', tip):
+        return False
+    return read_string(process, address, len(text.encode('utf-16-le')) // 2 + 1) == text
+
+
+class _PredicateParser:
+    """Recursive descent parser of breakpoint predicates:
+
+        predicate := conjunction ('||' conjunction)*
+        conjunction := negation ('&&' negation)*
+        negation := '!' negation | '(' predicate ')' | path ('is' | '!is') class | operand (comparison operand)?
+        operand := path | number | "string" | true | false | null
+
+    A path is a variable of the frame followed by names of fields. Strings are compared with == and != only."""
+    def __init__(self, text):
+        self._tokens = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = _PREDICATE_TOKEN.match(text, position)
+            if match is None or match.end() == position:
+                raise ValueError("unexpected character at {}: {}".format(position, text[position:]))
+            self._tokens.append((match.lastindex, match.group(match.lastindex)))
+            position = match.end()
+        self._position = 0
+
+    def _peek(self):
+        return self._tokens[self._position] if self._position < len(self._tokens) else (None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise ValueError("predicate ends unexpectedly")
+        self._position += 1
+        return token
+
+    def _expect(self, text):
+        if self._next()[1] != text:
+            raise ValueError("{} is expected".format(text))
+
+    def parse(self):
+        predicate = self._disjunction()
+        if self._peek()[0] is not None:
+            raise ValueError("unexpected {}".format(self._peek()[1]))
+        return predicate
+
+    def _disjunction(self):
+        operands = [self._conjunction()]
+        while self._peek()[1] == '||':
+            self._next()
+            operands.append(self._conjunction())
+        return operands[0] if len(operands) == 1 else lambda frame: any(operand(frame) for operand in operands)
+
+    def _conjunction(self):
+        operands = [self._negation()]
+        while self._peek()[1] == '&&':
+            self._next()
+            operands.append(self._negation())
+        return operands[0] if len(operands) == 1 else lambda frame: all(operand(frame) for operand in operands)
+
+    def _names(self):
+        names = [self._identifier()]
+        while self._peek()[1] == '.':
+            self._next()
+            names.append(self._identifier())
+        return names
+
+    def _identifier(self):
+        (kind, text) = self._next()
+        if kind != 4:
+            raise ValueError("name is expected instead of {}".format(text))
+        return text
+
+    def _negation(self):
+        if self._peek()[1] == '!':
+            self._next()
+            operand = self._negation()
+            return lambda frame: not operand(frame)
+        if self._peek()[1] == '(':
+            self._next()
+            predicate = self._disjunction()
+            self._expect(')')
+            return predicate
+        (kind, left) = self._operand()
+        if self._peek()[1] in ('is', '!is'):
+            if kind != 'path':
+                raise ValueError("is checks need a path on the left")
+            negated = self._next()[1] == '!is'
+            class_name = '.'.join(self._names())
+            return self._is_check(left, class_name, negated)
+        if self._peek()[1] not in _PREDICATE_COMPARISONS:
+            if kind != 'path':
+                raise ValueError("comparison is expected after a constant")
+            return lambda frame: bool(left(frame)[1])
+        comparison = self._next()[1]
+        (right_kind, right) = self._operand()
+        return self._comparison(kind, left, comparison, right_kind, right)
+
+    def _operand(self):
+        (kind, text) = self._peek()
+        if kind == 1:
+            self._next()
+            return 'constant', int(text, 0) if 'x' in text or '.' not in text else float(text)
+        if kind == 2:
+            self._next()
+            return 'string', json.loads(text)
+        if text in ('true', 'false'):
+            self._next()
+            return 'constant', text == 'true'
+        if text == NULL:
+            self._next()
+            return 'null', 0
+        return 'path', _predicate_path(self._names())
+
+    @staticmethod
+    def _is_check(path, class_name, negated):
+        def is_check(frame):
+            (runtime_type, address) = path(frame)
+            process = frame.GetThread().GetProcess()
+            error = lldb.SBError()
+            tip = _object_type_info(process, address, class_names(process.GetTarget()), error) \
+                if runtime_type == 1 and address else None
+            if tip is None:
+                return negated
+            class_tip = _runtime_symbol('kclass:' + class_name, tip)
+            if class_tip is None:
+                raise DebuggerException("class {} isn't found".format(class_name))
+            return _is_subclass(process, tip, class_tip) != negated
+        return is_check
+
+    @staticmethod
+    def _comparison(left_kind, left, comparison, right_kind, right):
+        kinds = {left_kind, right_kind}
+        if 'path' not in kinds:
+            raise ValueError("comparison of two constants")
+        compare = _PREDICATE_COMPARISONS[comparison]
+        if 'string' in kinds:
+            if comparison not in ('==', '!='):
+                raise ValueError("strings are compared with == and != only")
+            (path, text) = (left, right) if left_kind == 'path' else (right, left)
+
+            def string_comparison(frame):
+                (runtime_type, address) = path(frame)
+                equals = runtime_type == 1 and _predicate_string_equals(frame.GetThread().GetProcess(), address, text)
+                return equals == (comparison == '==')
+            return string_comparison
+        (left, right) = [operand if kind == 'path' else (lambda constant: lambda frame: (None, constant))(operand)
+                         for (kind, operand) in ((left_kind, left), (right_kind, right))]
+        return lambda frame: compare(left(frame)[1], right(frame)[1])
+
+
+def compile_predicate(text):
+    """Compiles the predicate on Kotlin values of a frame to a function of SBFrame, which reads fields directly from
+    memory with cached type layouts and never evaluates expressions. Raises ValueError for invalid predicates, the
+    function raises DebuggerException when a value can't be read."""
+    return _PredicateParser(text).parse()
+
+
+class _BreakpointPredicate:
+    def __init__(self, text):
+        self.text = text
+        self.function = compile_predicate(text)
+        self.hits = 0
+        self.matches = 0
+        self.seconds = 0.0
+        self.errors = 0
+        self.error = None
+
+
+# Predicates of breakpoints by breakpoint ids, see konan_break_if
+_BREAKPOINT_PREDICATES = {}
+
+
+def breakpoint_predicate(frame, bp_loc, internal_dict):
+    """Breakpoint callback stopping only when the predicate of the breakpoint holds or can't be evaluated."""
+    predicate = _BREAKPOINT_PREDICATES.get(bp_loc.GetBreakpoint().GetID())
+    if predicate is None:
+        return True
+    start = time.monotonic()
+    predicate.hits += 1
+    try:
+        matches = predicate.function(frame)
+    except DebuggerException as e:
+        predicate.errors += 1
+        predicate.error = str(e) or "value can't be read"
+        log(lambda: "konan_break_if: {} can't be evaluated: {}".format(predicate.text, predicate.error))
+        matches = True
+    predicate.matches += bool(matches)
+    predicate.seconds += time.monotonic() - start
+    return bool(matches)
+
+
+def konan_break_if_command(debugger, command, result, internal_dict):
+    """konan_break_if [ID [PREDICATE]]: sets, removes or lists predicates of breakpoints, such as
+    obj.state == 3 && obj.name == "idle" || obj.next is demo.Node, which are evaluated without expressions."""
+    tokens = command.strip().split(None, 1)
+    if not tokens:
+        for (breakpoint_id, predicate) in sorted(_BREAKPOINT_PREDICATES.items()):
+            result.AppendMessage("{}: {} ({} hits, {} matches, {:.1f}us per hit{})".format(
+                breakpoint_id, predicate.text, predicate.hits, predicate.matches,
+                predicate.seconds / max(predicate.hits, 1) * 1e6,
+                ", {} errors, last: {}".format(predicate.errors, predicate.error) if predicate.errors else ""))
+        return
+    target = debugger.GetSelectedTarget()
+    breakpoint = target.FindBreakpointByID(int(tokens[0])) if tokens[0].isdigit() else None
+    if breakpoint is None or not breakpoint.IsValid():
+        result.SetError("usage: konan_break_if [ID [PREDICATE]], there is no breakpoint {}".format(tokens[0]))
+        return
+    if len(tokens) == 1:
+        _BREAKPOINT_PREDICATES.pop(breakpoint.GetID(), None)
+        result.AppendMessage("breakpoint {} stops unconditionally".format(breakpoint.GetID()))
+        return
+    try:
+        predicate = _BreakpointPredicate(tokens[1])
+    except ValueError as e:
+        result.SetError("invalid predicate: {}".format(e))
+        return
+    _BREAKPOINT_PREDICATES[breakpoint.GetID()] = predicate
+    breakpoint.SetScriptCallbackFunction('{}.breakpoint_predicate'.format(__name__))
+    result.AppendMessage("breakpoint {} stops when {}".format(breakpoint.GetID(), predicate.text))
+
+
+_PROFILE_PARSER = _CommandParser(prog='konan_profile',
+                                 description='Profile calls made by Kotlin formatters into the debugger.')
+_PROFILE_PARSER.add_argument('action', choices=('on', 'off', 'clear', 'report', 'export'))
+_PROFILE_PARSER.add_argument('file', nargs='?', default=None, help='file to export the profile to')
+_PROFILE_PARSER.add_argument('-f', '--format', choices=('json', 'chrome'), default='json',
+                             help='format of the exported profile, chrome one can be opened in chrome://tracing')
+_PROFILE_PARSER.add_argument('-t', '--top', type=int, default=10, help='number of the slowest expressions to report')
+_PROFILE_PARSER.add_argument('-s', '--size', type=int, default=None, help='number of the last calls to keep')
+
+_PROFILE_ADDRESS = re.compile('0x[0-9a-fA-F]+')
+
+
+def _percentile(durations, fraction):
+    return durations[min(int(len(durations) * fraction), len(durations) - 1)]
+
+
+def _profile_report(records, top):
+    durations = OrderedDict()
+    expressions = {}
+    bytes_read = 0
+    for (category, detail, _, duration) in records:
+        durations.setdefault(category, []).append(duration)
+        if category == 'evaluate':
+            # Expressions which differ only by addresses are the same for the report.
+            expression = _PROFILE_ADDRESS.sub('0x...', detail)
+            count, total = expressions.get(expression, (0, 0.0))
+            expressions[expression] = (count + 1, total + duration)
+        elif category == 'read_memory':
+            bytes_read += detail
+    lines = ["{:<12} {:>8} {:>10} {:>8} {:>8} {:>8} {:>8}".format(
+        'category', 'count', 'total ms', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms')]
+    for (category, values) in durations.items():
+        values.sort()
+        lines.append("{:<12} {:>8} {:>10.3f} {:>8.3f} {:>8.3f} {:>8.3f} {:>8.3f}".format(
+            category, len(values), 1000 * sum(values), 1000 * _percentile(values, 0.5),
+            1000 * _percentile(values, 0.9), 1000 * _percentile(values, 0.99), 1000 * values[-1]))
+    if bytes_read:
+        lines.append("bytes read: {}".format(bytes_read))
+    if expressions:
+        lines.append("top expressions by total time:")
+        for (expression, (count, total)) in sorted(expressions.items(), key=lambda e: -e[1][1])[:top]:
+            lines.append("{:>10.3f} ms {:>8} x {}".format(1000 * total, count, expression))
+    return lines
+
+
+def _profile_export(records, format):
+    if format == 'chrome':
+        return {'traceEvents': [{'name': category, 'cat': category, 'ph': 'X', 'ts': 1e6 * start,
+                                 'dur': 1e6 * duration, 'pid': os.getpid(), 'tid': 0, 'args': {'detail': detail}}
+                                for (category, detail, start, duration) in records],
+                'displayTimeUnit': 'ms'}
+    return {'records': [{'category': category, 'detail': detail, 'start': start, 'duration': duration}
+                        for (category, detail, start, duration) in records]}
+
+
+def konan_profile_command(debugger, command, result, internal_dict):
+    """konan_profile on|off|clear|report|export FILE: records and reports time spent by Kotlin formatters."""
+    args = _PROFILE_PARSER.parse_command(command, result)
+    if args is None:
+        return
+    if args.size is not None:
+        if args.size < 0:
+            result.SetError("number of the calls to keep can't be negative: {}".format(args.size))
+            return
+        PROFILE.resize(args.size)
+    if args.action in ('on', 'off'):
+        PROFILE.enabled = args.action == 'on'
+        result.AppendMessage("profiling is {}, {} calls recorded".format(args.action, len(PROFILE.records)))
+    elif args.action == 'clear':
+        PROFILE.records.clear()
+    elif not PROFILE.records:
+        result.AppendMessage("nothing is recorded, start profiling with: konan_profile on")
+    elif args.action == 'report':
+        for line in _profile_report(PROFILE.records, args.top):
+            result.AppendMessage(line)
+    elif args.file is None:
+        result.SetError("file to export the profile to isn't specified")
+    else:
+        try:
+            with open(os.path.expanduser(args.file), 'w') as f:
+                json.dump(_profile_export(PROFILE.records, args.format), f)
+        except OSError as e:
+            result.SetError("can't write profile to {}: {}".format(args.file, e))
+            return
+        result.AppendMessage("{} calls are written to {}".format(len(PROFILE.records), args.file))
 
 
 def __lldb_init_module(debugger, _):
     log(lambda: "init start")
     __FACTORY['object'] = lambda x, y, z: KonanObjectSyntheticProvider(x, y, z)
-    __FACTORY['array'] = lambda x, y, z: KonanArraySyntheticProvider(x, z)
+    __FACTORY['array'] = lambda x, y, z: KonanArraySyntheticProvider(x, y, z)
     __FACTORY['string'] = lambda x, y, _: KonanStringSyntheticProvider(x)
+    __FACTORY['array_list'] = lambda x, y, z: KonanArrayListSyntheticProvider(x, y, z)
+    __FACTORY['hash_map'] = lambda x, y, z: KonanHashMapSyntheticProvider(x, y, z)
+    __FACTORY['hash_set'] = lambda x, y, z: KonanHashSetSyntheticProvider(x, y, z)
     debugger.HandleCommand('\
         type summary add \
         --no-value \
@@ -559,4 +3059,13 @@ def __lldb_init_module(debugger, _):
     debugger.HandleCommand('command script add -f {}.type_name_command type_name'.format(__name__))
     debugger.HandleCommand('command script add -f {}.type_by_address_command type_by_address'.format(__name__))
     debugger.HandleCommand('command script add -f {}.symbol_by_name_command symbol_by_name'.format(__name__))
+    debugger.HandleCommand('command script add -f {}.konan_settings_command konan_settings'.format(__name__))
+    debugger.HandleCommand('command script add -f {}.konan_globals_command konan_globals'.format(__name__))
+    debugger.HandleCommand('command script add -f {}.konan_profile_command konan_profile'.format(__name__))
+    debugger.HandleCommand('command script add -f {}.konan_heap_command konan_heap'.format(__name__))
+    debugger.HandleCommand('command script add -f {}.konan_graph_command konan_graph'.format(__name__))
+    debugger.HandleCommand('command script add -f {}.konan_bt_command konan_bt'.format(__name__))
+    debugger.HandleCommand('command script add -f {}.konan_watch_command konan_watch'.format(__name__))
+    debugger.HandleCommand('command script add -f {}.konan_print_batch_command konan_print_batch'.format(__name__))
+    debugger.HandleCommand('command script add -f {}.konan_break_if_command konan_break_if'.format(__name__))
     log(lambda: "init end")
@@ -75,6 +75,7 @@ enum Konan_DebugOperation {
   DO_DebugGetFieldAddress = 10,
   DO_DebugGetFieldName = 11,
   DO_DebugGetTypeName = 12,
+  DO_DebugGetTypeLayout = 13,
 };
 
 template <typename F>
@@ -228,6 +229,43 @@ const char* Konan_DebugGetTypeNameImpl(KRef obj) {
   return CreateCStringFromString(type_info->relativeName_);
 }
 
+// Put layout of the object type to the provided buffer, see Konan_DebugGetTypeLayout.
+int32_t Konan_DebugGetTypeLayoutImpl(KRef obj, char* buffer, int32_t bufferSize) {
+  if (obj == nullptr || buffer == nullptr)
+    return 0;
+
+  auto* typeInfo = obj->type_info();
+  auto* extendedTypeInfo = typeInfo->extendedInfo_;
+
+  if (extendedTypeInfo == nullptr)
+    return 0;
+
+  int32_t fieldsCount = extendedTypeInfo->fieldsCount_;
+  int32_t count = fieldsCount < 0 ? 0 : fieldsCount;
+  int32_t size = sizeof(int32_t) + count * (sizeof(int32_t) + sizeof(uint8_t));
+  for (int32_t index = 0; index < count; index++) {
+    size += strlen(extendedTypeInfo->fieldNames_[index]) + 1;
+  }
+  if (size > bufferSize)
+    return -size;
+
+  char* current = buffer;
+  ::memcpy(current, &fieldsCount, sizeof(int32_t));
+  current += sizeof(int32_t);
+  if (count > 0) {
+    ::memcpy(current, extendedTypeInfo->fieldOffsets_, count * sizeof(int32_t));
+    current += count * sizeof(int32_t);
+    ::memcpy(current, extendedTypeInfo->fieldTypes_, count * sizeof(uint8_t));
+    current += count * sizeof(uint8_t);
+  }
+  for (int32_t index = 0; index < count; index++) {
+    size_t length = strlen(extendedTypeInfo->fieldNames_[index]) + 1;
+    ::memcpy(current, extendedTypeInfo->fieldNames_[index], length);
+    current += length;
+  }
+  return size;
+}
+
 }  // namespace
 
 extern "C" {
@@ -302,6 +340,12 @@ RUNTIME_USED RUNTIME_WEAK const char* Konan_DebugGetTypeName(KRef obj) {
   return impl(obj);
 }
 
+RUNTIME_USED RUNTIME_WEAK int32_t Konan_DebugGetTypeLayout(KRef obj, char* buffer, int32_t bufferSize) {
+  auto* impl = getImpl<int32_t (*)(KRef, char*, int32_t)>(obj, DO_DebugGetTypeLayout);
+  if (impl == nullptr) return 0;
+  return impl(obj, buffer, bufferSize);
+}
+
 const void* Konan_debugOperationsList[] = {
   nullptr,
   reinterpret_cast<const void*>(&Konan_DebugBufferImpl),
@@ -315,7 +359,8 @@ const void* Konan_debugOperationsList[] = {
   reinterpret_cast<const void*>(&Konan_DebugGetFieldTypeImpl),
   reinterpret_cast<const void*>(&Konan_DebugGetFieldAddressImpl),
   reinterpret_cast<const void*>(&Konan_DebugGetFieldNameImpl),
-  reinterpret_cast<const void*>(&Konan_DebugGetTypeNameImpl)
+  reinterpret_cast<const void*>(&Konan_DebugGetTypeNameImpl),
+  reinterpret_cast<const void*>(&Konan_DebugGetTypeLayoutImpl)
 };
 
 }  // extern "C"
@@ -80,6 +80,16 @@ const char* Konan_DebugGetFieldName(KRef obj, int32_t index);
 RUNTIME_USED RUNTIME_WEAK
 const char* Konan_DebugGetTypeName(KRef obj);
 
+// Put layout of the object type to the provided buffer, so that debugger could fetch all the fields
+// with a single call. Layout is written in the target byte order as:
+//   int32_t fieldsCount (negated Konan_RuntimeType of elements for arrays, see ExtendedTypeInfo);
+//   int32_t fieldOffsets[fieldsCount];
+//   uint8_t fieldTypes[fieldsCount];
+//   fieldsCount zero-terminated field names.
+// Returns number of bytes written, 0 if layout is unknown, or negated required size if buffer is too small.
+RUNTIME_USED RUNTIME_WEAK
+int32_t Konan_DebugGetTypeLayout(KRef obj, char* buffer, int32_t bufferSize);
+
 /**
  * Given an object finds debugger interface operation suitable for manipulation with this object.
  * Important for cases where multiple K/N runtimes coexist in the same address space and debugger
@@ -4,11 +4,13 @@
 
 import argparse
 import hashlib
+import json
 import os
 import shlex
 import shutil
 import subprocess
 import sys
+import time
 import urllib.request
 from pathlib import Path
 from typing import List
@@ -19,6 +21,7 @@ isysroot = None
 ninja = 'ninja'
 cmake = 'cmake'
 git = 'git'
+compiler_cache = None
 
 
 def absolute_path(path):
@@ -171,6 +174,10 @@ def construct_cmake_flags(
         cmake_args.append('-DCMAKE_MODULE_LINKER_FLAGS=' + ' '.join(linker_flags))
         cmake_args.append('-DCMAKE_SHARED_LINKER_FLAGS=' + ' '.join(linker_flags))
 
+    if compiler_cache is not None:
+        cmake_args.append('-DCMAKE_C_COMPILER_LAUNCHER=' + compiler_cache)
+        cmake_args.append('-DCMAKE_CXX_COMPILER_LAUNCHER=' + compiler_cache)
+
     if host_is_windows():
         # Use MT to make distribution self-contained
         # TODO: Consider -DCMAKE_INSTALL_UCRT_LIBRARIES=ON as an alternative
@@ -229,6 +236,190 @@ def llvm_build_commands(
     return [cmake_command, ninja_command]
 
 
+def command_output(command: List[str], cwd=None, binary=False):
+    """
+    Output of the command, bytes if binary is set, or None if it can't be run, fails or its output isn't text.
+    """
+    try:
+        return subprocess.run(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=not binary, check=True).stdout
+    except (OSError, subprocess.CalledProcessError, UnicodeDecodeError):
+        return None
+
+
+def llvm_source_revision(llvm_src) -> str:
+    """
+    Identify LLVM sources by the tree of their checkout and, if the checkout is modified, by the diff against it
+    and the contents of untracked files. The diff and file names are hashed as bytes, as sources aren't all UTF-8.
+    Returns None if sources are not a git checkout or untracked files can't be read.
+    """
+    tree = command_output([git, "rev-parse", "HEAD^{tree}"], cwd=llvm_src)
+    if tree is None:
+        return None
+    changes = hashlib.sha256(command_output([git, "diff", "--binary", "HEAD"], cwd=llvm_src, binary=True) or b"")
+    untracked = command_output([git, "ls-files", "-z", "--others", "--exclude-standard"], cwd=llvm_src,
+                               binary=True) or b""
+    for name in sorted(name for name in untracked.split(b'\0') if name):
+        changes.update(name + b'\0')
+        try:
+            with open(os.path.join(os.fsencode(llvm_src), name), 'rb') as file:
+                changes.update(file.read())
+        except OSError:
+            return None
+    return tree.strip() + changes.hexdigest()
+
+
+def host_toolchain_description(bootstrap_path) -> str:
+    """
+    Describe the toolchain a stage is built with: the previous stage, the existing toolchain
+    or the host compiler, along with versions of the build tools.
+    """
+    if bootstrap_path is not None:
+        compiler = f'{bootstrap_path}/bin/clang'
+        compiler_version = command_output([compiler, "--version"])
+    elif host_is_windows():
+        compiler, compiler_version = vsdevcmd, None
+    else:
+        compiler = os.environ.get("CXX", "c++")
+        compiler_version = command_output([compiler, "--version"])
+    description = [compiler, compiler_version or "", isysroot or "",
+                   command_output([cmake, "--version"]) or "", command_output([ninja, "--version"]) or ""]
+    description += [f'{name}={os.environ.get(name, "")}' for name in ["CC", "CXX", "CFLAGS", "CXXFLAGS", "LDFLAGS"]]
+    return '\n'.join(description)
+
+
+def stage_cache_key(source_revision, cmake_flags, toolchain, stage, bootstrap_key) -> str:
+    """
+    Key of the stage's install tree in the stage cache. Stages built with a previous stage
+    depend on its key instead of its location.
+    """
+    # Stages built with and without the compiler cache are the same.
+    cmake_flags = [flag for flag in cmake_flags
+                   if not flag.startswith(('-DCMAKE_C_COMPILER_LAUNCHER=', '-DCMAKE_CXX_COMPILER_LAUNCHER='))]
+    key = hashlib.sha256()
+    for part in [source_revision, toolchain, str(stage), bootstrap_key or ""] + cmake_flags:
+        key.update(part.encode())
+        key.update(b'\0')
+    return key.hexdigest()
+
+
+def directory_size(path) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            file = os.path.join(root, name)
+            if not os.path.islink(file):
+                size += os.path.getsize(file)
+    return size
+
+
+def restore_cached_stage(cache_path: Path, key, install_path) -> bool:
+    """
+    Copy the cached install tree of the stage to install_path.
+    Returns False if there is no such stage in the cache.
+    """
+    cached = cache_path / key
+    if not cached.is_dir():
+        return False
+    print(f"Restoring stage from cache {cached}")
+    if os.path.exists(install_path):
+        shutil.rmtree(install_path)
+    shutil.copytree(str(cached), install_path, symlinks=True)
+    # Recently used stages are pruned last.
+    os.utime(str(cached))
+    return True
+
+
+def save_stage_to_cache(cache_path: Path, key, install_path):
+    """
+    Copy the install tree of the stage to the cache, atomically replacing the existing entry.
+    """
+    cached = cache_path / key
+    if cached.is_dir():
+        return
+    print(f"Saving stage to cache {cached}")
+    os.makedirs(str(cache_path), exist_ok=True)
+    temporary = cache_path / f"{key}.{os.getpid()}.tmp"
+    if temporary.exists():
+        shutil.rmtree(str(temporary))
+    shutil.copytree(install_path, str(temporary), symlinks=True)
+    os.replace(str(temporary), str(cached))
+
+
+def prune_stage_cache(cache_path: Path, max_size, max_age):
+    """
+    Remove cached stages which were not used for max_age seconds,
+    then least recently used ones until the cache takes at most max_size bytes.
+    """
+    if not cache_path.is_dir():
+        return
+    now = time.time()
+    entries = []
+    for entry in cache_path.iterdir():
+        if not entry.is_dir() or entry.name.endswith(".tmp"):
+            continue
+        last_used = entry.stat().st_mtime
+        if now - last_used > max_age:
+            print(f"Removing stale cached stage {entry}")
+            shutil.rmtree(str(entry))
+        else:
+            entries.append((last_used, directory_size(str(entry)), entry))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total_size <= max_size:
+            break
+        print(f"Removing cached stage {entry} to fit the cache into {max_size} bytes")
+        shutil.rmtree(str(entry))
+        total_size -= size
+
+
+def compiler_cache_is_sccache() -> bool:
+    return 'sccache' in os.path.basename(compiler_cache).lower()
+
+
+def setup_compiler_cache(base_dir):
+    """
+    Configure the compiler cache so that hits don't depend on where sources and build directories are
+    and on timestamps of compilers, as the bootstrap compiler is rebuilt or restored by every build.
+    sccache hashes compilers by content and has no path normalization, ccache is configured for both.
+    """
+    if compiler_cache_is_sccache():
+        return
+    os.environ.setdefault("CCACHE_BASEDIR", base_dir)
+    os.environ.setdefault("CCACHE_NOHASHDIR", "true")
+    os.environ.setdefault("CCACHE_COMPILERCHECK", "content")
+
+
+def compiler_cache_statistics():
+    """
+    Total numbers of hits and misses of the compiler cache, or None if they are not available.
+    """
+    try:
+        if compiler_cache_is_sccache():
+            output = command_output([compiler_cache, "--show-stats", "--stats-format=json"])
+            if output is None:
+                return None
+            stats = json.loads(output)["stats"]
+            return sum(stats["cache_hits"]["counts"].values()), sum(stats["cache_misses"]["counts"].values())
+        output = command_output([compiler_cache, "--print-stats"])
+        if output is None:
+            return None
+        values = dict(line.split('\t', 1) for line in output.splitlines() if '\t' in line)
+        return int(values["direct_cache_hit"]) + int(values["preprocessed_cache_hit"]), int(values["cache_miss"])
+    except (TypeError, ValueError, KeyError):
+        return None
+
+
+def print_compiler_cache_statistics(statistics):
+    print("Compiler cache statistics:")
+    for stage, hits, misses in statistics:
+        if hits is None:
+            print(f"  stage {stage}: not available")
+        else:
+            rate = 100 * hits / (hits + misses) if hits + misses > 0 else 0
+            print(f"  stage {stage}: {hits} hits, {misses} misses ({rate:.1f}% hit rate)")
+
+
 def clone_llvm_repository(repo, branch, llvm_repo_destination):
     """
     Downloads a single commit from the given repository.
@@ -277,11 +468,19 @@ def build_parser() -> argparse.ArgumentParser:
                         help="Override path to cmake")
     parser.add_argument("--git", type=str, default=None,
                         help="Override path to git")
+    parser.add_argument("--compiler-cache", type=str, default=None,
+                        help="ccache or sccache (or path to one of them) to launch compilers of every stage with")
     parser.add_argument("--isysroot", type=str, default=None,
                         help="(macOS only) Override path to macOS SDK")
     # Misc.
     parser.add_argument("--save-temporary-files", type=bool, default=False,
                         help="Should intermediate build results be saved?")
+    parser.add_argument("--stage-cache", type=str, default=None,
+                        help="Directory to cache install trees of stages in, so that unchanged stages are not rebuilt")
+    parser.add_argument("--stage-cache-max-size", type=float, default=50,
+                        help="Maximal size of the stage cache in gigabytes")
+    parser.add_argument("--stage-cache-max-age", type=float, default=30,
+                        help="Days after which unused stages are removed from the stage cache")
     return parser
 
 
@@ -294,6 +493,15 @@ def build_distribution(args):
     num_stages = args.num_stages
     bootstrap_path = args.stage0
     intermediate_build_results = []
+    cache_path = Path(args.stage_cache).absolute() if args.stage_cache is not None else None
+    source_revision = llvm_source_revision(args.llvm_src) if cache_path is not None else None
+    if cache_path is not None and source_revision is None:
+        print("LLVM sources are not a git checkout or can't be read, stage cache is disabled")
+        cache_path = None
+    stage_key = None
+    cache_statistics = []
+    if compiler_cache is not None:
+        setup_compiler_cache(os.path.commonpath([str(current_dir), absolute_path(args.llvm_src)]))
     # Most likely, num_stages will be 1 or 2.
     # 2 means bootstrap build: we build LLVM distribution (stage 1)
     # that then compiles sources once again (stage 2). Thus, resulting
@@ -323,6 +531,17 @@ def build_distribution(args):
         runtimes = None
         ninja_target = "install"
 
+        if cache_path is not None:
+            # Stages are referred to by placeholders instead of their locations, so the key doesn't depend
+            # on the working directory: the previous stage is identified by its key.
+            cmake_flags = construct_cmake_flags("<bootstrap>" if bootstrap_path is not None else None, "<install>",
+                                                projects, runtimes, targets)
+            toolchain = host_toolchain_description(absolute_path(bootstrap_path)) if stage_key is None else ""
+            stage_key = stage_cache_key(source_revision, cmake_flags, toolchain, stage, stage_key)
+            if restore_cached_stage(cache_path, stage_key, absolute_path(install_path)):
+                bootstrap_path = install_path
+                continue
+
         build_dir = force_create_directory(current_dir, f"llvm-stage-{stage}-build")
         intermediate_build_results.append(build_dir)
         commands = llvm_build_commands(
@@ -335,12 +554,28 @@ def build_distribution(args):
             runtimes=runtimes
         )
 
+        statistics_before = compiler_cache_statistics() if compiler_cache is not None else None
         os.chdir(build_dir)
         for command in commands:
             run_command(command)
         os.chdir(current_dir)
+        if compiler_cache is not None:
+            statistics_after = compiler_cache_statistics()
+            if statistics_before is None or statistics_after is None:
+                cache_statistics.append((stage, None, None))
+            else:
+                cache_statistics.append((stage, statistics_after[0] - statistics_before[0],
+                                         statistics_after[1] - statistics_before[1]))
+        if cache_path is not None:
+            save_stage_to_cache(cache_path, stage_key, absolute_path(install_path))
         bootstrap_path = install_path
 
+    if cache_statistics:
+        print_compiler_cache_statistics(cache_statistics)
+
+    if cache_path is not None:
+        prune_stage_cache(cache_path, int(args.stage_cache_max_size * 1024 ** 3), args.stage_cache_max_age * 24 * 3600)
+
     if not args.save_temporary_files:
         for dir in intermediate_build_results:
             print(f"Removing temporary directory: {dir}")
@@ -369,7 +604,7 @@ def setup_environment(args):
     """
     Setup globals that store information about script execution environment.
     """
-    global vsdevcmd, ninja, cmake, git, isysroot
+    global vsdevcmd, ninja, cmake, git, isysroot, compiler_cache
     # TODO: We probably can download some of these binaries ourselves.
     if args.ninja:
         ninja = args.ninja
@@ -383,6 +618,12 @@ def setup_environment(args):
         git = args.git
     elif shutil.which('git') is None:
         sys.exit("'git' is not found. Install or provide via --git argument.")
+    if args.compiler_cache:
+        compiler_cache = shutil.which(args.compiler_cache)
+        if compiler_cache is None:
+            sys.exit(f"'{args.compiler_cache}' is not found. Install it or provide path to it via --compiler-cache.")
+        # CMake is not tolerant to backslashes in path.
+        compiler_cache = compiler_cache.replace('\\', '/')
     if host_is_windows():
         if args.vsdevcmd:
             vsdevcmd = args.vsdevcmd